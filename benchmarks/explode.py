@@ -0,0 +1,309 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmark end-to-end git-explode runs on synthetic repositories.
+
+Each repository has a base commit containing a number of files, and on
+top of it a linear series of commits.  Every commit changes a few
+"slots" (lines spaced far enough apart that their diff contexts never
+overlap); changing a slot which an earlier commit changed makes the new
+commit depend on that one, so the fan-in and fan-out of the dependency
+graph can be controlled.  Changing a slot nobody touched before adds no
+dependency.  Since slots never overlap, all the merges git-explode
+needs are clean.
+
+For each repository size and set of git-explode options, a fresh clone
+is exploded in a subprocess, and the wall time, the phase timings from
+--stats-json, and the peak RSS of the subprocess are recorded.  The
+results are written as JSON which can be compared against a previous
+run with --compare.  Everything runs locally; Linux is needed for the
+peak memory measurement.
+
+Usage: python benchmarks/explode.py [options] [--compare OLD.json]
+"""
+
+from __future__ import print_function, absolute_import, division
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+
+import git_explode
+
+# Distance between slots, which must be bigger than twice the number
+# of diff context lines git-explode uses.
+SLOT_SPACING = 10
+
+
+def generate(path, commits, files, file_lines, fan_in, fan_out,
+             independent, seed):
+    """Create a synthetic repository at path using git fast-import.
+
+    :return: the number of dependency edges between the commits
+    """
+    rng = random.Random(seed)
+    slots_per_file = max(1, file_lines // SLOT_SPACING)
+    contents = [['line %d of file %d\n' % (i, f)
+                 for i in range(file_lines)] for f in range(files)]
+    slots = [(f, s * SLOT_SPACING + SLOT_SPACING // 2)
+             for f in range(files) for s in range(slots_per_file)]
+    rng.shuffle(slots)
+    fresh = list(slots)
+    # Map each slot changed so far to the commit which last changed it,
+    # and each commit to the number of commits depending on it.
+    last = OrderedDict()
+    dependents = {}
+    edges = 0
+
+    subprocess.check_call(['git', 'init', '-q', path])
+    for key, value in (('user.name', 'Benchmark'),
+                       ('user.email', 'benchmark@example.com')):
+        subprocess.check_call(['git', '-C', path, 'config', key, value])
+    fast_import = subprocess.Popen(['git', '-C', path, 'fast-import',
+                                    '--quiet'],
+                                   stdin=subprocess.PIPE)
+    out = fast_import.stdin
+
+    def write(text):
+        out.write(text.encode('utf-8'))
+
+    def commit(ref, mark, message, changed, parent=None):
+        write('commit %s\nmark :%d\n' % (ref, mark))
+        write('committer Benchmark <benchmark@example.com> %d +0000\n' %
+              (1500000000 + mark))
+        data = message.encode('utf-8')
+        write('data %d\n' % len(data))
+        out.write(data + b'\n')
+        if parent is not None:
+            write('from :%d\n' % parent)
+        for f in sorted(changed):
+            data = ''.join(contents[f]).encode('utf-8')
+            write('M 100644 inline file%03d.txt\ndata %d\n' % (f, len(data)))
+            out.write(data + b'\n')
+
+    commit('refs/tags/base', 1, 'base', range(files))
+    for c in range(commits):
+        mark = c + 2
+        # Pick which slots to change: a fresh one unless this commit is
+        # going to have dependencies, and one slot per dependency.
+        candidates = [slot for slot, owner in last.items()
+                      if dependents[owner] < fan_out]
+        wanted = 0
+        if candidates and rng.random() >= independent:
+            wanted = rng.randint(1, min(fan_in, len(candidates)))
+        owners = set()
+        chosen = []
+        for slot in rng.sample(candidates, len(candidates)):
+            if len(chosen) == wanted:
+                break
+            if last[slot] not in owners:
+                owners.add(last[slot])
+                chosen.append(slot)
+        if not chosen:
+            if fresh:
+                chosen.append(fresh.pop())
+            else:
+                chosen.append(rng.choice(list(last)))
+                owners.add(last[chosen[0]])
+
+        for owner in owners:
+            dependents[owner] += 1
+        edges += len(owners)
+        dependents[mark] = 0
+        for slot in chosen:
+            f, line = slot
+            contents[f][line] = 'line %d of file %d changed by commit %d\n' \
+                % (line, f, c)
+            last.pop(slot, None)
+            last[slot] = mark
+        commit('refs/heads/master', mark, 'commit %d' % c,
+               set(f for f, line in chosen), parent=mark - 1)
+
+    out.close()
+    if fast_import.wait() != 0:
+        raise subprocess.CalledProcessError(fast_import.returncode,
+                                            'git fast-import')
+    subprocess.check_call(['git', '-C', path, 'checkout', '-q', 'master'])
+    return edges
+
+
+def explode(source, workdir, options):
+    """Explode base..master in a fresh clone of source.
+
+    :return: dict of measurements
+    """
+    clone = os.path.join(workdir, 'clone')
+    shutil.rmtree(clone, ignore_errors=True)
+    subprocess.check_call(['git', 'clone', '-q', '--shared', source, clone])
+    for key in ('user.name', 'user.email'):
+        value = subprocess.check_output(
+            ['git', '-C', source, 'config', key]).decode('utf-8').strip()
+        subprocess.check_call(['git', '-C', clone, 'config', key, value])
+    subprocess.check_call(['git', '-C', clone, 'fetch', '-q', 'origin',
+                           'refs/tags/base:refs/tags/base'])
+
+    stats_file = os.path.join(workdir, 'stats.json')
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [os.path.dirname(os.path.dirname(os.path.abspath(
+            git_explode.__file__)))] +
+        [p for p in [env.get('PYTHONPATH')] if p])
+    cmd = [sys.executable, '-m', 'git_explode.cli',
+           '--stats-json', stats_file] + options + ['base', 'master']
+    with open(os.devnull, 'w') as devnull:
+        start = time.time()
+        proc = subprocess.Popen(cmd, cwd=clone, env=env, stdout=devnull)
+        pid, status, rusage = os.wait4(proc.pid, 0)
+        elapsed = time.time() - start
+    if status != 0:
+        raise RuntimeError("%s failed in %s" % (' '.join(cmd), clone))
+
+    with open(stats_file) as f:
+        stats = json.load(f)
+    branches = subprocess.check_output(
+        ['git', '-C', clone, 'for-each-ref', 'refs/heads/topic*'])
+    return OrderedDict([
+        ('seconds', elapsed),
+        ('phases', stats['phases']),
+        ('git_spawns', stats['git']['spawns']),
+        ('topics', len(branches.splitlines())),
+        # ru_maxrss is in kilobytes on Linux
+        ('peak_rss_kb', rusage.ru_maxrss),
+    ])
+
+
+def run(args):
+    results = []
+    workdir = tempfile.mkdtemp(prefix='git-explode-bench-')
+    try:
+        for commits in args.commits:
+            shape = OrderedDict([
+                ('commits', commits),
+                ('files', args.files),
+                ('file_lines', args.file_lines),
+                ('fan_in', args.fan_in),
+                ('fan_out', args.fan_out),
+                ('independent', args.independent),
+                ('seed', args.seed),
+            ])
+            source = os.path.join(workdir, 'repo-%d' % commits)
+            edges = generate(source, **shape)
+            for options in args.options:
+                options = options.split()
+                name = 'commits=%d %s' % (commits, ' '.join(options))
+                runs = [explode(source, workdir, options)
+                        for i in range(args.repeat)]
+                best = min(runs, key=lambda r: r['seconds'])
+                result = OrderedDict([
+                    ('name', name.strip()),
+                    ('shape', shape),
+                    ('edges', edges),
+                    ('options', options),
+                    ('commits_per_second', commits / best['seconds']),
+                ])
+                result.update(best)
+                result['peak_rss_kb'] = max(r['peak_rss_kb'] for r in runs)
+                results.append(result)
+                print("%-40s %8.3fs %8.1f commits/s %8d KB" %
+                      (result['name'], result['seconds'],
+                       result['commits_per_second'], result['peak_rss_kb']),
+                      file=sys.stderr)
+    finally:
+        if args.keep:
+            print("Repositories kept in %s" % workdir, file=sys.stderr)
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    git_version = subprocess.check_output(['git', '--version'])
+    return OrderedDict([
+        ('format', 1),
+        ('git_explode', git_explode.__version__),
+        ('python', platform.python_version()),
+        ('git', git_version.decode('utf-8').strip()),
+        ('results', results),
+    ])
+
+
+def compare(old, new, threshold):
+    """Print how each result compares to the same one in old, and
+    return the number which got slower by more than threshold.
+    """
+    previous = dict((r['name'], r) for r in old['results'])
+    regressions = 0
+    print("%-40s %10s %10s %8s %8s" %
+          ('benchmark', 'old (s)', 'new (s)', 'time', 'memory'))
+    for result in new['results']:
+        before = previous.get(result['name'])
+        if before is None:
+            continue
+        time_ratio = result['seconds'] / before['seconds']
+        memory_ratio = result['peak_rss_kb'] / before['peak_rss_kb']
+        flag = ''
+        if time_ratio > threshold or memory_ratio > threshold:
+            flag = '  REGRESSION'
+            regressions += 1
+        print("%-40s %10.3f %10.3f %7.2fx %7.2fx%s" %
+              (result['name'], before['seconds'], result['seconds'],
+               time_ratio, memory_ratio, flag))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--commits', type=int, nargs='+',
+                        default=[50, 200],
+                        help='sizes of repositories to generate')
+    parser.add_argument('--files', type=int, default=20)
+    parser.add_argument('--file-lines', type=int, default=200)
+    parser.add_argument('--fan-in', type=int, default=2,
+                        help='maximum dependencies per commit')
+    parser.add_argument('--fan-out', type=int, default=3,
+                        help='maximum dependents per commit')
+    parser.add_argument('--independent', type=float, default=0.3,
+                        help='probability of a commit with no dependencies')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--options', action='append',
+                        help='git-explode options to benchmark, e.g. '
+                        '--options="-m -j 4"; may be repeated '
+                        '[default: "" and "-m"]')
+    parser.add_argument('--repeat', type=int, default=1,
+                        help='runs per benchmark; the fastest is kept')
+    parser.add_argument('--output', metavar='FILE',
+                        help='write JSON results to FILE [stdout]')
+    parser.add_argument('--compare', metavar='FILE',
+                        help='compare with results from a previous run')
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help='exit non-zero if any benchmark gets this '
+                        'many times slower or bigger than in --compare')
+    parser.add_argument('--keep', action='store_true',
+                        help="don't delete the generated repositories")
+    args = parser.parse_args()
+    if args.options is None:
+        args.options = ['', '-m']
+
+    results = run(args)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+            f.write('\n')
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        with open(args.compare) as f:
+            old = json.load(f)
+        if compare(old, results, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
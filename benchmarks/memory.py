@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Measure the memory held by the dependency tree and topic registry on
+synthetic graphs, without touching git at all.
+
+For each graph size, this compares the original representation (nested
+dicts of SHA1s with "path:line" strings as causes, and topics keyed by
+space-joined strings of SHA1s) with the ExplodeDependencyListener's
+interned integer IDs and a TopicManager keyed by frozensets of them.
+Python 3 is needed for tracemalloc.
+
+Usage: python benchmarks/memory.py [--max-deps N] [SIZE...]
+"""
+
+from __future__ import print_function, absolute_import, division
+
+import argparse
+import logging
+import tracemalloc
+
+from git_explode.listener import ExplodeDependencyListener
+from git_explode.topics import TopicManager
+
+from traversal import synthetic_graph
+
+
+def synthetic_edges(size, max_deps):
+    """Return the list of SHA1s and list of (dependent, dependency,
+    cause) edges of a synthetic graph, with the SHA1s as integers and
+    the causes as (path, line) so that each representation has to build
+    its own strings, just as git-deps does for every edge it reports.
+    """
+    deps_from, deps_on = synthetic_graph(size, max_deps)
+    edges = [(int(sha, 16), int(dep, 16), tuple(cause.split(':')))
+             for sha, deps in deps_from.items()
+             for dep, cause in deps.items()]
+    return [int(sha, 16) for sha in deps_from], edges
+
+
+def hex_sha(sha):
+    return '%040x' % sha
+
+
+def old_representation(shas, edges):
+    deps_from = dict((hex_sha(sha), {}) for sha in shas)
+    deps_on = dict((hex_sha(sha), {}) for sha in shas)
+    for sha, dep, cause in edges:
+        deps_from[hex_sha(sha)][hex_sha(dep)] = '%s:%s' % cause
+        deps_on[hex_sha(dep)][hex_sha(sha)] = '%s:%s' % cause
+
+    topics = {}
+    commits = {}
+    for i, (sha, deps) in enumerate(deps_from.items()):
+        name = ' '.join(sorted(list(deps) + [sha]))
+        topics[name] = 'topic%d' % i
+        commits['topic%d' % i] = name
+    return deps_from, deps_on, topics, commits
+
+
+def new_representation(shas, edges):
+    listener = ExplodeDependencyListener({})
+    for sha in shas:
+        listener.add_commit(hex_sha(sha))
+    for sha, dep, cause in edges:
+        listener.add_dependency(hex_sha(sha), hex_sha(dep), '%s:%s' % cause)
+
+    topic_mgr = TopicManager('topic%d', logging.getLogger('memory'))
+    topic_mgr.topics = {}
+    topic_mgr.commits = {}
+    for i in range(len(listener.shas)):
+        topic_mgr.assign('topic%d' % i, i, *listener.dependency_ids(i))
+    return listener, topic_mgr
+
+
+def measure(fn, *args):
+    """Return the number of bytes still allocated by the result of fn,
+    and the peak allocated while building it.
+    """
+    tracemalloc.start()
+    result = fn(*args)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return current, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--max-deps', type=int, default=4)
+    parser.add_argument('sizes', type=int, nargs='*',
+                        default=[1000, 10000, 100000])
+    args = parser.parse_args()
+
+    print("%8s %8s %12s %12s %12s %12s" %
+          ('nodes', 'edges', 'old (KB)', 'new (KB)',
+           'old peak', 'new peak'))
+    for size in args.sizes:
+        shas, edges = synthetic_edges(size, args.max_deps)
+        old, old_peak = measure(old_representation, shas, edges)
+        new, new_peak = measure(new_representation, shas, edges)
+        print("%8d %8d %12d %12d %12d %12d" %
+              (size, len(edges), old // 1024, new // 1024,
+               old_peak // 1024, new_peak // 1024))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmark the traversal of the dependency tree in GitExploder.explode()
+on synthetic graphs, without touching git at all.
+
+For each graph size, this times building the DependencyGraph of an
+ExplodeDependencyListener and walking it, and (for sizes where it
+finishes in reasonable time) the original list-based traversal which
+deep-copied the dependency dicts, checking that both produce the same
+order.
+
+Usage: python benchmarks/traversal.py [--max-deps N] [--old-limit N] [SIZE...]
+"""
+
+from __future__ import print_function, absolute_import, division
+
+import argparse
+import copy
+import random
+import time
+
+from git_explode.listener import ExplodeDependencyListener
+
+
+def synthetic_graph(size, max_deps, seed=0):
+    """Return (deps_from, deps_on) for a random graph where each commit
+    depends on up to max_deps earlier commits, favouring recent ones.
+    """
+    rng = random.Random(seed)
+    shas = ['%040x' % rng.getrandbits(160) for i in range(size)]
+    deps_from = dict((sha, {}) for sha in shas)
+    deps_on = dict((sha, {}) for sha in shas)
+    for i, sha in enumerate(shas):
+        if i == 0:
+            continue
+        for j in range(rng.randint(0, max_deps)):
+            dep = shas[max(0, i - 1 - int(rng.expovariate(0.05)))]
+            cause = 'file%d:%d' % (rng.randint(0, 100), rng.randint(1, 500))
+            deps_from[sha][dep] = cause
+            deps_on[dep][sha] = cause
+    return deps_from, deps_on
+
+
+def old_traversal(deps_from, deps_on):
+    """The original algorithm, kept here for comparison."""
+    todo = [sha for sha, deps in deps_from.items() if len(deps) == 0]
+    unexploded_deps_from = copy.deepcopy(deps_from)
+    order = []
+    while todo:
+        sha = todo.pop(0)
+        order.append(sha)
+        for dependent in deps_on[sha]:
+            del unexploded_deps_from[dependent][sha]
+            if not unexploded_deps_from[dependent]:
+                todo.insert(0, dependent)
+    return order
+
+
+def make_listener(deps_from, deps_on):
+    """Return an ExplodeDependencyListener holding the given graph,
+    with each commit's dependents in the same order as in deps_on.
+    """
+    listener = ExplodeDependencyListener({})
+    for sha in deps_from:
+        listener.add_commit(sha)
+    for dep, dependents in deps_on.items():
+        for sha, cause in dependents.items():
+            listener.add_dependency(sha, dep, cause)
+    return listener
+
+
+def new_traversal(listener):
+    return list(listener.graph().traverse())
+
+
+def timed(fn, *args):
+    start = time.time()
+    result = fn(*args)
+    return result, time.time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--max-deps', type=int, default=4)
+    parser.add_argument('--old-limit', type=int, default=20000,
+                        help='largest size to run the old traversal on')
+    parser.add_argument('sizes', type=int, nargs='*',
+                        default=[1000, 3000, 10000, 30000, 100000])
+    args = parser.parse_args()
+
+    print("%8s %8s %10s %10s" % ('nodes', 'edges', 'new (s)', 'old (s)'))
+    for size in args.sizes:
+        deps_from, deps_on = synthetic_graph(size, args.max_deps)
+        edges = sum(len(deps) for deps in deps_from.values())
+        listener = make_listener(deps_from, deps_on)
+        new, new_time = timed(new_traversal, listener)
+        assert len(new) == size
+        old_time = '-'
+        if size <= args.old_limit:
+            old, elapsed = timed(old_traversal, deps_from, deps_on)
+            assert old == new, "traversal order changed"
+            old_time = '%10.3f' % elapsed
+        print("%8d %8d %10.3f %10s" % (size, edges, new_time, old_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,39 @@
-import pkg_resources
+import sys
 
-try:
-    __version__ = pkg_resources.get_distribution(__name__).version
-except pkg_resources.DistributionNotFound:
-    __version__ = 'unknown'
+
+def _version():
+    # importlib.metadata is much quicker to import than pkg_resources,
+    # which matters since git-explode gets run from hooks and scripts.
+    try:
+        from importlib.metadata import PackageNotFoundError, version
+    except ImportError:
+        try:
+            # Backport for Python < 3.8
+            from importlib_metadata import PackageNotFoundError, version
+        except ImportError:
+            version = None
+
+    if version is not None:
+        try:
+            return version('git-explode')
+        except PackageNotFoundError:
+            return 'unknown'
+
+    import pkg_resources
+    try:
+        return pkg_resources.get_distribution(__name__).version
+    except pkg_resources.DistributionNotFound:
+        return 'unknown'
+
+
+if sys.version_info >= (3, 7):
+    def __getattr__(name):
+        # Even importlib.metadata takes longer to import than the rest
+        # of the CLI, so only look the version up when it's asked for.
+        if name == '__version__':
+            globals()['__version__'] = _version()
+            return globals()['__version__']
+        raise AttributeError("module %r has no attribute %r" %
+                             (__name__, name))
+else:
+    __version__ = _version()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Batch mode: explode several ranges, e.g. every open feature branch, in
+one run.
+
+Ranges which share commits, such as feature branches stacked on top
+of each other, would otherwise each detect the dependencies of those
+commits and cherry-pick them all over again.  Here the dependencies
+of every commit in the union of the ranges are detected once before
+anything is exploded, and each cherry-pick and merge of the same
+commits onto the same place is only done once, with the topic
+branches of later ranges reusing the result.
+"""
+
+from __future__ import print_function, absolute_import
+
+import sys
+
+from git_deps.utils import abort
+from git_explode.exploder import GitExploder, get_logger
+from git_explode.gitutils import GitUtils as GitExplodeUtils
+from git_explode.stats import ExplodeStats
+
+
+def read_ranges(path, prefix=''):
+    """Read the ranges to explode from the file at path, or from
+    stdin if path is '-'.
+    """
+    if path == '-':
+        return parse_ranges(sys.stdin, '<stdin>', prefix)
+    try:
+        with open(path) as f:
+            return parse_ranges(f, path, prefix)
+    except IOError as e:
+        abort("fatal: can't read ranges from %s: %s" % (path, e.strerror))
+
+
+def parse_ranges(lines, name, prefix=''):
+    """Parse one range per line, as "BASE HEAD [PREFIX]".  Blank lines
+    and lines starting with '#' are ignored.  The topic branches of
+    each range are prefixed with PREFIX, or if there isn't one, with
+    HEAD followed by a dash, so that different ranges never create the
+    same branches.  Prefixes which wouldn't make valid branch names,
+    e.g. from a HEAD like master~3, are rejected before anything is
+    exploded.
+
+    :param lines: iterable of lines
+    :param name: name of where the lines came from, for errors
+    :param prefix: prefix given for the whole batch
+    :return: list of (base, head, prefix) tuples
+    """
+    ranges = []
+    prefixes = {}
+    for number, line in enumerate(lines, 1):
+        fields = line.split()
+        if not fields or fields[0].startswith('#'):
+            continue
+        if len(fields) not in (2, 3):
+            abort("fatal: %s:%d: expected BASE HEAD [PREFIX]" %
+                  (name, number))
+        hint = ''
+        if len(fields) == 2:
+            fields.append(fields[1] + '-')
+            hint = '; give a PREFIX'
+        base, head, range_prefix = fields
+        if range_prefix in prefixes:
+            abort("fatal: %s:%d: same topic prefix %s as line %d" %
+                  (name, number, range_prefix, prefixes[range_prefix]))
+        branch = prefix + range_prefix + 'topic1'
+        if not GitExplodeUtils.valid_branch_name(branch):
+            abort("fatal: %s:%d: '%s' is not a valid branch name%s" %
+                  (name, number, branch, hint))
+        prefixes[range_prefix] = number
+        ranges.append((base, head, range_prefix))
+    if not ranges:
+        abort("fatal: no ranges to explode in %s" % name)
+    return ranges
+
+
+class BatchExploder(object):
+    """Explodes several ranges with one GitExploder each, sharing what
+    they have in common.
+
+    The exploders share their stats, merges and cherry-picks, and
+    those for ranges with the same base share the dependencies
+    detected for each commit, which only depend on the commit and the
+    base.  Each range is exploded with its own topic prefix, appended
+    to any given for the whole batch.
+
+    """
+    def __init__(self, repo, ranges, debug, context_lines, prefix='',
+                 **options):
+        """
+        :param ranges: list of (base, head, prefix) tuples
+        :param options: any other keyword arguments for GitExploder
+        """
+        self.logger = get_logger('git-explode', debug)
+        self.stats = ExplodeStats()
+        self.exploders = []
+        # The checkpoints of one range would be no use for continuing
+        # the batch.
+        shared = dict(options, stats=self.stats, picks={}, journal=False)
+        for base, head, range_prefix in ranges:
+            exploder = GitExploder(repo, base, head, debug, context_lines,
+                                   prefix=prefix + range_prefix, **shared)
+            # Only the first exploder reads the merges from any
+            # previous run.
+            shared['merges'] = exploder.merges
+            self.exploders.append(exploder)
+
+    def run(self):
+        listeners = self.get_dependencies()
+        for exploder, listener in zip(self.exploders, listeners):
+            self.logger.debug("Exploding %s..%s" %
+                              (exploder.base, exploder.head))
+            exploder.apply(exploder.plan(listener))
+
+    def get_dependencies(self):
+        """Detect the dependencies of every commit in the union of the
+        ranges, and return a listener holding each range's tree.
+        """
+        # Map each base to the dependencies detected for the commits
+        # of all the ranges with that base so far
+        detected = {}
+        listeners = []
+        for exploder in self.exploders:
+            dependencies = detected.setdefault(exploder.base_commit.hex, {})
+            self.logger.debug("Detecting dependencies in %s..%s, %d commits "
+                              "already done" %
+                              (exploder.base, exploder.head,
+                               len(dependencies)))
+            listeners.append(exploder.get_dependencies(dependencies))
+        return listeners
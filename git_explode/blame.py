@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, absolute_import
+
+import re
+from collections import OrderedDict
+
+import pygit2
+from six.moves import intern
+
+from git_explode.gitutils import GitUtils as GitExplodeUtils
+
+PORCELAIN_LINE = re.compile(r'^([0-9a-f]{40}) (\d+) (\d+)( \d+)?$')
+
+
+class BlameCache(object):
+    """In-process LRU cache of whole-file blames, used to answer the
+    line range blames which dependency detection needs.
+
+    Entries are keyed by (path, revision) where the revision is the
+    last commit in the range at or before the one being blamed which
+    touched that path (or the base if none did), since the blame of a
+    file is the same at every commit until the file next changes.  A
+    cached blame serves every hunk of a commit, not just the first.
+
+    When a path is blamed at a commit which modified it, and the blame
+    at the previous commit which touched it is cached, the new blame
+    is derived from the old one and the commit's diff in the same way
+    git blame would attribute the lines, without running git at all.
+    Commits which add, delete or rename the path fall back to git
+    blame, since git follows renames.
+
+    The cache is bounded by the total number of lines held, evicting
+    the least recently used files first.
+
+    """
+    DEFAULT_MAX_LINES = 1000000
+
+    def __init__(self, index, max_lines=DEFAULT_MAX_LINES):
+        """
+        :param index: PathIndex of the range being exploded
+        :param max_lines: maximum total number of blamed lines to keep
+        """
+        self.index = index
+        self.max_lines = max_lines
+        self.entries = OrderedDict()
+        self.lines = 0
+        self.hits = self.derived = self.misses = 0
+
+    def blame(self, repo, path, rev, start, count):
+        """Return porcelain-style lines "SHA1 ORIG_LINE FINAL_LINE" for
+        the count lines of path at rev starting at line start, with
+        lines from before the range blamed on the base as boundary.
+        """
+        key = (path, self.index.last_touched(path, rev))
+        lines = self.entries.get(key)
+        if lines is not None:
+            self.hits += 1
+            self.entries.pop(key)
+        else:
+            lines = self.derive(repo, *key)
+            if lines is None:
+                self.misses += 1
+                lines = self.run_blame(path, key[1])
+            else:
+                self.derived += 1
+            self.lines += len(lines)
+            self.evict()
+        self.entries[key] = lines
+
+        return '\n'.join('%s %d %d' % (lines[i][0], lines[i][1], i + 1)
+                         for i in range(start - 1, start - 1 + count))
+
+    def derive(self, repo, path, rev):
+        """Work out the blame of path at rev from the cached blame at
+        the previous commit which touched it, or None if that's not
+        possible.
+        """
+        if rev == self.index.base:
+            return self.base_blame(repo, path)
+        if rev not in self.index:
+            return None
+
+        commit = repo[rev]
+        parent = commit.parents[0]
+        previous = self.index.last_touched(path, parent.hex)
+        if previous == self.index.base:
+            old = self.base_blame(repo, path)
+        else:
+            old = self.entries.get((path, previous))
+        if old is None:
+            return None
+
+        diff = repo.diff(parent.tree, commit.tree, context_lines=0,
+                         flags=pygit2.GIT_DIFF_INDENT_HEURISTIC)
+        patches = [patch for patch in diff
+                   if patch.delta.new_file.path == path]
+        if len(patches) != 1 or patches[0].delta.is_binary or \
+           patches[0].delta.status != pygit2.GIT_DELTA_MODIFIED:
+            return None
+
+        rev = intern(str(rev))
+        lines = []
+        old_pos = 0
+        for hunk in patches[0].hunks:
+            # With no context, a pure addition comes after old_start,
+            # whereas anything else replaces the lines from old_start.
+            unchanged = hunk.old_start if hunk.old_lines == 0 \
+                else hunk.old_start - 1
+            lines.extend(old[old_pos:unchanged])
+            old_pos = unchanged + hunk.old_lines
+            if hunk.new_lines and len(lines) != hunk.new_start - 1:
+                return None
+            lines.extend((rev, hunk.new_start + i)
+                         for i in range(hunk.new_lines))
+        lines.extend(old[old_pos:])
+        if len(lines) != self.line_count(commit.tree[path]):
+            return None
+        return lines
+
+    def base_blame(self, repo, path):
+        """At the base, every line is blamed on the base itself."""
+        try:
+            blob = repo[self.index.base].tree[path]
+        except KeyError:
+            return None
+        if not isinstance(blob, pygit2.Blob) or blob.is_binary:
+            return None
+        base = intern(str(self.index.base))
+        return [(base, i + 1) for i in range(self.line_count(blob))]
+
+    @staticmethod
+    def line_count(blob):
+        data = blob.data
+        count = data.count(b'\n')
+        if data and not data.endswith(b'\n'):
+            count += 1
+        return count
+
+    def run_blame(self, path, rev):
+        output = GitExplodeUtils.quiet_git(
+            'blame', '--porcelain', '%s..%s' % (self.index.base, rev),
+            '--', path)
+        lines = []
+        for line in output.split('\n'):
+            m = PORCELAIN_LINE.match(line)
+            if m:
+                lines.append((intern(str(m.group(1))), int(m.group(2))))
+        return lines
+
+    def evict(self):
+        while self.lines > self.max_lines and len(self.entries) > 0:
+            key, lines = self.entries.popitem(last=False)
+            self.lines -= len(lines)
@@ -0,0 +1,407 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, absolute_import
+
+import os
+import re
+import subprocess
+from collections import OrderedDict
+
+import pygit2
+
+from git_deps.gitutils import GitUtils
+from git_deps.utils import abort
+from git_explode.gitutils import GitUtils as GitExplodeUtils
+
+ZERO_SHA1 = '0' * 40
+
+IDENT_RE = re.compile(r'^(.*) <(.*)> (\d+) ([+-])(\d\d)(\d\d)$')
+
+# Map each repository's path to the committer identity git would use
+# in it, as parsed by committer()
+_committers = {}
+
+
+def write_branches(heads, overwrite):
+    """Create (or if overwrite is set, update) all the given branches
+    in a single atomic transaction.  If this moves the branch which is
+    checked out, the working tree is brought up to date with it.
+
+    :param heads: dict mapping branch names to SHA1s
+    """
+    current = checked_out_branch()
+    if current in heads:
+        current_tip = GitExplodeUtils.rev_parse(current)
+
+    old = None if overwrite else ZERO_SHA1
+    GitExplodeUtils.update_refs([('refs/heads/' + branch, sha, old)
+                                 for branch, sha in heads.items()])
+    for branch, sha in heads.items():
+        print("Created %s at %s" % (branch, sha[:8]))
+
+    if current in heads and heads[current] != current_tip:
+        # Like a checkout, carrying any local changes across
+        GitExplodeUtils.git('read-tree', '-m', '-u',
+                            current_tip, heads[current])
+
+
+def checked_out_branch():
+    """Return the name of the branch checked out in the current
+    working tree, or None if HEAD is detached.
+    """
+    try:
+        ref = GitExplodeUtils.quiet_git('symbolic-ref', '-q', 'HEAD')
+    except subprocess.CalledProcessError:
+        return None
+    if not ref.startswith('refs/heads/'):
+        return None
+    return ref[len('refs/heads/'):]
+
+
+def merge_message(shas, branch):
+    """Return the message git would use for merging shas into branch."""
+    if len(shas) == 1:
+        return "Merge commit '%s' into %s\n" % (shas[0], branch)
+    quoted = ["'%s'" % sha for sha in shas]
+    return "Merge commits %s and %s into %s\n" % \
+        (', '.join(quoted[:-1]), quoted[-1], branch)
+
+
+def committer(repo):
+    """Return the signature git would commit with in repo.  Like git,
+    this takes the identity from GIT_COMMITTER_NAME and
+    GIT_COMMITTER_EMAIL when they are set, falling back to user.name
+    and user.email from the config, and honours GIT_COMMITTER_DATE.
+    Aborts if no identity can be found.
+    """
+    if repo.path not in _committers:
+        try:
+            ident = GitExplodeUtils.quiet_git('-C', repo.path, 'var',
+                                              'GIT_COMMITTER_IDENT')
+        except subprocess.CalledProcessError:
+            abort("fatal: unable to work out who to commit as; set "
+                  "user.name and user.email, or GIT_COMMITTER_NAME and "
+                  "GIT_COMMITTER_EMAIL")
+        match = IDENT_RE.match(ident)
+        if match is None:
+            abort("fatal: can't parse committer identity '%s'" % ident)
+        name, email, seconds, sign, hours, minutes = match.groups()
+        offset = int(hours) * 60 + int(minutes)
+        if sign == '-':
+            offset = -offset
+        _committers[repo.path] = (name, email, int(seconds), offset)
+
+    name, email, seconds, offset = _committers[repo.path]
+    if 'GIT_COMMITTER_DATE' in os.environ:
+        return pygit2.Signature(name, email, seconds, offset)
+    # Otherwise each commit is made now, just as it would be by git
+    return pygit2.Signature(name, email)
+
+
+def merge_in_memory(repo, ours, shas, branch):
+    """Merge the given commits into ours purely in the object database,
+    producing the same commit git merge would on branch, i.e. an
+    octopus merge when there is more than one, after fast-forwarding
+    where possible and skipping any which are already merged.
+
+    :return: SHA1 of the result
+    """
+    ours = repo[ours]
+    parents = [ours.id]
+    signature = committer(repo)
+    message = merge_message(shas, branch)
+    for sha in shas:
+        theirs = repo[sha]
+        ancestor = repo.merge_base(ours.id, theirs.id)
+        if ancestor == theirs.id:
+            # Already up to date
+            continue
+        if ancestor == ours.id and len(parents) == 1:
+            # Fast-forward, just like git merge would
+            ours = theirs
+            parents = [ours.id]
+            continue
+        # merge_commits() copes with multiple merge bases in the
+        # same way as git's recursive strategy, which matters when
+        # topics have been merged into each other more than once.
+        index = repo.merge_commits(ours, theirs)
+        if index.conflicts is not None:
+            abort("Merge of %s into %s failed with conflicts" %
+                  (sha[:8], branch))
+        parents.append(theirs.id)
+        # Each intermediate result is a real commit so that merging
+        # in the next one sees everything merged so far.
+        ours = repo[repo.create_commit(
+            None, signature, signature, message,
+            index.write_tree(repo), [ours.id, theirs.id])]
+
+    if len(parents) <= 2:
+        return ours.hex
+    return repo.create_commit(None, signature, signature, message,
+                              ours.tree_id, parents).hex
+
+
+def reuse_tree(repo, sha, onto):
+    """If onto has exactly the same tree as the parent of sha, then
+    cherry-picking sha onto it can only result in sha's own tree, so
+    create that commit directly in the object database rather than
+    applying the diff again.
+
+    :return: SHA1 of the new commit, or None if the trees differ
+    """
+    commit = repo[sha]
+    onto = repo[onto]
+    if len(commit.parents) != 1 or onto.tree_id != commit.parents[0].tree_id:
+        return None
+    return repo.create_commit(
+        None, commit.author, committer(repo),
+        commit.message, commit.tree_id, [onto.id]).hex
+
+
+class WorktreeBuilder(object):
+    """Builds topic branches by running the same git porcelain commands
+    a human would, i.e. checking out each branch in the working tree
+    and cherry-picking onto it.  Merges are worked out in memory (see
+    merge_in_memory()) and the branch then fast-forwarded to the
+    result, which avoids checking out the merged trees file by file.
+
+    """
+    def __init__(self, repo, logger, overwrite=False):
+        self.repo = repo
+        self.logger = logger
+        self.overwrite = overwrite
+        self.current = None
+
+    def start(self):
+        self.orig_head = GitExplodeUtils.get_head()
+
+    def resume(self, heads, current, orig_head):
+        """Pick up where an interrupted explosion left off.  The
+        branches built so far already exist, so just switch back to
+        the one it was on.
+        """
+        self.orig_head = orig_head
+        if current is not None:
+            self.checkout(current)
+
+    def checkout(self, branch):
+        GitExplodeUtils.checkout(branch)
+        self.current = branch
+
+    def checkout_new(self, branch, at):
+        GitExplodeUtils.checkout_new(branch, at, force=self.overwrite)
+        self.current = branch
+
+    def head(self):
+        return GitExplodeUtils.get_head_sha1()
+
+    def cherry_pick(self, sha):
+        GitExplodeUtils.git('cherry-pick', sha)
+        return GitExplodeUtils.get_head_sha1()
+
+    def fast_forward(self, sha):
+        GitExplodeUtils.git('merge', '-q', '--ff-only', sha)
+
+    def merge(self, *shas):
+        """Merge the given commits into the current branch in memory,
+        and then bring the working tree up to date with the result.
+
+        :return: SHA1 of the result
+        """
+        new = merge_in_memory(self.repo, self.head(), shas, self.current)
+        self.fast_forward(new)
+        return new
+
+    def finish(self):
+        GitExplodeUtils.checkout(self.orig_head)
+
+    def cleanup(self):
+        """Called whether or not building succeeded.  Any conflicts are
+        left in the working tree for the user to look at.
+        """
+        pass
+
+
+class DetachedWorktreeBuilder(WorktreeBuilder):
+    """Builds topic branches by cherry-picking onto a detached HEAD in
+    the given working tree, keeping track of where each branch has got
+    to rather than updating the branch refs as it goes.  Several of
+    these can share the same dict of branch heads, allowing them to
+    build different branches in parallel in different worktrees.
+
+    If no path is given, a temporary worktree is used for the duration
+    of the explosion, so the user's working tree and HEAD are left
+    alone, and all the branches are created in a single transaction
+    at the end.
+
+    Since the branch heads are tracked here rather than by the
+    worktree, commits which can be created without cherry-picking
+    (see reuse_tree()) are written straight to the object database,
+    and the worktree only catches up when something next needs to be
+    done in it.  A chain of such commits never touches the worktree.
+
+    """
+    def __init__(self, repo, logger, overwrite=False, path=None,
+                 heads=None):
+        super(DetachedWorktreeBuilder, self).__init__(repo, logger,
+                                                      overwrite)
+        self.path = path
+        self.scratch = path is None
+        self.heads = OrderedDict() if heads is None else heads
+        self.current = None
+        # Whether the worktree's HEAD is behind self.heads[self.current]
+        self.stale = False
+
+    def git(self, *args):
+        if self.path is not None:
+            args = ('-C', self.path) + args
+        return GitExplodeUtils.git(*args)
+
+    def start(self):
+        if self.scratch:
+            self.path = GitExplodeUtils.add_worktree('HEAD')
+
+    def resume(self, heads, current, orig_head):
+        self.start()
+        self.heads.update(heads)
+        if current is not None:
+            self.checkout(current)
+
+    def checkout(self, branch):
+        self.git('checkout', '-q', '--detach', self.heads[branch])
+        self.current = branch
+        self.stale = False
+
+    def checkout_new(self, branch, at):
+        if not self.overwrite and \
+           self.repo.lookup_branch(branch) is not None:
+            abort("fatal: A branch named '%s' already exists." % branch)
+        # at may be a branch which so far only exists in self.heads
+        self.git('checkout', '-q', '--detach', self.heads.get(at, at))
+        self.current = branch
+        self.stale = False
+        self.heads[branch] = self._head_sha1()
+
+    def head(self):
+        return self.heads[self.current]
+
+    def cherry_pick(self, sha):
+        new = reuse_tree(self.repo, sha, self.heads[self.current])
+        if new is not None:
+            self.fast_forward(new)
+            return new
+        self.sync()
+        self.git('cherry-pick', sha)
+        self.heads[self.current] = self._head_sha1()
+        return self.heads[self.current]
+
+    def fast_forward(self, sha):
+        self.heads[self.current] = sha
+        self.stale = True
+
+    def sync(self):
+        """Bring the worktree up to date with the current branch."""
+        if self.stale:
+            self.git('checkout', '-q', '--detach', self.heads[self.current])
+            self.stale = False
+
+    def merge(self, *shas):
+        new = merge_in_memory(self.repo, self.head(), shas, self.current)
+        self.fast_forward(new)
+        return new
+
+    def finish(self):
+        self.cleanup()
+        write_branches(self.heads, self.overwrite)
+
+    def cleanup(self):
+        if self.scratch and self.path is not None:
+            GitExplodeUtils.remove_worktree(self.path)
+            self.path = None
+
+    def _head_sha1(self):
+        if self.path is None:
+            return GitExplodeUtils.get_head_sha1()
+        return GitExplodeUtils.quiet_git('-C', self.path, 'rev-parse', 'HEAD')
+
+
+class InMemoryBuilder(object):
+    """Builds topic branches purely in the object database via pygit2.
+
+    Cherry-picks and merges are performed as in-memory tree merges,
+    and branch refs are only written once everything has been built,
+    so neither the working tree nor HEAD are ever touched.  This also
+    works in bare repositories.
+
+    """
+    def __init__(self, repo, logger, overwrite=False, heads=None):
+        self.repo = repo
+        self.logger = logger
+        self.overwrite = overwrite
+
+        # Map each branch being built to the SHA1 of its tip.  This may
+        # be shared with other builders working in parallel.
+        self.heads = OrderedDict() if heads is None else heads
+        self.current = None
+
+    def start(self):
+        pass
+
+    def resume(self, heads, current, orig_head):
+        self.heads.update(heads)
+        self.current = current
+
+    def checkout(self, branch):
+        if branch not in self.heads:
+            abort("BUG: can't switch to unknown branch %s" % branch)
+        self.current = branch
+
+    def checkout_new(self, branch, at):
+        exists = branch in self.heads or \
+            self.repo.lookup_branch(branch) is not None
+        if exists and not self.overwrite:
+            abort("fatal: A branch named '%s' already exists." % branch)
+        self.heads[branch] = self._resolve(at).hex
+        self.current = branch
+
+    def head(self):
+        return self.heads[self.current]
+
+    def cherry_pick(self, sha):
+        new = reuse_tree(self.repo, sha, self.heads[self.current])
+        if new is not None:
+            self.heads[self.current] = new
+            return new
+        commit = self.repo[sha]
+        onto = self.repo[self.heads[self.current]]
+        parent = commit.parents[0]
+        index = self.repo.merge_trees(parent.tree, onto.tree, commit.tree)
+        if index.conflicts is not None:
+            abort("error: could not apply %s... %s" %
+                  (sha[:7], GitUtils.oneline(commit)))
+        tree = index.write_tree(self.repo)
+        new = self.repo.create_commit(
+            None, commit.author, committer(self.repo),
+            commit.message, tree, [onto.id])
+        self.heads[self.current] = new.hex
+        return new.hex
+
+    def fast_forward(self, sha):
+        self.heads[self.current] = sha
+
+    def merge(self, *shas):
+        new = merge_in_memory(self.repo, self.head(), shas, self.current)
+        self.heads[self.current] = new
+        return new
+
+    def finish(self):
+        write_branches(self.heads, self.overwrite)
+
+    def cleanup(self):
+        pass
+
+    def _resolve(self, rev):
+        if rev in self.heads:
+            return self.repo[self.heads[rev]]
+        return GitUtils.ref_commit(self.repo, rev)
@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, absolute_import
+
+import copy
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+
+
+class DependencyCache(object):
+    """Persistent cache of the dependencies detected for each commit.
+
+    The dependencies of a commit can never change, since its SHA1
+    already pins down its parents and the whole of its history.  They
+    do however depend on the number of lines of diff context, and on
+    the commit used as the boundary for exclusion (i.e. the base of
+    the range being exploded), so both of those form part of the key.
+
+    The cache is bounded by the number of commits it holds; when it
+    grows beyond that, the least recently used commits are evicted.
+
+    Since the cause of each dependency is kept too, the cache also
+    serves as an index of the dependency graph, which ``git-explode
+    deps`` and ``git-explode explain`` query.
+
+    """
+    DEFAULT_MAX_COMMITS = 100000
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS commits (
+            id INTEGER PRIMARY KEY,
+            sha1 TEXT NOT NULL,
+            context_lines INTEGER NOT NULL,
+            boundary TEXT NOT NULL,
+            last_used REAL NOT NULL,
+            UNIQUE (sha1, context_lines, boundary)
+        );
+        CREATE INDEX IF NOT EXISTS commits_last_used
+            ON commits (last_used);
+        CREATE TABLE IF NOT EXISTS edges (
+            commit_id INTEGER NOT NULL
+                REFERENCES commits (id) ON DELETE CASCADE,
+            position INTEGER NOT NULL,
+            dependency TEXT NOT NULL,
+            cause TEXT NOT NULL,
+            PRIMARY KEY (commit_id, position)
+        );
+    """
+
+    def __init__(self, path, context_lines, boundary,
+                 max_commits=DEFAULT_MAX_COMMITS):
+        """
+        :param path: path to the SQLite database, which will be
+            created if it doesn't already exist
+        :param context_lines: number of lines of diff context used
+            for detection
+        :param boundary: SHA1 of the commit whose history is excluded
+            from detection
+        :param max_commits: maximum number of commits to keep
+        """
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.db = sqlite3.connect(path)
+        self.db.execute('PRAGMA foreign_keys = ON')
+        self.db.executescript(self.SCHEMA)
+        self.context_lines = context_lines
+        self.boundary = boundary
+        self.max_commits = max_commits
+        self.hits = self.misses = 0
+        self.used = []
+
+    def lookup(self, sha1):
+        """Return a list of (dependency SHA1, cause) tuples for the given
+        commit, or None if it isn't cached.
+        """
+        row = self.db.execute(
+            'SELECT id FROM commits '
+            'WHERE sha1 = ? AND context_lines = ? AND boundary = ?',
+            (sha1, self.context_lines, self.boundary)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.used.append(row[0])
+        return [
+            (dependency, cause)
+            for dependency, cause in self.db.execute(
+                'SELECT dependency, cause FROM edges '
+                'WHERE commit_id = ? ORDER BY position', row)
+        ]
+
+    def boundaries(self, sha1):
+        """Return the boundaries for which the dependencies of the given
+        commit are cached with this many lines of context, most
+        recently used first.
+        """
+        return [boundary for boundary, in self.db.execute(
+            'SELECT boundary FROM commits '
+            'WHERE sha1 = ? AND context_lines = ? '
+            'ORDER BY last_used DESC', (sha1, self.context_lines))]
+
+    def closure(self, sha1):
+        """Return the transitive closure of the dependencies of the given
+        commit as far as the cache knows it, breadth first, starting
+        with the commit itself.
+
+        :return: list of (SHA1, known) tuples, where known is false for
+            commits whose own dependencies aren't cached
+        """
+        return [(dependency, commit_id is not None)
+                for dependency, commit_id in self.db.execute(
+                    'WITH RECURSIVE closure (sha1) AS ('
+                    '  VALUES (?)'
+                    '  UNION'
+                    '  SELECT edges.dependency FROM closure'
+                    '  JOIN commits ON commits.sha1 = closure.sha1'
+                    '    AND context_lines = ? AND boundary = ?'
+                    '  JOIN edges ON edges.commit_id = commits.id'
+                    ') '
+                    'SELECT closure.sha1, commits.id FROM closure '
+                    'LEFT JOIN commits ON commits.sha1 = closure.sha1 '
+                    '  AND context_lines = ? AND boundary = ?',
+                    (sha1, self.context_lines, self.boundary,
+                     self.context_lines, self.boundary))]
+
+    def chain(self, dependent, dependency):
+        """Return the shortest chain of dependencies by which dependent
+        depends on dependency, as a list of (SHA1, cause) tuples
+        ending with dependency, or None if it doesn't.
+        """
+        previous = {dependent: None}
+        todo = deque([dependent])
+        while todo:
+            sha1 = todo.popleft()
+            for found, cause in self.lookup(sha1) or []:
+                if found in previous:
+                    continue
+                previous[found] = (sha1, cause)
+                if found == dependency:
+                    chain = []
+                    while found != dependent:
+                        sha1, cause = previous[found]
+                        chain.append((found, cause))
+                        found = sha1
+                    return chain[::-1]
+                todo.append(found)
+        return None
+
+    def store(self, sha1, dependencies):
+        """Record the list of (dependency SHA1, cause) tuples detected for
+        the given commit.  Nothing is committed to disk until close()
+        is called.
+        """
+        self.db.execute(
+            'DELETE FROM commits '
+            'WHERE sha1 = ? AND context_lines = ? AND boundary = ?',
+            (sha1, self.context_lines, self.boundary))
+        cursor = self.db.execute(
+            'INSERT INTO commits '
+            '(sha1, context_lines, boundary, last_used) '
+            'VALUES (?, ?, ?, ?)',
+            (sha1, self.context_lines, self.boundary, time.time()))
+        self.db.executemany(
+            'INSERT INTO edges (commit_id, position, dependency, cause) '
+            'VALUES (?, ?, ?, ?)',
+            [(cursor.lastrowid, i, dependency, cause)
+             for i, (dependency, cause) in enumerate(dependencies)])
+
+    def close(self):
+        """Record which commits were used, evict the least recently used
+        ones if the cache is too big, and close the database.
+        """
+        with self.db:
+            now = time.time()
+            self.db.executemany(
+                'UPDATE commits SET last_used = ? WHERE id = ?',
+                [(now, commit_id) for commit_id in self.used])
+            self.db.execute(
+                'DELETE FROM commits WHERE id IN ('
+                '  SELECT id FROM commits ORDER BY last_used DESC'
+                '  LIMIT -1 OFFSET ?)', (self.max_commits,))
+        self.db.close()
+
+
+class MemoryDependencyCache(object):
+    """In-memory cache of the dependencies detected for each commit,
+    shared between all the explosions run by one long-lived process
+    such as ``git-explode serve``, so that each only has to detect the
+    dependencies of commits which none of the others has seen.
+
+    Each explosion uses its own view of the cache from for_run(),
+    which supports the same methods as DependencyCache, and keeps its
+    own counts of hits and misses.  Views may be used from several
+    threads at once.
+
+    """
+    def __init__(self, max_commits=DependencyCache.DEFAULT_MAX_COMMITS):
+        """
+        :param max_commits: maximum number of commits to keep
+        """
+        self.max_commits = max_commits
+        # Least recently used first
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.key = None
+        self.hits = self.misses = 0
+
+    def for_run(self, context_lines, boundary):
+        """Return a view of the cache for an explosion with the given
+        number of lines of diff context and boundary commit.
+        """
+        view = copy.copy(self)
+        view.key = (context_lines, boundary)
+        view.hits = view.misses = 0
+        return view
+
+    def lookup(self, sha1):
+        with self.lock:
+            dependencies = self.entries.pop((sha1,) + self.key, None)
+            if dependencies is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries[(sha1,) + self.key] = dependencies
+            return list(dependencies)
+
+    def store(self, sha1, dependencies):
+        with self.lock:
+            self.entries[(sha1,) + self.key] = tuple(dependencies)
+            if len(self.entries) > self.max_commits:
+                self.entries.popitem(last=False)
+
+    def close(self):
+        pass
@@ -6,9 +6,26 @@ from __future__ import print_function, absolute_import
 import argparse
 import sys
 
-from git_deps.gitutils import GitUtils
-from git_explode import __version__
-from git_explode.exploder import GitExploder
+# Everything else, in particular git-deps, pygit2 and the exploder
+# itself, is only imported once there's actually something to do, so
+# that --version, --help and usage errors are quick.
+
+
+class VersionAction(argparse.Action):
+    """Like argparse's version action, but only looks the version up
+    when it's asked for.
+    """
+    def __init__(self, option_strings, dest=argparse.SUPPRESS,
+                 default=argparse.SUPPRESS,
+                 help="show program's version number and exit"):
+        super(VersionAction, self).__init__(
+            option_strings=option_strings, dest=dest, default=default,
+            nargs=0, help=help)
+
+    def __call__(self, parser, namespace, values, option_string=None):
+        from git_explode import __version__
+        print('git-explode %s' % __version__)
+        parser.exit()
 
 
 def parse_args(args):
@@ -22,11 +39,13 @@ def parse_args(args):
     # REMINDER!!  If you change this, remember to update README.rst too.
     #####################################################################
     parser = argparse.ArgumentParser(
-        description="Explode linear sequence of commits into topic branches")
+        description="Explode linear sequence of commits into topic branches",
+        epilog="See 'git-explode serve -h' for running explosions in a "
+        "long-lived server, and 'git-explode deps -h' and 'git-explode "
+        "explain -h' for querying the dependencies found with --cache.")
     parser.add_argument(
         '--version',
-        action='version',
-        version='git-explode {ver}'.format(ver=__version__))
+        action=VersionAction)
     parser.add_argument(
         '-d', '--debug',
         dest='debug',
@@ -45,26 +64,401 @@ def parse_args(args):
         type=int,
         metavar='NUM',
         default=1)
+    parser.add_argument(
+        '-j', '--jobs',
+        dest='jobs',
+        help='Number of parallel jobs to use for dependency detection '
+        'and building topic branches [%(default)s]',
+        type=int,
+        metavar='NUM',
+        default=1)
+    parser.add_argument(
+        '--cache',
+        dest='cache',
+        action='store_true',
+        help='Cache detected dependencies and merges in '
+        '.git/git-explode/ for reuse by later runs')
+    parser.add_argument(
+        '--cache-size',
+        dest='cache_size',
+        help='Maximum number of commits to keep in the dependency '
+        'cache [%(default)s]',
+        type=int,
+        metavar='NUM',
+        default=100000)
+    parser.add_argument(
+        '--blame-cache-size',
+        dest='blame_cache_size',
+        help='Maximum number of lines of blame output to keep in memory '
+        'for reuse between commits, or 0 to disable [%(default)s]',
+        type=int,
+        metavar='NUM',
+        default=1000000)
+    parser.add_argument(
+        '--max-topics',
+        dest='max_topics',
+        help='Coalesce the topic branches into at most NUM, with as few '
+        'dependencies between them as possible',
+        type=int,
+        metavar='NUM')
+    parser.add_argument(
+        '-i', '--incremental',
+        dest='incremental',
+        action='store_true',
+        help='Update the topic branches from a previous run, reusing '
+        'exploded commits and merges which are unchanged')
+    parser.add_argument(
+        '-m', '--in-memory',
+        dest='in_memory',
+        action='store_true',
+        help='Build topic branches in the object database without '
+        'touching the working tree or HEAD')
+    parser.add_argument(
+        '--detached',
+        dest='detached',
+        action='store_true',
+        help='Build topic branches on a detached HEAD in a temporary '
+        'worktree, then create them all in one transaction')
+    parser.add_argument(
+        '--low-memory',
+        dest='low_memory',
+        action='store_true',
+        help='Keep the dependency tree and plan in a temporary database '
+        'in .git/git-explode/ rather than in memory, for very large '
+        'ranges')
+    parser.add_argument(
+        '--no-git-batch',
+        dest='git_batch',
+        action='store_false',
+        help='Spawn a new git process for every query rather than '
+        'reusing long-lived ones')
+    parser.add_argument(
+        '-s', '--stream',
+        dest='stream',
+        action='store_true',
+        help='Start building topic branches while dependencies are '
+        'still being detected, exploding commits in the order they '
+        'were made')
+    parser.add_argument(
+        '--plan',
+        dest='plan',
+        action='store_true',
+        help='Output the explosion plan as JSON without changing '
+        'anything')
+    parser.add_argument(
+        '--apply',
+        dest='apply',
+        help='Apply an explosion plan previously output by --plan',
+        type=str,
+        metavar='FILE')
+    parser.add_argument(
+        '--continue',
+        dest='resume',
+        action='store_true',
+        help='Continue an explosion which was interrupted while '
+        'building topic branches, from the last commit it finished')
+    parser.add_argument(
+        '--batch',
+        dest='batch',
+        help="Explode each of the ranges listed in FILE (or - for stdin) "
+        "as 'BASE HEAD [PREFIX]' lines, detecting and exploding the "
+        "commits they share only once",
+        type=str,
+        metavar='FILE')
+    parser.add_argument(
+        '--socket',
+        dest='socket',
+        help='Run the explosion in the git-explode serve listening on '
+        'the Unix socket PATH',
+        type=str,
+        metavar='PATH')
+    parser.add_argument(
+        '--stats',
+        dest='stats',
+        action='store_true',
+        help='Print a summary of where the time went to stderr')
+    parser.add_argument(
+        '--stats-json',
+        dest='stats_json',
+        help='Write detailed timings to FILE as JSON',
+        type=str,
+        metavar='FILE')
+    parser.add_argument(
+        '--profile',
+        dest='profile',
+        help='Profile the run with cProfile and write the results '
+        'to FILE in pstats format',
+        type=str,
+        metavar='FILE')
     parser.add_argument(
         dest="base",
         help="base of sequence to explode",
         type=str,
+        nargs='?',
         metavar="BASE")
     parser.add_argument(
         dest="head",
         help="head of sequence to explode",
         type=str,
+        nargs='?',
         metavar="HEAD")
 
+    args = parser.parse_args(args)
+    if args.in_memory and args.detached:
+        parser.error("--in-memory and --detached are mutually exclusive")
+    if args.stream and (args.plan or args.apply):
+        parser.error("--stream cannot be used with --plan or --apply")
+    if args.low_memory and (args.plan or args.apply or args.stream):
+        parser.error("--low-memory cannot be used with --plan, --apply "
+                     "or --stream")
+    if args.max_topics is not None:
+        if args.max_topics < 1:
+            parser.error("--max-topics must be at least 1")
+        if args.apply or args.resume or args.stream or args.low_memory:
+            parser.error("--max-topics cannot be used with --apply, "
+                         "--continue, --stream or --low-memory")
+    if args.batch:
+        if args.base:
+            parser.error("--batch takes the ranges from FILE")
+        if args.plan or args.apply or args.resume or args.stream or \
+           args.low_memory or args.incremental:
+            parser.error("--batch cannot be used with --plan, --apply, "
+                         "--continue, --stream, --low-memory or "
+                         "--incremental")
+    elif args.resume:
+        if args.plan or args.apply or args.stream or args.base:
+            parser.error("--continue takes the range and plan from the "
+                         "interrupted explosion")
+    elif args.apply:
+        if args.plan or args.base:
+            parser.error("--apply takes the range from the plan")
+    elif not args.head:
+        parser.error("BASE and HEAD are required")
+    return args
+
+
+def parse_serve_args(args):
+    """
+    Parse command line parameters of ``git-explode serve``
+
+    :param args: command line parameters as list of strings
+    :return: command line parameters as :obj:`argparse.Namespace`
+    """
+    parser = argparse.ArgumentParser(
+        prog='git-explode serve',
+        description="Run explosions submitted with --socket, keeping the "
+        "repository and detected dependencies in memory between them")
+    parser.add_argument(
+        '-d', '--debug',
+        dest='debug',
+        action='store_true',
+        help='Show debugging')
+    parser.add_argument(
+        '--socket',
+        dest='socket',
+        help='Unix socket to listen on [.git/git-explode/serve.sock]',
+        type=str,
+        metavar='PATH')
+    parser.add_argument(
+        '--max-jobs',
+        dest='max_jobs',
+        help='Maximum number of explosions to run at once [%(default)s]',
+        type=int,
+        metavar='NUM',
+        default=4)
+    parser.add_argument(
+        '--cache-size',
+        dest='cache_size',
+        help='Maximum number of commits whose dependencies are kept in '
+        'memory [%(default)s]',
+        type=int,
+        metavar='NUM',
+        default=100000)
+    parser.add_argument(
+        '--no-git-batch',
+        dest='git_batch',
+        action='store_false',
+        help='Spawn a new git process for every query rather than '
+        'reusing long-lived ones')
+    return parser.parse_args(args)
+
+
+def parse_query_args(command, args):
+    """
+    Parse command line parameters of ``git-explode deps`` or
+    ``git-explode explain``
+
+    :param command: 'deps' or 'explain'
+    :param args: command line parameters as list of strings
+    :return: command line parameters as :obj:`argparse.Namespace`
+    """
+    if command == 'deps':
+        description = "List every commit which COMMIT depends on, " \
+            "directly or indirectly"
+    else:
+        description = "Show why DEPENDENT depends on DEPENDENCY, via " \
+            "the line which caused each dependency along the way"
+    parser = argparse.ArgumentParser(
+        prog='git-explode ' + command,
+        description=description,
+        epilog="Dependencies are looked up in the cache kept by "
+        "git-explode --cache, as detected when a range containing them "
+        "was last exploded, unless --base is given.")
+    parser.add_argument(
+        '-d', '--debug',
+        dest='debug',
+        action='store_true',
+        help='Show debugging')
+    parser.add_argument(
+        '-c', '--context-lines',
+        dest='context_lines',
+        help='Number of lines of diff context used to detect the '
+        'dependencies [%(default)s]',
+        type=int,
+        metavar='NUM',
+        default=1)
+    parser.add_argument(
+        '--base',
+        dest='base',
+        help='Look up the dependencies as detected when exploding a '
+        'range from BASE, detecting any which are not cached yet',
+        type=str,
+        metavar='BASE')
+    if command == 'deps':
+        parser.add_argument(
+            dest='commit',
+            help='commit whose dependencies to list',
+            type=str,
+            metavar='COMMIT')
+    else:
+        parser.add_argument(
+            dest='dependent',
+            help='commit which depends on DEPENDENCY',
+            type=str,
+            metavar='DEPENDENT')
+        parser.add_argument(
+            dest='dependency',
+            help='commit which DEPENDENT depends on',
+            type=str,
+            metavar='DEPENDENCY')
     return parser.parse_args(args)
 
 
 def main(args):
+    if args[:1] == ['serve']:
+        from git_explode.server import serve
+        serve(parse_serve_args(args[1:]))
+        return
+    if args[:1] == ['deps']:
+        from git_explode.query import deps
+        deps(parse_query_args('deps', args[1:]))
+        return
+    if args[:1] == ['explain']:
+        from git_explode.query import explain
+        explain(parse_query_args('explain', args[1:]))
+        return
+    argv = args
     args = parse_args(args)
+    if args.socket:
+        from git_explode.server import submit
+        sys.exit(submit(args.socket, argv, args))
+    if args.profile:
+        import cProfile
+        profile = cProfile.Profile()
+        try:
+            profile.runcall(explode, args)
+        finally:
+            profile.dump_stats(args.profile)
+    else:
+        explode(args)
+
+
+def exploder_options(args):
+    """Return the keyword arguments for GitExploder which the parsed
+    command line args ask for.
+    """
+    return dict(in_memory=args.in_memory, jobs=args.jobs, cache=args.cache,
+                cache_size=args.cache_size, incremental=args.incremental,
+                blame_cache_size=args.blame_cache_size,
+                detached=args.detached, low_memory=args.low_memory,
+                prefix=args.prefix or '', max_topics=args.max_topics)
+
+
+def make_exploder(args, repo, **kwargs):
+    """Return a GitExploder set up as the parsed command line args ask,
+    passing any extra keyword arguments through to it.
+    """
+    from git_explode.exploder import GitExploder
+    options = exploder_options(args)
+    options.update(kwargs)
+    return GitExploder(repo, args.base, args.head, args.debug,
+                       args.context_lines, **options)
+
+
+def run_exploder(exploder, args, out, plan=None, journal=None):
+    """Do whatever the parsed command line args ask of exploder,
+    writing any plan to out.
+    """
+    if journal is not None:
+        exploder.resume(journal)
+    elif plan is not None:
+        exploder.apply(plan)
+    elif args.plan:
+        plan = exploder.plan(exploder.get_dependencies())
+        plan.dump(out)
+    elif args.stream:
+        exploder.stream()
+    else:
+        exploder.run()
+
+
+def explode(args):
+    from git_deps.gitutils import GitUtils
+    from git_deps.utils import abort
+    from git_explode.gitutils import GitUtils as GitExplodeUtils
+    from git_explode.journal import ExplodeJournal
+    from git_explode.plan import ExplodePlan
+
     repo = GitUtils.get_repo()
-    exploder = GitExploder(repo, args.base, args.head, args.debug,
-                           args.context_lines)
-    exploder.run()
+    plan = None
+    journal = None
+    if args.resume:
+        journal = ExplodeJournal.for_repo(repo)
+        if not journal.exists():
+            abort("fatal: no interrupted explosion to continue")
+        journal.load()
+        plan = journal.plan
+        args.base, args.head = plan.base, plan.head
+        args.in_memory = journal.builder == 'in-memory'
+        args.detached = journal.builder == 'detached'
+        args.incremental = journal.overwrite
+        args.low_memory = journal.store is not None
+    elif args.apply:
+        with open(args.apply) as f:
+            plan = ExplodePlan.load(f)
+        args.base, args.head = plan.base, plan.head
+    if args.batch:
+        from git_explode.batch import BatchExploder, read_ranges
+        ranges = read_ranges(args.batch, args.prefix or '')
+        exploder = BatchExploder(repo, ranges, args.debug, args.context_lines,
+                                 **exploder_options(args))
+    else:
+        exploder = make_exploder(args, repo)
+    if args.git_batch:
+        GitExplodeUtils.start_batch()
+    try:
+        run_exploder(exploder, args, sys.stdout, plan, journal)
+    finally:
+        GitExplodeUtils.stop_batch()
+    if args.debug:
+        for line in GitExplodeUtils.timing_report():
+            exploder.logger.debug(line)
+    if args.stats:
+        for line in exploder.stats.summary():
+            print(line, file=sys.stderr)
+    if args.stats_json:
+        with open(args.stats_json, 'w') as f:
+            exploder.stats.dump(f)
 
 
 def run():
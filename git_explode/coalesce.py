@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, absolute_import
+
+import heapq
+from collections import Counter
+
+
+def coalesce_topics(sizes, edges, max_topics):
+    """Cluster topics together until there are at most max_topics of
+    them, keeping as few dependencies between clusters as possible.
+
+    Starting with each topic in a cluster of its own, the two clusters
+    with the most dependencies between them are merged over and over
+    again.  Clusters must still only depend on each other one way
+    round afterwards, so that each can be built on top of the ones it
+    depends on, which means that two clusters can't be merged if one
+    also depends on the other indirectly via a third; the pair with
+    the next most dependencies is tried instead.  There is always at
+    least one pair which can be merged while any clusters depend on
+    each other, and once none do, the smallest are merged.
+
+    :param sizes: list giving the number of commits in each topic
+    :param edges: iterable of (topic, topic) pairs, one for each
+        dependency of a commit in the first topic on a commit in the
+        second, where topics are indices into sizes
+    :param max_topics: maximum number of clusters
+    :return: list mapping each topic to the index of its cluster, where
+        clusters are numbered so that they only depend on clusters
+        with lower numbers
+    """
+    # Each cluster is represented by its first topic.
+    rep = list(range(len(sizes)))
+    sizes = list(sizes)
+    # Map each cluster to the number of dependencies it has on each
+    # other cluster, and the other way round
+    deps = [Counter() for _ in sizes]
+    dependents = [set() for _ in sizes]
+    for topic, dependency in edges:
+        if topic != dependency:
+            deps[topic][dependency] += 1
+            dependents[dependency].add(topic)
+
+    def find(topic):
+        while rep[topic] != topic:
+            rep[topic] = rep[rep[topic]]
+            topic = rep[topic]
+        return topic
+
+    def reaches_indirectly(cluster, target):
+        """Return whether cluster depends on target other than
+        directly.
+        """
+        todo = [c for c in deps[cluster] if c != target]
+        seen = set(todo)
+        while todo:
+            c = todo.pop()
+            if c == target:
+                return True
+            for d in deps[c]:
+                if d not in seen:
+                    seen.add(d)
+                    todo.append(d)
+        return False
+
+    def merge(cluster, other):
+        """Merge other into cluster."""
+        rep[other] = cluster
+        sizes[cluster] += sizes[other]
+        for dependency, count in deps[other].items():
+            dependents[dependency].discard(other)
+            if dependency != cluster:
+                deps[cluster][dependency] += count
+                dependents[dependency].add(cluster)
+        for dependent in dependents[other]:
+            count = deps[dependent].pop(other)
+            if dependent != cluster:
+                deps[dependent][cluster] += count
+                dependents[cluster].add(dependent)
+        deps[cluster].pop(other, None)
+        dependents[cluster].discard(other)
+        deps[other] = Counter()
+        dependents[other] = set()
+
+    # Pairs of clusters by descending number of dependencies between
+    # them.  Entries go stale when either cluster is merged, at which
+    # point all the pairs involving the merged cluster are pushed
+    # again.  A pair which can't be merged stays that way until then.
+    heap = []
+
+    def push(cluster):
+        for dependency, count in deps[cluster].items():
+            heapq.heappush(heap, (-count, cluster, dependency))
+        for dependent in dependents[cluster]:
+            heapq.heappush(heap, (-deps[dependent][cluster], dependent,
+                                  cluster))
+
+    for cluster in range(len(sizes)):
+        for dependency, count in deps[cluster].items():
+            heapq.heappush(heap, (-count, cluster, dependency))
+
+    clusters = len(sizes)
+    while clusters > max_topics and heap:
+        count, cluster, dependency = heapq.heappop(heap)
+        if find(cluster) != cluster or find(dependency) != dependency or \
+           deps[cluster].get(dependency) != -count:
+            continue
+        if reaches_indirectly(cluster, dependency):
+            continue
+        cluster, other = sorted((cluster, dependency))
+        merge(cluster, other)
+        push(cluster)
+        clusters -= 1
+
+    # Nothing depends on anything else any more
+    if clusters > max_topics:
+        assert not any(deps[c] for c in range(len(sizes)) if find(c) == c)
+        smallest = [(sizes[c], c) for c in range(len(sizes)) if find(c) == c]
+        heapq.heapify(smallest)
+        while clusters > max_topics:
+            size, cluster = heapq.heappop(smallest)
+            other_size, other = heapq.heappop(smallest)
+            merge(min(cluster, other), max(cluster, other))
+            heapq.heappush(smallest, (size + other_size, min(cluster, other)))
+            clusters -= 1
+
+    return number_clusters([find(topic) for topic in range(len(sizes))],
+                           deps)
+
+
+def number_clusters(cluster_of, deps):
+    """Number the clusters so that each only depends on clusters with
+    lower numbers, otherwise keeping them in the order of the first
+    topic in each.
+    """
+    roots = sorted(set(cluster_of))
+    waiting = dict((c, len(deps[c])) for c in roots)
+    dependents = dict((c, []) for c in roots)
+    for c in roots:
+        for dependency in deps[c]:
+            dependents[dependency].append(c)
+    ready = [c for c in roots if not waiting[c]]
+    heapq.heapify(ready)
+    numbers = {}
+    while ready:
+        c = heapq.heappop(ready)
+        numbers[c] = len(numbers)
+        for dependent in dependents[c]:
+            waiting[dependent] -= 1
+            if not waiting[dependent]:
+                heapq.heappush(ready, dependent)
+    return [numbers[c] for c in cluster_of]
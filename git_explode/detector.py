@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, absolute_import
+
+from git_deps.detector import DependencyDetector
+from git_explode.gitutils import GitUtils as GitExplodeUtils
+
+
+class ExplodeDependencyDetector(DependencyDetector):
+    """DependencyDetector which uses a PathIndex of the range being
+    exploded to avoid blame work which can't find any dependencies:
+
+    - commits which only touch paths no earlier commit in the range
+      touched are not diffed or blamed at all
+    - within other commits, only paths touched earlier in the range
+      are blamed
+    - blames are answered from a BlameCache where possible
+    - blame stops at the base of the range rather than walking all the
+      way back through the history of each file
+
+    When not recursing, the pygit2 commits, blame lines and list of
+    commits done which DependencyDetector keeps are dropped as soon as
+    each commit is done, since listeners have all they need by then,
+    so memory doesn't grow with the size of the range.
+
+    """
+    def __init__(self, options, repo=None, logger=None, index=None,
+                 blame_cache=None):
+        super(ExplodeDependencyDetector, self).__init__(options, repo, logger)
+        if logger is not None:
+            # DependencyDetector only sets it when it makes its own
+            self.logger = logger
+        self.index = index
+        self.blame_cache = blame_cache
+
+    def find_dependencies(self, dependent_rev, recurse=None):
+        super(ExplodeDependencyDetector, self).find_dependencies(
+            dependent_rev, recurse)
+        if not (self.options.recurse if recurse is None else recurse):
+            self.commits.clear()
+            self.dependencies.clear()
+            del self.done[:]
+            self.done_d.clear()
+
+    def find_dependencies_with_parent(self, dependent, parent):
+        if self.index is not None and \
+           not self.index.may_have_dependencies(dependent.hex):
+            self.logger.info("    %s only touches paths new to the range" %
+                             dependent.hex[:8])
+            return
+        super(ExplodeDependencyDetector, self).find_dependencies_with_parent(
+            dependent, parent)
+
+    def blame_diff_hunk(self, dependent, parent, path, hunk):
+        if self.index is not None and \
+           not self.index.touched_before(path, dependent.hex):
+            return
+        super(ExplodeDependencyDetector, self).blame_diff_hunk(
+            dependent, parent, path, hunk)
+
+    def run_blame(self, hunk, parent, path):
+        if self.blame_cache is not None:
+            return self.blame_cache.blame(self.repo, path, parent.hex,
+                                          hunk.old_start, hunk.old_lines)
+        rev = parent.hex
+        if self.index is not None:
+            # Lines from before the range get blamed on the base as a
+            # boundary commit, which is excluded anyway.
+            rev = '%s..%s' % (self.index.base, rev)
+        return GitExplodeUtils.quiet_git(
+            'blame', '--porcelain',
+            '-L', "%d,+%d" % (hunk.old_start, hunk.old_lines),
+            rev, '--', path)
+
+    def is_excluded(self, commit):
+        if self.index is not None and commit.hex in self.index:
+            return False
+        return super(ExplodeDependencyDetector, self).is_excluded(commit)
@@ -1,203 +1,805 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-import copy
+import logging
+import os
+import sys
+import threading
+
+import pygit2
 import six
 from ostruct import OpenStruct
+from six.moves import queue
 
-from git_deps.detector import DependencyDetector
 from git_deps.gitutils import GitUtils
 from git_deps.utils import abort, standard_logger
+from git_explode import parallel
+from git_explode.blame import BlameCache
+from git_explode.builders import (DetachedWorktreeBuilder, InMemoryBuilder,
+                                  WorktreeBuilder, checked_out_branch)
+from git_explode.cache import DependencyCache
+from git_explode.coalesce import coalesce_topics
+from git_explode.detector import ExplodeDependencyDetector
 from git_explode.gitutils import GitUtils as GitExplodeUtils
+from git_explode.journal import ExplodeJournal
 from git_explode.listener import ExplodeDependencyListener
+from git_explode.manifest import ExplodeManifest
+from git_explode.merges import MergeCache
+from git_explode.pathindex import PathIndex
+from git_explode.plan import ExplodePlan
+from git_explode.scheduler import ParallelApplier
+from git_explode.stats import ExplodeStats
+from git_explode.store import (GraphStore, StoredDependencyListener,
+                               StoredPathIndex)
 from git_explode.topics import TopicManager
 
 
+def get_logger(name, debug):
+    """Like git-deps' standard_logger(), but only adds the debug
+    handler once, since one process may run several explosions.
+    """
+    logger = logging.getLogger(name)
+    if debug and not logger.handlers:
+        logger = standard_logger(name, debug)
+    return logger
+
+
 class GitExploder(object):
     """Explode a linear sequence of git commits into multiple independent
     topic branches.
 
     """
-    def __init__(self, repo, base, head, debug, context_lines):
-        self.logger = standard_logger('git-explode', debug)
+    def __init__(self, repo, base, head, debug, context_lines,
+                 in_memory=False, jobs=1, cache=False,
+                 cache_size=DependencyCache.DEFAULT_MAX_COMMITS,
+                 incremental=False,
+                 blame_cache_size=BlameCache.DEFAULT_MAX_LINES,
+                 detached=False, low_memory=False, dependency_cache=None,
+                 journal=True, prefix='', stats=None, merges=None,
+                 picks=None, max_topics=None):
+        self.logger = get_logger('git-explode', debug)
+        if stats is None:
+            stats = ExplodeStats(per_commit=not low_memory)
+        self.stats = stats
 
         self.debug = debug
         self.repo = repo
         self.base = base
         self.base_commit = GitUtils.ref_commit(repo, base)
-        self.logger.debug("base commit %s is %s" %
-                          (base, GitUtils.commit_summary(self.base_commit)))
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("base commit %s is %s" %
+                              (base,
+                               GitUtils.commit_summary(self.base_commit)))
         self.head = head
+        self.head_commit = GitUtils.ref_commit(repo, head)
         self.context_lines = context_lines
-        self.topic_mgr = TopicManager('topic%d', self.logger)
+        self.in_memory = in_memory
+        self.jobs = jobs
+        self.max_topics = max_topics
+        self.low_memory = low_memory
+        # With low_memory, everything which grows with the size of the
+        # range is kept in here rather than in memory.
+        self.store = None
+        self.index = None
+        self.blame_cache_size = blame_cache_size
+        self.blame_cache = None
+        self.cache = None
+        if dependency_cache is not None:
+            # Shared with other explosions in the same process
+            self.cache = dependency_cache.for_run(context_lines,
+                                                  self.base_commit.hex)
+            self.stats.count('cache', self.cache)
+        elif cache:
+            path = os.path.join(self.repo.path, 'git-explode',
+                                'dependencies.sqlite')
+            self.cache = DependencyCache(path, context_lines,
+                                         self.base_commit.hex, cache_size)
+            self.stats.count('cache', self.cache)
+        # Merges are reused within a run, and with --cache or
+        # --incremental across runs, since otherwise every commit
+        # exploded on top of a merge would be picked again.
+        if merges is None:
+            merges_path = None
+            if cache or incremental:
+                merges_path = os.path.join(self.repo.path, 'git-explode',
+                                           'merges.json')
+            merges = MergeCache(repo, merges_path)
+        self.merges = merges
+        self.stats.count('merge_cache', self.merges)
+        self.topic_mgr = TopicManager(prefix.replace('%', '%%') + 'topic%d',
+                                      self.logger)
+
+        # Map (commit, onto) pairs to the result of cherry-picking the
+        # commit onto onto, when shared with other explosions so that
+        # they can reuse each other's cherry-picks
+        self.picks = picks
 
         # Map commits to their exploded version
         self.exploded = {}
 
+        # Map topic branches to their tips
+        self.tips = {}
+
+        # Progress is checkpointed to the journal while applying a
+        # plan, unless use_journal is false
+        self.use_journal = journal
+        self.journal = None
+
+        # When exploding incrementally, the manifest of the previous
+        # explosion tells us which exploded commits can be reused, and
+        # existing topic branches get updated rather than recreated.
+        self.manifest = None
+        if incremental:
+            path = os.path.join(self.repo.path, 'git-explode',
+                                'manifest.json')
+            self.manifest = ExplodeManifest(path, repo)
+            self.topic_mgr.reserve(self.manifest.previous['roots'])
+
+        # The builder is responsible for actually creating the
+        # exploded commits and topic branches.
+        if in_memory:
+            builder_class = InMemoryBuilder
+        elif detached:
+            builder_class = DetachedWorktreeBuilder
+        else:
+            builder_class = WorktreeBuilder
+        self.builder = builder_class(repo, self.logger,
+                                     overwrite=incremental)
+
     def run(self):
-        orig_head = GitExplodeUtils.get_head()
-        commits, deps_from, deps_on = self.get_dependencies()
-        self.explode(commits, deps_from, deps_on)
-        self.checkout(orig_head)
+        plan = self.plan(self.get_dependencies())
+        self.apply(plan)
 
-    def get_dependencies(self):
+    def rev_list(self):
+        """Return the commits in the range, newest first, and build the
+        PathIndex used to narrow down dependency detection.
         """
-        Detect commit dependency tree, and return a tuple of dicts mapping
-        this in both directions.  Note that the dependency tree goes in
-        the reverse direction to the git commit graph, in that the leaves
-        of the dependency tree are the oldest commits, because newer
-        commits depend on older commits
-
-        :return: (dependencies_from, dependencies_on)
+        with self.stats.phase('rev-list'):
+            output = GitExplodeUtils.quiet_git(
+                'rev-list', "%s..%s" % (self.base, self.head))
+            revs = output.split('\n') if output else []
+        with self.stats.phase('index'):
+            if self.low_memory:
+                self.use_store(GraphStore.for_repo(self.repo))
+                self.index = StoredPathIndex.build(
+                    self.repo, self.base_commit.hex, revs[::-1], self.store)
+            else:
+                self.index = PathIndex.build(self.repo, self.base_commit.hex,
+                                             revs[::-1])
+        if self.blame_cache_size:
+            self.blame_cache = BlameCache(self.index, self.blame_cache_size)
+            self.stats.count('blame_cache', self.blame_cache)
+        return revs
+
+    def use_store(self, store):
+        self.store = store
+        self.exploded = store.exploded
+
+    def detector(self, recurse=True, repo=None):
+        return ExplodeDependencyDetector(
+            OpenStruct(self.detector_args(recurse)), repo or self.repo,
+            logger=get_logger('ExplodeDependencyDetector', self.debug),
+            index=self.index, blame_cache=self.blame_cache)
+
+    def update_manifest(self, plan):
+        with self.stats.phase('manifest'):
+            self._update_manifest(plan)
+
+    def _update_manifest(self, plan):
+        self.manifest.record_branches(plan.assignments, self.tips, plan.roots)
+        try:
+            self.delete_stale_branches()
+        finally:
+            self.manifest.save()
+
+    def delete_stale_branches(self):
+        head = checked_out_branch()
+        for branch, tip in sorted(self.manifest.stale_branches().items()):
+            if self.repo.lookup_branch(branch) is None:
+                continue
+            if self.repo.lookup_branch(branch).target.hex != tip:
+                self.logger.debug("Not deleting %s since it has changed" %
+                                  branch)
+                continue
+            if branch == head:
+                # Keep it in the manifest, so that a later run can
+                # delete it once it's no longer checked out
+                self.logger.warning("Not deleting %s since it is checked "
+                                    "out" % branch)
+                self.manifest.keep_branch(branch)
+                continue
+            GitExplodeUtils.git('branch', '-D', branch)
+
+    def get_dependencies(self, dependencies=None):
+        """
+        Detect commit dependency tree, and return it held by a listener
+        which maps it in both directions.  Note that the dependency tree
+        goes in the reverse direction to the git commit graph, in that
+        the leaves of the dependency tree are the oldest commits, because
+        newer commits depend on older commits
+
+        :param dependencies: dict mapping SHA1s to lists of
+            (dependency SHA1, cause) tuples already detected, e.g. by
+            the explosion of another range with the same base, which
+            is added to as more are detected
+        :return: ExplodeDependencyListener holding the tree
         """
 
-        detector_args = OpenStruct({
-            'recurse': True,
+        revs = self.rev_list()
+        if self.store is not None:
+            listener = StoredDependencyListener(self.store)
+            dependencies = self.store.detected
+        else:
+            listener = ExplodeDependencyListener({})
+            if dependencies is None:
+                dependencies = {}
+        with self.stats.phase('detect'):
+            self.find_dependencies(revs, dependencies)
+        listener.replay(revs, dependencies)
+        return listener
+
+    def detector_args(self, recurse=True):
+        return {
+            'recurse': recurse,
             'exclude_commits': [self.base],
             'debug': self.debug,
             'context_lines': self.context_lines,
-        })
-        detector = DependencyDetector(detector_args, self.repo)
+        }
+
+    def find_dependencies(self, revs, dependencies=None):
+        """
+        Find the dependencies of each of the given revs individually,
+        using the cache and/or multiple processes where enabled.
+
+        :param dependencies: dict (or StoredDict) to add the results to
+        :return: dict mapping each rev to a list of
+            (dependency SHA1, cause) tuples
+        """
+        dependencies = self.cached_dependencies(revs, dependencies)
+        # Oldest first, so that blames can be derived from earlier ones
+        revs = [rev for rev in reversed(revs) if rev not in dependencies]
+        # Each rev is stored as soon as it's detected rather than
+        # collecting them all first.
+        for rev, found in self.detect_dependencies(revs):
+            dependencies[rev] = found
+            if self.cache is not None:
+                self.cache.store(rev, found)
+        if self.cache is not None:
+            self.cache.close()
+        return dependencies
+
+    def cached_dependencies(self, revs, dependencies=None):
+        """Return a dict mapping those of revs which are in the cache to
+        their cached dependencies.
+
+        :param dependencies: dict (or StoredDict) to add them to
+        """
+        if dependencies is None:
+            dependencies = {}
+        if self.cache is not None:
+            found = 0
+            for rev in revs:
+                if rev in dependencies:
+                    continue
+                cached = self.cache.lookup(rev)
+                if cached is not None:
+                    dependencies[rev] = cached
+                    found += 1
+            self.logger.debug("%d/%d commits found in dependency cache" %
+                              (found, len(revs)))
+        return dependencies
+
+    def detect_dependencies(self, revs, repo=None):
+        """Detect the dependencies of each of the given revs without
+        recursing, yielding (rev, list of (dependency SHA1, cause))
+        tuples in the same order as revs.
+        """
+        if self.jobs > 1:
+            detector_args = self.detector_args(recurse=False)
+            detector_args['debug'] = False
+            for rev, dependencies, elapsed in parallel.iter_dependencies(
+                    self.repo.path, revs, detector_args, self.jobs,
+                    self.index, self.blame_cache_size):
+                self.stats.record('detect', elapsed, rev)
+                yield rev, dependencies
+            return
+
+        detector = self.detector(recurse=False, repo=repo)
         listener = ExplodeDependencyListener({})
         detector.add_listener(listener)
-
-        revs = GitUtils.rev_list("%s..%s" % (self.base, self.head))
         for rev in revs:
-            try:
+            with self.stats.operation('detect', rev):
                 detector.find_dependencies(rev)
-            except KeyboardInterrupt:
-                pass
-
-        return (detector.commits,
-                listener.dependencies_from(),
-                listener.dependencies_on())
-
-    def explode(self, commits, deps_from, deps_on):
+            dependencies = listener.dependencies(rev)
+            listener.reset()
+            yield rev, dependencies
+
+    def store_dependencies(self, found):
+        if self.cache is not None:
+            for rev, dependencies in found.items():
+                self.cache.store(rev, dependencies)
+            self.cache.close()
+
+    def stream(self):
+        """Explode the commits while their dependencies are still being
+        detected.  The range is walked oldest first in a background
+        thread, so every commit's dependencies have already been
+        exploded by the time its own dependency set is final, at
+        which point it gets planned and cherry-picked straight away.
+
+        Commits are exploded in the order they were made rather than
+        the order in which plan() walks the dependency tree, so the
+        resulting topics may be laid out differently, although they
+        are equally valid.
         """
-        Walk the dependency tree breadth-first starting with the
-        leaves at the bottom.
+        revs = self.rev_list()
+        revs.reverse()
+        done = queue.Queue()
+        listener = ExplodeDependencyListener({}, on_done=done.put)
 
-        For each commit, figure out whether it should be exploded
+        cached = self.cached_dependencies(revs)
+        found = {}
 
-        :param commits: dict mapping SHA1 hashes to pygit2.Commit objects
-        :param deps_from: dict mapping dependents to dependencies
-        :param deps_on: dict mapping in opposite direction
+        def detect():
+            try:
+                # pygit2 repositories must not be shared between threads
+                repo = pygit2.Repository(self.repo.path)
+                pending = [rev for rev in revs if rev not in cached]
+                detected = self.detect_dependencies(pending, repo)
+                for rev in revs:
+                    if rev in cached:
+                        dependencies = cached[rev]
+                    else:
+                        dependencies = next(detected)[1]
+                        found[rev] = dependencies
+                    listener.add_commit(rev)
+                    for dependency, cause in dependencies:
+                        listener.add_commit(dependency)
+                        listener.add_dependency(rev, dependency, cause)
+                    listener.commit_done(rev)
+            except BaseException:
+                done.put(sys.exc_info())
+
+        thread = threading.Thread(target=detect, name='detector')
+        thread.daemon = True
+        thread.start()
+
+        plan = self.explode_plan = ExplodePlan(self.base_commit.hex,
+                                               self.head_commit.hex)
+        self.shas = listener.shas
+        self.current_branch = None
+        with self.stats.phase('stream'):
+            try:
+                self.builder.start()
+                for i in range(len(revs)):
+                    sha = done.get()
+                    if isinstance(sha, tuple):
+                        six.reraise(*sha)
+                    self.logger.debug("Exploding %s" % sha[:8])
+                    steps = len(plan.steps)
+                    commit_id = listener.ids[sha]
+                    self.prepare_cherrypick_base(
+                        commit_id, listener.dependency_ids(commit_id))
+                    self.plan_cherry_pick(commit_id)
+                    for step in plan.steps[steps:]:
+                        self.apply_step(plan, step)
+                thread.join()
+                self.builder.finish()
+            finally:
+                self.builder.cleanup()
+
+        self.store_dependencies(found)
+        self.merges.save()
+        plan.assignments = self.topic_assignments()
+        if self.manifest is not None:
+            self.update_manifest(plan)
+
+    def plan(self, listener):
         """
-        todo = self.get_leaves(commits, deps_from)
-
-        # Each time we explode a commit, we'll remove it from any
-        # dict which is a value of this dict.
-        unexploded_deps_from = copy.deepcopy(deps_from)
-
-        self.logger.debug("Initial queue of leaves:")
-        for commit in todo:
-            self.logger.debug('  ' + GitUtils.commit_summary(commit))
+        Walk the dependency tree starting with the leaves at the
+        bottom, and figure out onto which topic branch each commit
+        should be exploded once all its dependencies have been
+        exploded.  This doesn't touch the repository at all.
+
+        :param listener: ExplodeDependencyListener holding the
+            dependency tree
+        :return: an ExplodePlan
+        """
+        with self.stats.phase('plan'):
+            return self._plan(listener)
+
+    def _plan(self, listener):
+        steps = None
+        if self.store is not None:
+            steps = self.store.steps
+        self.explode_plan = ExplodePlan(self.base_commit.hex,
+                                        self.head_commit.hex, steps)
+        self.shas = listener.shas
+        graph = listener.graph()
+
+        debug = self.logger.isEnabledFor(logging.DEBUG)
+        if debug:
+            self.logger.debug("Initial queue of leaves:")
+            for i in graph.leaves():
+                self.logger.debug('  ' + self.commit_summary(graph.shas[i]))
 
         self.current_branch = None
 
-        while todo:
-            commit = todo.pop(0)
-            sha = commit.hex
-            self.logger.debug("Exploding %s" % GitUtils.commit_summary(commit))
-            if unexploded_deps_from[sha]:
-                abort("BUG: unexploded deps from %s" %
-                      GitUtils.commit_summary(commit))
-
-            deps = deps_from[sha]
-            self.prepare_cherrypick_base(sha, deps, commits)
-            self.cherry_pick(sha)
-
-            self.queue_new_leaves(todo, commit, commits, deps_on,
-                                  unexploded_deps_from)
+        for commit_id in graph.traverse_ids():
+            if debug:
+                self.logger.debug("Planning %s" %
+                                  self.commit_summary(self.shas[commit_id]))
+            self.prepare_cherrypick_base(
+                commit_id, listener.dependency_ids(commit_id))
+            self.plan_cherry_pick(commit_id)
+
+        if self.max_topics is not None:
+            self.coalesce(listener)
+
+        self.explode_plan.assignments = self.topic_assignments()
+        if self.store is not None:
+            self.store.commit()
+        return self.explode_plan
+
+    def coalesce(self, listener):
+        """If the plan has more than max_topics topics, cluster them
+        into that many with as few dependencies between them as
+        possible, and plan again with one topic per cluster.  Each
+        starts on top of the last commit of one of the clusters it
+        depends on, merges in the rest, and then gets all its commits
+        cherry-picked in the same order as before.
+        """
+        topics = {}
+        picks = []
+        for step in self.explode_plan.steps:
+            if step['op'] == 'branch':
+                topics[step['branch']] = len(topics)
+            elif step['op'] == 'pick':
+                picks.append((listener.ids[step['commit']],
+                              topics[step['branch']]))
+        if len(topics) <= self.max_topics:
+            return
 
-    def prepare_cherrypick_base(self, sha, deps, commits):
-        if not deps:
-            branch = self.topic_mgr.next()
+        topic_of = dict(picks)
+        sizes = [0] * len(topics)
+        for commit_id, topic in picks:
+            sizes[topic] += 1
+        edges = [(topic, topic_of[dep_id])
+                 for commit_id, topic in picks
+                 for dep_id in listener.dependency_ids(commit_id)]
+        cluster_of = coalesce_topics(sizes, edges, self.max_topics)
+        clusters = [[] for _ in range(max(cluster_of) + 1)]
+        for commit_id, topic in picks:
+            clusters[cluster_of[topic]].append(commit_id)
+        self.logger.debug("Coalesced %d topics into %d" %
+                          (len(topics), len(clusters)))
+
+        self.explode_plan = ExplodePlan(self.base_commit.hex,
+                                        self.head_commit.hex)
+        self.topic_mgr.reset()
+        self.current_branch = None
+        # For each cluster, the SHA1 of its last commit, and the
+        # clusters whose commits its topic ends up containing
+        tips = []
+        contains = []
+        for cluster, commit_ids in enumerate(clusters):
+            deps = set(cluster_of[topic_of[dep_id]]
+                       for commit_id in commit_ids
+                       for dep_id in listener.dependency_ids(commit_id))
+            deps.discard(cluster)
+            # Clusters which another dependency already contains needn't
+            # be merged in again
+            contained = set()
+            for dep in deps:
+                contained.update(contains[dep])
+            deps = sorted(deps - contained)
+            contains.append(contained.union(deps))
+
+            branch = self.next_topic(self.shas[commit_ids[0]])
+            if deps:
+                self.checkout_new(branch, onto=tips[deps[0]])
+                if len(deps) > 1:
+                    self.explode_plan.merge([tips[dep] for dep in deps[1:]])
+            else:
+                self.checkout_new(branch)
+            for commit_id in commit_ids:
+                self.plan_cherry_pick(commit_id)
+            tips.append(self.shas[commit_ids[-1]])
+
+    def topic_assignments(self):
+        return dict((topic, sorted(self.shas[i] for i in assigned))
+                    for topic, assigned in self.topic_mgr.commits.items())
+
+    def apply(self, plan):
+        """Execute all the steps of the given ExplodePlan, creating the
+        exploded commits and topic branches.  With multiple jobs,
+        independent topic branches are built concurrently, unless the
+        plan is being kept in a GraphStore.
+        """
+        if self.use_journal:
+            self.journal = ExplodeJournal.for_repo(self.repo)
+            self.journal.start(plan, self.builder_kind(),
+                               self.builder.overwrite,
+                               GitExplodeUtils.get_head(), self.store)
+        with self.stats.phase('apply'):
+            try:
+                if self.parallel_apply():
+                    ParallelApplier(self, self.jobs,
+                                    self.in_memory).apply(plan)
+                else:
+                    self.builder.start()
+                    self.apply_steps(plan)
+            finally:
+                if self.journal is not None:
+                    self.journal.close()
+                self.builder.cleanup()
+        self.finish_apply(plan)
+
+    def resume(self, journal):
+        """Continue applying the plan in the given journal, left behind
+        by an explosion which was interrupted, from the last step which
+        was checkpointed.  The rest of the plan is applied serially.
+        """
+        self.journal = journal
+        if journal.store is not None:
+            self.use_store(journal.store)
+        self.exploded.update(journal.exploded)
+        self.tips.update(journal.heads)
+        if self.manifest is not None:
+            for (sha, onto), head in journal.picks.items():
+                self.manifest.record(sha, onto, head)
+        self.logger.debug("Resuming after %d/%d commits" %
+                          (len(journal.exploded),
+                           sum(1 for step in journal.plan.steps
+                               if step['op'] == 'pick')))
+        with self.stats.phase('apply'):
+            try:
+                self.adopt_resolved_pick(journal)
+                self.builder.resume(journal.heads, journal.current,
+                                    journal.orig_head)
+                self.apply_steps(journal.plan)
+            finally:
+                journal.close()
+                self.builder.cleanup()
+        self.finish_apply(journal.plan)
+
+    def adopt_resolved_pick(self, journal):
+        """When building in the working tree, the explosion may have
+        stopped because of a conflicting cherry-pick which the user has
+        since resolved and committed on the topic branch, just as they
+        would for a rebase.  If so, take that as the exploded commit
+        rather than cherry-picking it again.
+        """
+        if journal.builder != 'worktree':
+            return
+        branch = None
+        for step in journal.plan.steps:
+            if step['op'] in ('branch', 'checkout'):
+                branch = step['branch']
+            if not journal.done(step, branch):
+                break
+        else:
+            return
+        if step['op'] != 'pick' or branch not in journal.heads:
+            return
+        ref = self.repo.lookup_branch(branch)
+        if ref is None:
+            return
+        head = ref.target.hex
+        if [p.hex for p in self.repo[head].parents] != [journal.heads[branch]]:
+            return
+        self.logger.debug("Using %s committed on %s for %s" %
+                          (head[:8], branch, step['commit'][:8]))
+        if self.manifest is not None:
+            self.manifest.record(step['commit'], journal.heads[branch], head)
+        self.exploded[step['commit']] = head
+        self.tips[branch] = head
+        journal.record(step, branch, head)
+        # record() doesn't track which commits are exploded, but
+        # apply_steps() needs to know this one is.
+        journal.exploded[step['commit']] = head
+
+    def apply_steps(self, plan):
+        """Apply the steps of the plan in order with self.builder,
+        skipping any which the journal shows were already applied.
+        """
+        branch = None
+        for step in plan.steps:
+            if step['op'] in ('branch', 'checkout'):
+                branch = step['branch']
+            if self.journal is not None and self.journal.done(step, branch):
+                continue
+            if step['op'] in ('merge', 'pick') and \
+               self.builder.current != branch:
+                # The steps before this one on the same branch were
+                # applied by an earlier run.
+                self.builder.checkout(branch)
+            self.apply_step(plan, step)
+        self.builder.finish()
+
+    def finish_apply(self, plan):
+        if self.journal is not None:
+            self.journal.remove()
+            self.journal = None
+        if self.store is not None:
+            self.store.remove()
+            self.store = None
+        self.merges.save()
+        if self.manifest is not None:
+            self.update_manifest(plan)
+
+    def builder_kind(self):
+        """Return how the topic branches are being built, for the
+        journal, so that a resumed explosion builds them the same way.
+        Parallel builds in worktrees are always detached.
+        """
+        if self.in_memory:
+            return 'in-memory'
+        if self.parallel_apply() or \
+           isinstance(self.builder, DetachedWorktreeBuilder):
+            return 'detached'
+        return 'worktree'
+
+    def parallel_apply(self):
+        # Splitting the plan up between jobs needs all of it in memory
+        return self.jobs > 1 and self.store is None
+
+    def apply_step(self, plan, step, builder=None):
+        if builder is None:
+            builder = self.builder
+        with self.stats.operation(step['op'], step.get('commit')):
+            self._apply_step(plan, step, builder)
+        if self.journal is not None:
+            self.checkpoint(step, builder)
+
+    def checkpoint(self, step, builder):
+        if step['op'] == 'checkout':
+            return
+        if step['op'] == 'pick':
+            head = self.exploded[step['commit']]
+        else:
+            head = builder.head()
+        self.journal.record(step, builder.current, head)
+
+    def _apply_step(self, plan, step, builder):
+        op = step['op']
+        if op == 'branch':
+            if 'onto_branch' in step:
+                at = step['onto_branch']
+            elif 'onto' in step:
+                at = self.exploded[step['onto']]
+            elif plan.base == self.base_commit.hex:
+                at = self.base
+            else:
+                at = plan.base
+            builder.checkout_new(step['branch'], at)
+        elif op == 'checkout':
+            builder.checkout(step['branch'])
+        elif op == 'merge':
+            self.merge(step['commits'], builder)
+        elif op == 'pick':
+            self.cherry_pick(step['commit'], step['branch'], builder)
+        else:
+            abort("BUG: unknown step %r in plan" % op)
+
+    def merge(self, commits, builder):
+        """Merge the exploded versions of the given commits into the
+        current branch, reusing an earlier merge of the same commits
+        into the same place if there is one.
+        """
+        theirs = [self.exploded[c] for c in commits]
+        merged = [builder.head()] + theirs
+        result = self.merges.lookup(merged)
+        if result is not None:
+            self.logger.debug("- reusing merge %s" % result[:8])
+            builder.fast_forward(result)
+        else:
+            self.merges.record(merged, builder.merge(*theirs))
+
+    def prepare_cherrypick_base(self, commit_id, dep_ids):
+        """Plan switching to the topic branch onto which the given
+        commit should be cherry-picked, given the IDs of its
+        dependencies.
+        """
+        sha = self.shas[commit_id]
+        if not dep_ids:
+            branch = self.next_topic(sha)
             # We don't assign the topic here, because it will get
-            # assigned by cherry_pick(), and it needs to be done there
-            # to also catch the case where we are cherry-picking to
-            # update an existing branch.
-            self.checkout_new(branch, self.base)
+            # assigned by plan_cherry_pick(), and it needs to be done
+            # there to also catch the case where we are
+            # cherry-picking to update an existing branch.
+            self.checkout_new(branch)
             return
 
-        deps = deps.keys()
-        assert len(deps) >= 1
-        self.logger.debug("  deps: %s" % ' '.join([d[:8] for d in deps]))
+        deps = [self.shas[i] for i in dep_ids]
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("  deps: %s" % ' '.join([d[:8] for d in deps]))
 
-        existing_branch = self.topic_mgr.lookup(*deps)
+        existing_branch = self.topic_mgr.lookup(*dep_ids)
         if len(deps) == 1:
             if existing_branch is None:
-                self.checkout_new_dependent_topic(deps)
+                self.checkout_new_dependent_topic(sha, dep_ids)
             else:
                 branch = existing_branch
                 self.checkout(branch)
         elif len(deps) > 1:
             # We'll need to base the cherry-pick on a merge commit
             if existing_branch is None:
-                self.checkout_new_dependent_topic(deps)
-                to_merge = (self.exploded[dep] for dep in deps[1:])
-                GitExplodeUtils.git('merge', *to_merge)
+                self.checkout_new_dependent_topic(sha, dep_ids)
+                self.explode_plan.merge(deps[1:])
             else:
                 # Can reuse existing merge commit, but
                 # create a new branch at the same point
-                self.checkout_new(branch, existing_branch)
-
-    def queue_new_leaves(self, todo, exploded_commit, commits, deps_on,
-                         unexploded_deps_from):
-        """When a commit is exploded, there may be other commits in the
-        dependency tree which only had a single dependency on this
-        commit.  In that case they have effectively become leaves on
-        the dependency tree of unexploded commits, so they should be
-        added to the explode queue.
-
-        """
-        sha1 = exploded_commit.hex
-        for dependent in deps_on[sha1]:
-            del unexploded_deps_from[dependent][sha1]
-            if not unexploded_deps_from[dependent]:
-                new = commits[dependent]
-                self.logger.debug("+ pushed to queue: %s" %
-                                  GitUtils.commit_summary(new))
-                todo.insert(0, new)
-
-    def get_leaves(self, commits, deps_from):
-        """
-        Return all the leaves of the dependency tree, i.e. commits with
-        no child dependencies
-        """
-        leaves = []
-        for sha, dependencies in six.iteritems(deps_from):
-            if len(dependencies) == 0:
-                leaves.append(commits[sha])
-        return leaves
+                branch = self.next_topic(sha)
+                self.checkout_new(branch, onto_branch=existing_branch)
 
     def checkout(self, branch):
         if self.current_branch == branch:
             return
-        # self.logger.debug("checkout %s" % branch)
-        GitExplodeUtils.checkout(branch)
+        self.explode_plan.checkout(branch)
         self.current_branch = branch
 
-    def checkout_new(self, branch, at):
+    def checkout_new(self, branch, onto=None, onto_branch=None):
         assert self.current_branch != branch
-        # self.logger.debug("checkout -b %s %s" % (branch, at))
-        GitExplodeUtils.checkout_new(branch, at)
+        self.explode_plan.branch(branch, onto, onto_branch)
         self.current_branch = branch
 
-    def checkout_new_dependent_topic(self, deps):
-        branch = self.topic_mgr.register(*deps)
-        base = self.exploded[deps[0]]
-        self.checkout_new(branch, base)
-
-    def cherry_pick(self, sha):
-        GitExplodeUtils.git('cherry-pick', sha)
-        self.update_current_topic(sha)
-        head = GitExplodeUtils.get_head_sha1()
+    def next_topic(self, sha):
+        """Return the name of a new topic branch which sha will be the
+        first commit exploded onto.  When exploding incrementally, this
+        reuses the name of the topic which sha started last time.
+        """
+        branch = None
+        if self.manifest is not None:
+            branch = self.manifest.topic_started_by(sha)
+        if branch is None:
+            branch = self.topic_mgr.next()
+        self.explode_plan.roots[branch] = sha
+        return branch
+
+    def checkout_new_dependent_topic(self, sha, dep_ids):
+        branch = self.next_topic(sha)
+        self.topic_mgr.assign(branch, *dep_ids)
+        self.checkout_new(branch, onto=self.shas[dep_ids[0]])
+
+    def plan_cherry_pick(self, commit_id):
+        self.explode_plan.pick(self.shas[commit_id], self.current_branch)
+        self.update_current_topic(commit_id)
+
+    def cherry_pick(self, sha, branch, builder):
+        head = None
+        if self.manifest is not None or self.picks is not None:
+            onto = builder.head()
+        if self.picks is not None:
+            head = self.picks.get((sha, onto))
+            if head is not None:
+                builder.fast_forward(head)
+                self.logger.debug("- reusing %s from another range" %
+                                  head[:8])
+        if head is None and self.manifest is not None:
+            head = self.manifest.lookup(sha, onto)
+            if head is not None:
+                builder.fast_forward(head)
+                self.logger.debug("- reusing %s from previous explosion" %
+                                  head[:8])
+        if head is None:
+            head = builder.cherry_pick(sha)
+        if self.manifest is not None:
+            self.manifest.record(sha, onto, head)
+        if self.picks is not None:
+            self.picks[(sha, onto)] = head
         self.exploded[sha] = head
-        commit = GitUtils.ref_commit(self.repo, sha)
-        self.logger.debug("- cherry-picked %s as %s (%s)" %
-                          (sha[:8], self.exploded[sha][:8],
-                           GitUtils.oneline(commit)))
+        self.tips[branch] = head
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("- cherry-picked %s as %s (%s)" %
+                              (sha[:8], head[:8],
+                               GitUtils.oneline(self.repo[sha])))
+
+    def commit_summary(self, sha):
+        """Look up the commit only when it's needed for logging, rather
+        than keeping every commit in the range loaded.
+        """
+        return GitUtils.commit_summary(self.repo[sha])
 
     def update_current_topic(self, *commits):
         self.topic_mgr.assign(self.current_branch, *commits)
@@ -3,10 +3,87 @@
 
 from __future__ import print_function, absolute_import
 
+import os
+import shutil
 import subprocess
+import tempfile
+import threading
+import time
+
+
+class GitBatchProcess(object):
+    """A long-lived git process such as ``git cat-file --batch-check``
+    which answers requests written one per line to its stdin, so that
+    we only pay the cost of fork/exec and reading the index and config
+    once rather than on every query.
+
+    """
+    def __init__(self, *args):
+        self.args = args
+        self.name = ' '.join(args)
+        self.proc = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        self.proc = subprocess.Popen(
+            ['git'] + list(self.args),
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            universal_newlines=True, bufsize=1)
+        GitUtils.record_spawn()
+
+    def request(self, lines, expect=None):
+        """Write the given lines to the process, and return the next
+        ``expect`` lines of output (by default, one for each line of
+        input).
+        """
+        if expect is None:
+            expect = len(lines)
+        with self.lock:
+            if self.proc is None:
+                self.start()
+            try:
+                for line in lines:
+                    self.proc.stdin.write(line + '\n')
+                self.proc.stdin.flush()
+                output = [self.proc.stdout.readline() for i in range(expect)]
+            except IOError:
+                # The process exited before reading all the input
+                output = ['']
+            if not all(output):
+                # git exits on errors such as a failed transaction, so
+                # get rid of it, and let the next request start afresh.
+                self.close()
+                raise subprocess.CalledProcessError(
+                    1, ['git'] + list(self.args))
+            return [out.rstrip('\n') for out in output]
+
+    def close(self):
+        if self.proc is None:
+            return
+        try:
+            self.proc.stdin.close()
+        except IOError:
+            pass
+        self.proc.wait()
+        self.proc = None
 
 
 class GitUtils(object):
+    # Long-lived git processes, only used once start_batch() is called
+    batch = None
+    update_ref_batch = None
+
+    # Map each git command to the number of times it was run, and the
+    # total time taken.
+    timings = {}
+    spawns = 0
+    # Serve runs several explosions in threads, which all update them
+    timings_lock = threading.Lock()
+
+    # git worktree add reads the admin files of the other worktrees,
+    # so creating several at once can fail.
+    worktree_lock = threading.Lock()
+
     @classmethod
     def git(cls, *args):
         cmd_words = ['git'] + list(args)
@@ -16,9 +93,107 @@ class GitUtils(object):
     @classmethod
     def quiet_git(cls, *args):
         cmd_words = ['git'] + list(args)
+        start = time.time()
+        cls.record_spawn()
         output = subprocess.check_output(cmd_words, universal_newlines=True)
+        cls._record_timing(args[2] if args[0] == '-C' else args[0], start)
         return output.rstrip()
 
+    @classmethod
+    def start_batch(cls):
+        """Start answering queries and ref updates via long-lived git
+        processes rather than spawning a new one for each call.
+        """
+        cls.batch = GitBatchProcess(
+            'cat-file', '--batch-check=%(objectname)')
+        cls.update_ref_batch = GitBatchProcess('update-ref', '--stdin')
+
+    @classmethod
+    def stop_batch(cls):
+        for proc in (cls.batch, cls.update_ref_batch):
+            if proc is not None:
+                proc.close()
+        cls.batch = cls.update_ref_batch = None
+
+    @classmethod
+    def rev_parse(cls, rev):
+        if cls.batch is None:
+            return cls.quiet_git('rev-parse', rev)
+
+        start = time.time()
+        sha1 = cls.batch.request([rev])[0]
+        cls._record_timing(cls.batch.name, start)
+        if sha1.endswith(' missing'):
+            raise subprocess.CalledProcessError(1, ['git', 'rev-parse', rev])
+        return sha1
+
+    @classmethod
+    def update_refs(cls, updates):
+        """Atomically apply the given list of (ref, new_sha1, old_sha1)
+        tuples; old_sha1 may be None if the old value should not be
+        verified.
+        """
+        lines = []
+        for ref, new, old in updates:
+            if old is None:
+                lines.append('update %s %s' % (ref, new))
+            else:
+                lines.append('update %s %s %s' % (ref, new, old))
+
+        if cls.update_ref_batch is None:
+            start = time.time()
+            proc = subprocess.Popen(['git', 'update-ref', '--stdin'],
+                                    stdin=subprocess.PIPE,
+                                    universal_newlines=True)
+            cls.record_spawn()
+            proc.communicate(''.join(line + '\n' for line in lines))
+            cls._record_timing('update-ref', start)
+            if proc.returncode != 0:
+                raise subprocess.CalledProcessError(
+                    proc.returncode, ['git', 'update-ref', '--stdin'])
+            return
+
+        start = time.time()
+        # update-ref only produces output for the transaction commands
+        cls.update_ref_batch.request(['start'] + lines + ['prepare', 'commit'],
+                                     expect=3)
+        cls._record_timing(cls.update_ref_batch.name, start)
+
+    @classmethod
+    def timing_report(cls):
+        """Return a list of lines summarising how much time was spent in
+        each git command, most expensive first.
+        """
+        spawns, timings = cls.timings_snapshot()
+        lines = ["%d git processes spawned" % spawns]
+        by_total = sorted(timings.items(),
+                          key=lambda item: item[1][1], reverse=True)
+        for cmd, (calls, total) in by_total:
+            lines.append("  %-40s %6d calls %9.3fs %8.2fms/call" %
+                         (cmd, calls, total, 1000.0 * total / calls))
+        return lines
+
+    @classmethod
+    def timings_snapshot(cls):
+        """Return the number of git processes spawned so far, and a copy
+        of the timings of each git command, which other threads can't
+        change underneath the caller.
+        """
+        with cls.timings_lock:
+            return cls.spawns, dict(cls.timings)
+
+    @classmethod
+    def record_spawn(cls):
+        with cls.timings_lock:
+            cls.spawns += 1
+
+    @classmethod
+    def _record_timing(cls, cmd, start):
+        elapsed = time.time() - start
+        with cls.timings_lock:
+            calls, total = cls.timings.get(cmd, (0, 0.0))
+            cls.timings[cmd] = (calls + 1, total + elapsed)
+
     @classmethod
     def get_head(cls):
         """Retrieve the branch or reference to the current HEAD.
@@ -30,12 +205,35 @@ class GitUtils(object):
 
     @classmethod
     def get_head_sha1(cls):
-        return cls.quiet_git('rev-parse', 'HEAD')
+        return cls.rev_parse('HEAD')
+
+    @classmethod
+    def add_worktree(cls, at):
+        """Create a temporary worktree with a detached HEAD at the given
+        commit, and return its path.
+        """
+        path = tempfile.mkdtemp(prefix='git-explode-')
+        with cls.worktree_lock:
+            cls.quiet_git('worktree', 'add', '-q', '--detach', path, at)
+        return path
+
+    @classmethod
+    def remove_worktree(cls, path):
+        with cls.worktree_lock:
+            cls.quiet_git('worktree', 'remove', '--force', path)
+        shutil.rmtree(path, ignore_errors=True)
+
+    @classmethod
+    def valid_branch_name(cls, branch):
+        with open(os.devnull, 'w') as devnull:
+            return subprocess.call(
+                ['git', 'check-ref-format', '--branch', branch],
+                stdout=devnull, stderr=devnull) == 0
 
     @classmethod
     def checkout(cls, branch):
         cls.git('checkout', '-q', branch)
 
     @classmethod
-    def checkout_new(cls, branch, at):
-        cls.git('checkout', '-q', '-b', branch, at)
+    def checkout_new(cls, branch, at, force=False):
+        cls.git('checkout', '-q', '-B' if force else '-b', branch, at)
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, absolute_import
+
+from array import array
+from collections import deque
+
+from git_deps.utils import abort
+
+
+class DependencyGraph(object):
+    """Compact representation of the dependency tree used to decide the
+    order in which commits get exploded.
+
+    Commits are identified by their position in a list of SHA1s, and
+    the edges from each commit to its dependents are stored in
+    compressed sparse row form, i.e. as a flat array of dependent
+    indices plus an array of offsets into it.  This keeps traversal
+    linear in the size of the graph, and avoids holding yet another
+    copy of the nested dicts the listener builds.
+
+    """
+    def __init__(self, listener):
+        """Build the graph straight from the arrays kept by an
+        ExplodeDependencyListener, using its commit IDs as indices.
+        """
+        self.shas = listener.shas
+
+        # Number of dependencies of each commit which haven't been
+        # exploded yet
+        self.remaining = array('l', (len(edges) // 3
+                                     for edges in listener.edges))
+
+        # dependents[offsets[i]:offsets[i + 1]] are the dependents of
+        # commit i, in the order they were added to the listener.
+        self.offsets = array('l', [0])
+        self.dependents = array('l')
+        for dependents in listener.dependents:
+            self.dependents.extend(dependents)
+            self.offsets.append(len(self.dependents))
+
+    def __len__(self):
+        return len(self.shas)
+
+    def leaves(self):
+        """
+        Return the indices of all the leaves of the dependency tree,
+        i.e. commits with no child dependencies
+        """
+        return [i for i, n in enumerate(self.remaining) if n == 0]
+
+    def traverse(self):
+        """Yield the SHA1 of each commit in the order in which it should
+        be exploded, starting with the leaves at the bottom.  Once a
+        commit is exploded, any dependents which have no other
+        unexploded dependencies are pushed to the front of the queue,
+        so that each topic gets built up as far as possible before
+        moving on to the next one.
+        """
+        for i in self.traverse_ids():
+            yield self.shas[i]
+
+    def traverse_ids(self):
+        """Like traverse(), but yield the index of each commit."""
+        todo = deque(self.leaves())
+        while todo:
+            i = todo.popleft()
+            if self.remaining[i]:
+                abort("BUG: unexploded deps from %s" % self.shas[i])
+            yield i
+            self.queue_new_leaves(todo, i)
+
+    def dependents_of(self, i):
+        """Return the indices of the commits which depend on commit i."""
+        return self.dependents[self.offsets[i]:self.offsets[i + 1]]
+
+    def queue_new_leaves(self, todo, exploded):
+        """When a commit is exploded, there may be other commits in the
+        dependency tree which only had a single dependency on this
+        commit.  In that case they have effectively become leaves on
+        the dependency tree of unexploded commits, so they should be
+        added to the explode queue.
+
+        """
+        for dependent in self.dependents_of(exploded):
+            self.remaining[dependent] -= 1
+            if self.remaining[dependent] == 0:
+                todo.appendleft(dependent)
@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, absolute_import
+
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from git_explode.plan import ExplodePlan
+from git_explode.store import GraphStore
+
+
+class ExplodeJournal(object):
+    """Checkpoints the progress of applying an ExplodePlan, so that an
+    explosion which gets interrupted part way through (by a conflict,
+    running out of memory, a CI timeout etc.) can be continued from
+    where it stopped rather than started again from scratch.
+
+    The journal is a file of JSON lines.  The first holds the plan
+    itself, together with how it was being built; every later one is
+    appended as soon as a step has been applied, recording the step and
+    the resulting head of the branch it was applied to.  Checkout steps
+    don't change anything so aren't recorded.  Appending a line per step
+    keeps the cost of checkpointing independent of the size of the
+    range.
+
+    When exploding with --low-memory, the plan's steps are left in the
+    GraphStore they were planned into, and the header only says where
+    that is.  Which commits have been exploded is only read back by
+    load(), since no step gets applied twice in the same run.
+
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.file = None
+
+        # The plan being applied and how it was being built
+        self.plan = None
+        self.builder = None
+        self.overwrite = False
+        self.orig_head = None
+        self.store = None
+
+        # Map commits to their exploded version
+        self.exploded = OrderedDict()
+        # Map topic branches to their current heads
+        self.heads = OrderedDict()
+        # Map (source commit, onto) pairs to their exploded version, for
+        # the manifest
+        self.picks = OrderedDict()
+        # Topic branches which have been created / had merges done
+        self.created = set()
+        self.merged = set()
+        # The branch the last recorded step was applied to
+        self.current = None
+
+    @classmethod
+    def for_repo(cls, repo):
+        return cls(os.path.join(repo.path, 'git-explode', 'journal'))
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def start(self, plan, builder, overwrite, orig_head, store=None):
+        """Begin a new journal for applying plan, replacing any old one.
+
+        :param builder: 'worktree', 'detached' or 'in-memory'
+        :param overwrite: whether existing topic branches get updated
+        :param orig_head: what was checked out before starting
+        :param store: GraphStore holding the plan's steps, if any
+        """
+        directory = os.path.dirname(self.path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.plan = plan
+        self.builder = builder
+        self.overwrite = overwrite
+        self.orig_head = orig_head
+        self.store = store
+        self.file = open(self.path, 'w')
+        header = OrderedDict([
+            ('builder', builder),
+            ('overwrite', overwrite),
+            ('orig_head', orig_head),
+            ('plan', plan.to_dict(steps=store is None)),
+        ])
+        if store is not None:
+            header['store'] = store.path
+        self._write(header)
+
+    def load(self):
+        """Read back a journal written by an interrupted explosion, and
+        reopen it so that further steps get appended.
+        """
+        with open(self.path) as f:
+            lines = f.readlines()
+        header = json.loads(lines[0], object_pairs_hook=OrderedDict)
+        steps = None
+        if 'store' in header:
+            self.store = GraphStore(header['store'], reset=False)
+            steps = self.store.steps
+        self.plan = ExplodePlan.from_dict(header['plan'], steps)
+        self.builder = header['builder']
+        self.overwrite = header['overwrite']
+        self.orig_head = header['orig_head']
+        # JSON is written as ASCII, so characters are bytes
+        size = len(lines[0])
+        for line in lines[1:]:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # The last line may be incomplete if we got killed
+                # while writing it, so drop it before appending more.
+                break
+            self._advance(entry)
+            if entry['op'] == 'pick':
+                self.exploded[entry['commit']] = entry['head']
+                self.picks[(entry['commit'], entry['onto'])] = entry['head']
+            size += len(line)
+        self.file = open(self.path, 'a')
+        self.file.truncate(size)
+
+    def _advance(self, entry):
+        op, branch, head = entry['op'], entry['branch'], entry['head']
+        if op == 'branch':
+            self.created.add(branch)
+        elif op == 'merge':
+            self.merged.add(branch)
+        self.heads[branch] = head
+        self.current = branch
+
+    def record(self, step, branch, head):
+        """Record that step has been applied, leaving branch at head."""
+        op = step['op']
+        if op == 'checkout':
+            return
+        entry = OrderedDict([('op', op), ('branch', branch),
+                             ('head', head)])
+        with self.lock:
+            if op == 'pick':
+                entry['commit'] = step['commit']
+                # Picks are always onto the head left by the previous
+                # step on the same branch.
+                entry['onto'] = self.heads.get(branch)
+            self._write(entry)
+            self._advance(entry)
+
+    def done(self, step, branch):
+        """Return whether the given step, applied to branch, has already
+        been recorded.
+        """
+        op = step['op']
+        if op == 'branch':
+            return branch in self.created
+        if op == 'merge':
+            return branch in self.merged
+        if op == 'pick':
+            return step['commit'] in self.exploded
+        return False
+
+    def remove(self):
+        """Throw away the journal once the explosion has completed."""
+        self.close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def _write(self, entry):
+        self.file.write(json.dumps(entry) + '\n')
+        # Flushing is enough to survive the process being killed,
+        # which is what matters here, without the cost of an fsync.
+        self.file.flush()
@@ -1,38 +1,144 @@
+from array import array
+from collections import deque
+
 from git_deps.listener.base import DependencyListener
+from git_explode.graph import DependencyGraph
 
 
 class ExplodeDependencyListener(DependencyListener):
     """Dependency listener for use when building a dependency tree to be
     used for exploding the commits into multiple topic branches.
+
+    Since ranges can contain thousands of commits and hundreds of
+    thousands of dependency edges, commits are interned to small
+    integer IDs in the order they are first seen, and the edges are
+    kept in flat arrays of IDs rather than nested dicts of SHA1s.  The
+    cause of each edge is kept as an interned path ID plus a line
+    number, and only formatted as "path:line" when asked for.
     """
 
-    def __init__(self, options):
+    def __init__(self, options, on_done=None):
+        """
+        :param on_done: optional callback which is passed the SHA1 of
+            each commit as soon as all its dependencies are known
+        """
         super(ExplodeDependencyListener, self).__init__(options)
+        self.on_done = on_done
+        self.reset()
+
+    def reset(self):
+        """Forget every commit seen so far."""
+        # Map each SHA1 to its ID, and each ID back to its SHA1
+        self.ids = {}
+        self.shas = []
 
-        # Map each commit to a dict whose keys are the dependencies of
-        # that commit which haven't yet been exploded into a topic
-        # branch.
-        self._dependencies_from = {}
-        self._dependencies_on = {}
+        # For each commit ID, a flat array of (dependency ID, path ID,
+        # line number) triples, and an array of dependent IDs, both in
+        # the order the dependencies were found.
+        self.edges = []
+        self.dependents = []
+
+        self.path_ids = {}
+        self.paths = []
 
     def new_commit(self, commit):
         """Adds the commit if it doesn't already exist.
         """
-        sha1 = commit.hex
-        for d in (self._dependencies_from, self._dependencies_on):
-            if sha1 not in d:
-                d[sha1] = {}
+        self.add_commit(commit.hex)
 
     def new_dependency(self, dependee, dependency, path, line_num):
-        src = dependee.hex
-        dst = dependency.hex
+        self.add_edge(self.add_commit(dependee.hex),
+                      self.add_commit(dependency.hex), path, line_num)
+
+    def dependent_done(self, dependent, dependencies):
+        self.commit_done(dependent.hex)
+
+    def add_commit(self, sha1):
+        """Adds the commit if it doesn't already exist, and returns its
+        ID.
+        """
+        commit_id = self.ids.get(sha1)
+        if commit_id is None:
+            commit_id = self.ids[sha1] = len(self.shas)
+            self.shas.append(sha1)
+            self.edges.append(array('l'))
+            self.dependents.append(array('l'))
+        return commit_id
+
+    def add_dependency(self, src, dst, cause):
+        """
+        :param src: SHA1 of the dependent
+        :param dst: SHA1 of the dependency
+        :param cause: "path:line" string
+        """
+        path, line_num = cause.rsplit(':', 1)
+        self.add_edge(self.ids[src], self.ids[dst], path, int(line_num))
+
+    def add_edge(self, src_id, dst_id, path, line_num):
+        path_id = self.path_ids.get(path)
+        if path_id is None:
+            path_id = self.path_ids[path] = len(self.paths)
+            self.paths.append(path)
+        self.edges[src_id].extend((dst_id, path_id, line_num))
+        self.dependents[dst_id].append(src_id)
+
+    def dependency_ids(self, commit_id):
+        """Return the IDs of the dependencies of the given commit."""
+        return self.edges[commit_id][::3]
+
+    def dependent_ids(self, commit_id):
+        """Return the IDs of the commits which depend on the given one."""
+        return self.dependents[commit_id]
 
-        cause = "%s:%d" % (path, line_num)
-        self._dependencies_from[src][dst] = cause
-        self._dependencies_on[dst][src] = cause
+    def graph(self):
+        """Return a DependencyGraph of the tree for traversing it."""
+        return DependencyGraph(self)
 
-    def dependencies_from(self):
-        return self._dependencies_from
+    def dependencies(self, sha1):
+        """Return a list of (dependency SHA1, cause) tuples for the given
+        commit, or an empty list if it's unknown.
+        """
+        commit_id = self.ids.get(sha1)
+        if commit_id is None:
+            return []
+        edges = self.edges[commit_id]
+        return [(self.shas[edges[i]],
+                 "%s:%d" % (self.paths[edges[i + 1]], edges[i + 2]))
+                for i in range(0, len(edges), 3)]
+
+    def commit_done(self, sha1):
+        if self.on_done is not None:
+            self.on_done(sha1)
+
+    def replay(self, revs, dependencies):
+        """Add dependencies which were detected elsewhere, e.g. by
+        worker processes.  Commits and dependencies are added in
+        exactly the same order that a recursive DependencyDetector
+        would have discovered them when processing revs in turn, so
+        that the result does not depend on how the detection was
+        performed.
+
+        :param revs: list of SHA1s in the order they would have been
+            passed to DependencyDetector.find_dependencies()
+        :param dependencies: dict mapping each SHA1 to a list of
+            (dependency SHA1, cause) tuples in the order they were
+            detected
+        """
+        done = set()
+        for rev in revs:
+            todo = deque([rev])
+            queued = set(todo)
+            while todo:
+                sha1 = todo.popleft()
+                queued.discard(sha1)
+                if sha1 in done:
+                    continue
 
-    def dependencies_on(self):
-        return self._dependencies_on
+                self.add_commit(sha1)
+                for dependency, cause in dependencies.get(sha1, []):
+                    self.add_commit(dependency)
+                    self.add_dependency(sha1, dependency, cause)
+                    if dependency not in done and dependency not in queued:
+                        todo.append(dependency)
+                        queued.add(dependency)
+                done.add(sha1)
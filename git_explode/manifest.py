@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, absolute_import
+
+import json
+import os
+
+
+class ExplodeManifest(object):
+    """Records the results of an explosion so that a later explosion
+    can reuse them rather than redoing all the work.
+
+    Cherry-picking a given source commit onto a given base always
+    produces the same tree, so every exploded commit is recorded
+    against the (source, onto) pair which produced it.  As long as
+    that commit still exists, a later run which needs to cherry-pick
+    the same source onto the same base can simply reuse it.
+
+    """
+    def __init__(self, path, repo):
+        self.path = path
+        self.repo = repo
+        self.load()
+
+        # The same information for the current explosion
+        self.picks = {}
+        self.topics = {}
+        self.branches = {}
+        self.roots = {}
+
+    def load(self):
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                self.previous = json.load(f)
+        else:
+            self.previous = {'picks': {}, 'topics': {}, 'branches': {},
+                             'roots': {}}
+        # Map the first commit exploded onto each previous topic branch
+        # to the branch
+        self.started = dict((root, topic) for topic, root
+                            in self.previous['roots'].items())
+
+    def lookup(self, sha1, onto):
+        """Return the SHA1 of a previously exploded version of the given
+        commit on top of onto, or None if there isn't one.
+        """
+        exploded = self.previous['picks'].get(self._key(sha1, onto))
+        if exploded is None or exploded not in self.repo:
+            return None
+        if self.repo[exploded].parents[0].hex != onto:
+            return None
+        return exploded
+
+    def record(self, sha1, onto, exploded):
+        self.picks[self._key(sha1, onto)] = exploded
+
+    def topic_started_by(self, sha1):
+        """Return the name of the topic branch which the given commit was
+        the first to be exploded onto, or None.
+        """
+        return self.started.get(sha1)
+
+    def record_branches(self, topics, tips, roots):
+        """
+        :param topics: dict mapping topic branches to the commits
+            TopicManager last assigned them
+        :param tips: dict mapping topic branches to their tips
+        :param roots: dict mapping topic branches to the first commit
+            exploded onto them
+        """
+        self.topics = dict(topics)
+        self.branches = dict(tips)
+        self.roots = dict(roots)
+
+    def stale_branches(self):
+        """Return a dict mapping topic branches created by the previous
+        explosion but not by the current one to their old tips.
+        """
+        return dict((branch, tip)
+                    for branch, tip in self.previous['branches'].items()
+                    if branch not in self.branches)
+
+    def keep_branch(self, branch):
+        """Carry a topic branch of the previous explosion over into this
+        one, so that it's still known about next time.
+        """
+        self.branches[branch] = self.previous['branches'][branch]
+        root = self.previous['roots'].get(branch)
+        if root is not None:
+            self.roots[branch] = root
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({
+                'picks': self.picks,
+                'topics': self.topics,
+                'branches': self.branches,
+                'roots': self.roots,
+            }, f, indent=2, sort_keys=True)
+        os.rename(tmp, self.path)
+
+    def _key(self, sha1, onto):
+        return '%s:%s' % (sha1, onto)
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, absolute_import
+
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+
+class MergeCache(object):
+    """Remembers the merge commits created while building topic
+    branches, keyed by the set of commits which were merged together
+    (including the one merged into), so that when several topics need
+    the same exploded commits merged, the merge is only done once and
+    its commit is reused.  Merging the same set of commits gives the
+    same tree whichever order they are merged in.
+
+    If given a path, the cache is also kept there for later runs.  This
+    pays off when exploding incrementally, since the exploded commits
+    which get merged are then reused too.  Merge commits which have
+    since been garbage collected are ignored, and only the most
+    recently used merges are kept, both in memory and on disk.
+
+    """
+    DEFAULT_MAX_MERGES = 10000
+
+    def __init__(self, repo, path=None, max_merges=DEFAULT_MAX_MERGES):
+        """
+        :param repo: pygit2.Repository
+        :param path: path to the JSON file to keep the cache in, or
+            None to only cache merges for the current run
+        :param max_merges: maximum number of merges to keep
+        """
+        self.repo = repo
+        self.path = path
+        self.max_merges = max_merges
+        self.merges = OrderedDict()
+        self.hits = self.misses = 0
+        self.lock = threading.Lock()
+        if path is not None and os.path.exists(path):
+            self.load()
+
+    def load(self):
+        with open(self.path) as f:
+            for merged, result in json.load(f):
+                self.merges[frozenset(merged)] = result
+
+    def lookup(self, shas):
+        """Return the SHA1 of a merge of exactly the given commits, or
+        None if there isn't one.
+        """
+        key = frozenset(shas)
+        with self.lock:
+            result = self.merges.pop(key, None)
+            if result is None or result not in self.repo:
+                self.misses += 1
+                return None
+            self.hits += 1
+            # Most recently used last
+            self.merges[key] = result
+            return result
+
+    def record(self, shas, result):
+        with self.lock:
+            self.merges[frozenset(shas)] = result
+            if len(self.merges) > self.max_merges:
+                # Least recently used first
+                self.merges.popitem(last=False)
+
+    def save(self):
+        if self.path is None:
+            return
+        directory = os.path.dirname(self.path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        with self.lock:
+            merges = [[sorted(merged), result]
+                      for merged, result in self.merges.items()]
+        # Several explosions may be saving to the same path at once,
+        # e.g. jobs in git-explode serve, so each writes its own
+        # temporary file and the last one to finish wins.
+        fd, tmp = tempfile.mkstemp(dir=directory,
+                                   prefix=os.path.basename(self.path))
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(merges, f)
+            os.rename(tmp, self.path)
+        except BaseException:
+            os.remove(tmp)
+            raise
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Detection of commit dependencies using a pool of worker processes.
+
+Each worker has its own pygit2 Repository and ExplodeDependencyDetector
+(sharing a copy of the PathIndex built by the parent process, and with
+its own BlameCache), and detects the dependencies of one rev at a time
+without recursing, which is sufficient because every dependency which
+isn't excluded by the base is itself in the range being exploded.
+"""
+
+from __future__ import print_function, absolute_import
+
+import multiprocessing
+import time
+
+import pygit2
+from ostruct import OpenStruct
+
+from git_explode.blame import BlameCache
+from git_explode.detector import ExplodeDependencyDetector
+from git_explode.listener import ExplodeDependencyListener
+
+# Per-process state, set up by _init_worker()
+_detector = None
+_listener = None
+
+
+def _init_worker(repo_path, detector_args, index, blame_cache_size):
+    global _detector, _listener
+    repo = pygit2.Repository(repo_path)
+    blame_cache = None
+    if index is not None and blame_cache_size:
+        blame_cache = BlameCache(index, blame_cache_size)
+    _detector = ExplodeDependencyDetector(OpenStruct(detector_args), repo,
+                                          index=index,
+                                          blame_cache=blame_cache)
+    _listener = ExplodeDependencyListener({})
+    _detector.add_listener(_listener)
+
+
+def _find_dependencies(rev):
+    start = time.time()
+    _detector.find_dependencies(rev)
+    dependencies = _listener.dependencies(rev)
+    _listener.reset()
+    return rev, dependencies, time.time() - start
+
+
+def iter_dependencies(repo_path, revs, detector_args, jobs, index=None,
+                      blame_cache_size=0):
+    """Detect the dependencies of all the given revs in parallel.
+
+    :param repo_path: path to the repository
+    :param revs: list of SHA1s whose dependencies should be detected
+    :param detector_args: dict of options for DependencyDetector;
+        recursion is always disabled
+    :param jobs: number of worker processes to use
+    :param index: optional PathIndex for the range
+    :param blame_cache_size: maximum lines in each worker's BlameCache,
+        or 0 to disable it
+    :return: iterator of (rev, dependencies, seconds) tuples in the
+        same order as revs, each yielded as soon as it is available,
+        where dependencies is a list of (dependency SHA1, cause)
+        tuples and seconds is how long the detection took
+    """
+    detector_args = dict(detector_args, recurse=False)
+    chunksize = max(1, len(revs) // (jobs * 4))
+    pool = multiprocessing.Pool(jobs, _init_worker,
+                                (repo_path, detector_args, index,
+                                 blame_cache_size))
+    try:
+        for result in pool.imap(_find_dependencies, revs, chunksize):
+            yield result
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, absolute_import
+
+from bisect import bisect_right
+
+
+class PathIndex(object):
+    """Index of which paths are touched by each commit in the range
+    being exploded, built once per run from tree diffs (which are cheap
+    since no file contents need to be compared).
+
+    A commit can only depend on commits in the range which touched the
+    same paths before it did, so if none did, there is no point
+    blaming that path at all, and if that holds for every path the
+    commit touches, it has no dependencies.
+
+    """
+    def __init__(self, base, revs, paths, touched):
+        """
+        :param base: SHA1 of the base of the range
+        :param revs: list of SHA1s of the commits in the range, oldest
+            first
+        :param paths: dict mapping the SHA1 of each commit in the range
+            to the paths it touches
+        :param touched: dict mapping each path to the ascending list of
+            positions in revs of the commits which touched it
+        """
+        self.base = base
+        self.revs = revs
+        self.positions = dict((sha1, i) for i, sha1 in enumerate(revs))
+        self.paths = paths
+        self.touched = touched
+
+    @classmethod
+    def build(cls, repo, base, revs):
+        """
+        :param repo: pygit2.Repository
+        :param base: SHA1 of the base of the range
+        :param revs: list of SHA1s of the commits in the range, oldest
+            first
+        """
+        paths = {}
+        touched = {}
+        for position, sha1 in enumerate(revs):
+            commit = repo[sha1]
+            if not commit.parents:
+                continue
+            diff = repo.diff(commit.parents[0].tree, commit.tree)
+            # Without rename detection a rename shows up as a deletion
+            # plus an addition, so both paths get recorded.
+            commit_paths = set()
+            for delta in diff.deltas:
+                commit_paths.add(delta.old_file.path)
+                commit_paths.add(delta.new_file.path)
+            paths[sha1] = tuple(sorted(commit_paths))
+            for path in paths[sha1]:
+                touched.setdefault(path, []).append(position)
+        return cls(base, list(revs), paths, touched)
+
+    def __contains__(self, sha1):
+        return sha1 in self.positions
+
+    def touched_before(self, path, sha1):
+        """Return whether any commit in the range before sha1 touched
+        path.  If sha1 isn't in the range, be conservative.
+        """
+        if sha1 not in self.positions:
+            return True
+        touched = self.touched.get(path)
+        return touched is not None and touched[0] < self.positions[sha1]
+
+    def last_touched(self, path, sha1):
+        """Return the SHA1 of the last commit in the range up to and
+        including sha1 which touched path, or the base if there was
+        none.  If sha1 isn't in the range, just return it.
+        """
+        if sha1 not in self.positions:
+            return sha1
+        touched = self.touched.get(path, [])
+        i = bisect_right(touched, self.positions[sha1])
+        return self.revs[touched[i - 1]] if i else self.base
+
+    def may_have_dependencies(self, sha1):
+        """Return whether any of the paths touched by sha1 were touched
+        by an earlier commit in the range.
+        """
+        if sha1 not in self.paths:
+            return True
+        return any(self.touched_before(path, sha1)
+                   for path in self.paths[sha1])
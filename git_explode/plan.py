@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, absolute_import
+
+import json
+from collections import OrderedDict
+
+
+class ExplodePlan(object):
+    """The result of the planning phase of an explosion: an ordered list
+    of steps which, when applied, create the topic branches.
+
+    Steps refer to commits by the SHA1 of the original commit on the
+    source branch; when a step needs the exploded version of a commit
+    (e.g. to start a new topic branch on top of it), it is looked up at
+    apply time.  Each step is a dict with an 'op' key:
+
+    - branch: create 'branch' on top of the exploded version of
+      'onto', or the existing 'onto_branch', or the base if neither
+      is given, and switch to it
+    - checkout: switch to the existing 'branch'
+    - merge: merge the exploded versions of 'commits' into the
+      current branch
+    - pick: cherry-pick 'commit' onto the current branch, 'branch'
+
+    """
+    def __init__(self, base, head, steps=None, roots=None,
+                 assignments=None):
+        """
+        :param base: SHA1 of the base of the range being exploded
+        :param head: SHA1 of the head of the range being exploded
+        :param steps: list of steps, or anything else which supports
+            appending to and iterating over them, e.g. StoredSteps
+        :param roots: dict mapping topic branches to the first commit
+            exploded onto them
+        :param assignments: dict mapping topic branches to the commits
+            they were last assigned by TopicManager
+        """
+        self.base = base
+        self.head = head
+        self.steps = [] if steps is None else steps
+        self.roots = roots or {}
+        self.assignments = assignments or {}
+
+    def branch(self, branch, onto=None, onto_branch=None):
+        step = OrderedDict([('op', 'branch'), ('branch', branch)])
+        if onto is not None:
+            step['onto'] = onto
+        if onto_branch is not None:
+            step['onto_branch'] = onto_branch
+        self.steps.append(step)
+
+    def checkout(self, branch):
+        self.steps.append(OrderedDict([('op', 'checkout'),
+                                       ('branch', branch)]))
+
+    def merge(self, commits):
+        self.steps.append(OrderedDict([('op', 'merge'),
+                                       ('commits', list(commits))]))
+
+    def pick(self, commit, branch):
+        self.steps.append(OrderedDict([('op', 'pick'),
+                                       ('commit', commit),
+                                       ('branch', branch)]))
+
+    def topics(self):
+        """Return a dict mapping each topic branch to the list of commits
+        which get cherry-picked onto it, in order.
+        """
+        topics = OrderedDict()
+        for step in self.steps:
+            if step['op'] == 'pick':
+                topics.setdefault(step['branch'], []).append(step['commit'])
+        return topics
+
+    def merges(self):
+        """Return a list of the merges which will be needed, each as a dict
+        giving the topic branch and the commits merged into it.
+        """
+        merges = []
+        branch = None
+        for step in self.steps:
+            if step['op'] in ('branch', 'checkout'):
+                branch = step['branch']
+            elif step['op'] == 'merge':
+                merges.append(OrderedDict([('branch', branch),
+                                           ('commits', step['commits'])]))
+        return merges
+
+    def to_dict(self, steps=True):
+        """
+        :param steps: whether to include the steps, and the topics and
+            merges derived from them, rather than just the range and the
+            topic assignments
+        """
+        d = OrderedDict([('base', self.base), ('head', self.head)])
+        if steps:
+            d['topics'] = self.topics()
+            d['merges'] = self.merges()
+        d['roots'] = self.roots
+        d['assignments'] = self.assignments
+        if steps:
+            d['steps'] = self.steps
+        return d
+
+    @classmethod
+    def from_dict(cls, d, steps=None):
+        """
+        :param steps: the steps, if they were left out of d
+        """
+        return cls(d['base'], d['head'], d.get('steps', steps),
+                   d.get('roots'), d.get('assignments'))
+
+    def dump(self, f):
+        json.dump(self.to_dict(), f, indent=2)
+        f.write('\n')
+
+    @classmethod
+    def load(cls, f):
+        return cls.from_dict(json.load(f, object_pairs_hook=OrderedDict))
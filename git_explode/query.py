@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+``git-explode deps`` and ``git-explode explain``: answer questions
+about the dependencies between commits from those kept in the
+dependency cache by ``--cache``, rather than detecting them again.
+
+Answering from the cache only needs git itself and SQLite, so pygit2
+and git-deps' detector are only imported when dependencies which
+aren't cached yet have to be detected.
+"""
+
+from __future__ import print_function, absolute_import
+
+import os
+import subprocess
+import sys
+
+from git_deps.utils import abort
+from git_explode.cache import DependencyCache
+from git_explode.gitutils import GitUtils as GitExplodeUtils
+
+
+def deps(args):
+    """List everything COMMIT depends on, directly or indirectly.
+
+    :param args: parsed command line of ``git-explode deps``
+    """
+    git_dir, sha1, base = resolve(args.commit, args.base)
+    cache = open_cache(git_dir, sha1, base, args)
+    try:
+        closure = cache.closure(sha1)
+    finally:
+        cache.close()
+    subjects = read_subjects([dependency for dependency, _ in closure[1:]])
+    for dependency, known in closure[1:]:
+        print("%s %s" % (dependency, subjects[dependency]))
+        if not known:
+            print("warning: dependencies of %s are not known" %
+                  dependency[:8], file=sys.stderr)
+
+
+def explain(args):
+    """Show why DEPENDENT depends on DEPENDENCY, as the shortest chain
+    of dependencies from one to the other, with the line which caused
+    each of them.
+
+    :param args: parsed command line of ``git-explode explain``
+    """
+    git_dir, dependent, dependency, base = resolve(
+        args.dependent, args.dependency, args.base)
+    cache = open_cache(git_dir, dependent, base, args)
+    try:
+        chain = cache.chain(dependent, dependency)
+    finally:
+        cache.close()
+    subjects = read_subjects([dependent, dependency] +
+                             [sha1 for sha1, _ in chain or []])
+    if chain is None:
+        print("%s does not depend on %s" %
+              (summary(dependent, subjects), summary(dependency, subjects)))
+        sys.exit(1)
+    print(summary(dependent, subjects))
+    for sha1, cause in chain:
+        print("  -> %s (%s)" % (summary(sha1, subjects), cause))
+
+
+def resolve(*revs):
+    """Return the repository's git directory followed by the SHA1 of
+    each of the given commits, or None for those which are None.
+    """
+    given = [rev for rev in revs if rev is not None]
+    try:
+        output = GitExplodeUtils.quiet_git(
+            'rev-parse', '--absolute-git-dir',
+            *['%s^{commit}' % rev for rev in given])
+    except subprocess.CalledProcessError:
+        abort("fatal: invalid commit: %s" % ' '.join(given))
+    lines = output.split('\n')
+    sha1s = dict(zip(given, lines[1:]))
+    return [lines[0]] + [sha1s.get(rev) for rev in revs]
+
+
+def open_cache(git_dir, sha1, base, args):
+    """Return the dependency cache, set up to look up the dependencies
+    of sha1 and the commits it depends on.
+
+    With a base, they are looked up as detected when exploding a
+    range from there, and are detected first if they haven't been
+    yet.  Otherwise, whichever base they were last detected from is
+    used.
+    """
+    path = os.path.join(git_dir, 'git-explode', 'dependencies.sqlite')
+    if base is not None:
+        cache = DependencyCache(path, args.context_lines, base)
+        if cache.lookup(sha1) is None:
+            detect(git_dir, args.base, sha1, args)
+            if cache.lookup(sha1) is None:
+                cache.close()
+                abort("fatal: %s is not in %s..%s" %
+                      (sha1[:8], args.base, sha1[:8]))
+        return cache
+
+    cache = None
+    boundaries = []
+    if os.path.exists(path):
+        cache = DependencyCache(path, args.context_lines, None)
+        boundaries = cache.boundaries(sha1)
+    if not boundaries:
+        if cache is not None:
+            cache.close()
+        abort("fatal: the dependencies of %s are not known; explode a "
+              "range containing it with --cache, or give --base" %
+              sha1[:8])
+    cache.boundary = boundaries[0]
+    return cache
+
+
+def detect(git_dir, base, sha1, args):
+    """Detect the dependencies of every commit in base..sha1 which
+    aren't already in the dependency cache, and add them to it.
+    """
+    import pygit2
+    from git_explode.exploder import GitExploder
+
+    exploder = GitExploder(pygit2.Repository(git_dir), base, sha1,
+                           args.debug, args.context_lines, cache=True)
+    GitExplodeUtils.start_batch()
+    try:
+        exploder.get_dependencies()
+    finally:
+        GitExplodeUtils.stop_batch()
+
+
+def read_subjects(sha1s):
+    """Return a dict mapping each of the given commits to its subject."""
+    if not sha1s:
+        return {}
+    output = GitExplodeUtils.quiet_git(
+        'log', '--no-walk=unsorted', '--format=%H %s', *set(sha1s))
+    return dict(line.split(' ', 1) if ' ' in line else (line, '')
+                for line in output.split('\n'))
+
+
+def summary(sha1, subjects):
+    return "%s %s" % (sha1[:8], subjects[sha1])
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, absolute_import
+
+import sys
+import threading
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+
+import pygit2
+import six
+from six.moves import queue
+
+from git_explode.builders import (DetachedWorktreeBuilder, InMemoryBuilder,
+                                  write_branches)
+from git_explode.gitutils import GitUtils as GitExplodeUtils
+
+
+def split_segments(steps):
+    """Split the steps of an ExplodePlan into segments, each of which
+    starts by switching to a topic branch and then builds on it, and
+    work out which earlier segments each one has to wait for.
+
+    :return: list of (steps, set of indices of segments it depends on)
+    """
+    segments = []
+    # Map each commit to the segment which picks it, and each branch
+    # to the last segment which built on it.
+    picked_by = {}
+    last_on_branch = {}
+
+    for step in steps:
+        op = step['op']
+        if op in ('branch', 'checkout') or not segments:
+            segments.append(([], set()))
+        index = len(segments) - 1
+        segment_steps, waits_for = segments[-1]
+        segment_steps.append(step)
+
+        if op == 'branch':
+            if 'onto' in step:
+                waits_for.add(picked_by[step['onto']])
+            if 'onto_branch' in step:
+                waits_for.add(last_on_branch[step['onto_branch']])
+            last_on_branch[step['branch']] = index
+        elif op == 'checkout':
+            waits_for.add(last_on_branch[step['branch']])
+            last_on_branch[step['branch']] = index
+        elif op == 'merge':
+            waits_for.update(picked_by[c] for c in step['commits'])
+        elif op == 'pick':
+            picked_by[step['commit']] = index
+
+    for index, (segment_steps, waits_for) in enumerate(segments):
+        waits_for.discard(index)
+    return segments
+
+
+class ParallelApplier(object):
+    """Applies an ExplodePlan using several builders concurrently.
+
+    Topic branches only depend on each other where one is started on
+    top of a commit from another, or merges one in, so each segment of
+    the plan is scheduled as soon as the segments it depends on have
+    finished.  In worktree mode each worker thread gets its own
+    temporary worktree with a detached HEAD; in in-memory mode each
+    gets its own pygit2 Repository.  Either way all the branch refs
+    are written at the end in a single transaction.
+
+    """
+    def __init__(self, exploder, jobs, in_memory):
+        self.exploder = exploder
+        self.jobs = jobs
+        self.in_memory = in_memory
+        self.heads = OrderedDict()
+        self.local = threading.local()
+        self.worktrees = []
+        self.lock = threading.Lock()
+
+    def apply(self, plan):
+        segments = split_segments(plan.steps)
+        dependents = [[] for segment in segments]
+        waiting = []
+        for index, (segment_steps, waits_for) in enumerate(segments):
+            waiting.append(len(waits_for))
+            for other in waits_for:
+                dependents[other].append(index)
+
+        done = queue.Queue()
+        pool = ThreadPool(self.jobs)
+
+        def submit(index):
+            pool.apply_async(self.run_segment,
+                             (plan, segments[index][0], index, done))
+
+        try:
+            for index, count in enumerate(waiting):
+                if count == 0:
+                    submit(index)
+            for i in range(len(segments)):
+                index, error = done.get()
+                if error is not None:
+                    six.reraise(*error)
+                for dependent in dependents[index]:
+                    waiting[dependent] -= 1
+                    if waiting[dependent] == 0:
+                        submit(dependent)
+            pool.close()
+        except BaseException:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+            self.remove_worktrees()
+
+        write_branches(self.heads, self.exploder.builder.overwrite)
+
+    def run_segment(self, plan, steps, index, done):
+        try:
+            builder = self.builder(plan)
+            for step in steps:
+                self.exploder.apply_step(plan, step, builder)
+            done.put((index, None))
+        except BaseException:
+            done.put((index, sys.exc_info()))
+
+    def builder(self, plan):
+        """Return the builder for the current worker thread."""
+        builder = getattr(self.local, 'builder', None)
+        if builder is not None:
+            return builder
+
+        exploder = self.exploder
+        overwrite = exploder.builder.overwrite
+        # pygit2 repositories must not be shared between threads
+        repo = pygit2.Repository(exploder.repo.path)
+        if self.in_memory:
+            builder = InMemoryBuilder(repo, exploder.logger, overwrite,
+                                      heads=self.heads)
+        else:
+            path = GitExplodeUtils.add_worktree(plan.base)
+            with self.lock:
+                self.worktrees.append(path)
+            builder = DetachedWorktreeBuilder(repo, exploder.logger,
+                                              overwrite, path=path,
+                                              heads=self.heads)
+        self.local.builder = builder
+        return builder
+
+    def remove_worktrees(self):
+        for path in self.worktrees:
+            GitExplodeUtils.remove_worktree(path)
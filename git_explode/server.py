@@ -0,0 +1,265 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+``git-explode serve``: a long-lived process which runs explosions
+submitted to it over a Unix socket by ``git-explode --socket``.
+
+Each explosion would otherwise pay for starting Python, importing
+git-deps and pygit2, opening the repository and detecting the
+dependencies of every commit in its range from cold.  The server keeps
+a pool of open repositories, and the dependencies detected by every
+explosion in memory, so each job only has to do the work which is new
+to it.  Jobs run concurrently, each with its own GitExploder.
+
+The protocol is one line of JSON each way: the client sends the
+command line arguments it was given, and gets back what the job wrote
+to stdout and stderr, its exit status, and its stats.
+"""
+
+from __future__ import print_function, absolute_import
+
+import itertools
+import json
+import os
+import signal
+import socket
+import sys
+import threading
+import traceback
+
+import pygit2
+import six
+from six.moves import queue, socketserver
+
+from git_deps.gitutils import GitUtils
+from git_deps.utils import abort, standard_logger
+from git_explode import cli
+from git_explode.cache import DependencyCache, MemoryDependencyCache
+from git_explode.gitutils import GitUtils as GitExplodeUtils
+
+
+class JobOutput(object):
+    """Stand-in for sys.stdout or sys.stderr which captures whatever
+    is written by a thread running a job, so that it can be sent back
+    to the client, and passes everything else through to the real
+    stream.
+    """
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+
+    def capture(self):
+        self.local.buffer = six.StringIO()
+
+    def release(self):
+        output = self.local.buffer.getvalue()
+        del self.local.buffer
+        return output
+
+    def write(self, s):
+        getattr(self.local, 'buffer', self.stream).write(s)
+
+    def flush(self):
+        getattr(self.local, 'buffer', self.stream).flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+class ExplodeServer(socketserver.ThreadingMixIn,
+                    socketserver.UnixStreamServer):
+    """Runs each job submitted over the socket in its own thread.
+
+    Jobs only share state which is safe to share: the pool of
+    repositories, each used by one job at a time, the cache of
+    detected dependencies, and the long-lived git processes.  Jobs
+    which update the manifest of a previous explosion (--incremental)
+    run one at a time, since there is only one manifest per repository.
+    The git command timings included in each job's stats are for the
+    whole server.
+    """
+    daemon_threads = True
+
+    def __init__(self, path, repo_path, logger, max_jobs=4,
+                 cache_size=DependencyCache.DEFAULT_MAX_COMMITS):
+        """
+        :param path: path of the Unix socket to listen on
+        :param repo_path: path to the repository to explode in
+        :param max_jobs: maximum number of jobs to run at once
+        :param cache_size: maximum number of commits whose
+            dependencies are kept in memory
+        """
+        self.logger = logger
+        self.repos = queue.Queue()
+        for i in range(max_jobs):
+            self.repos.put(pygit2.Repository(repo_path))
+        self.dependency_cache = MemoryDependencyCache(cache_size)
+        self.manifest_lock = threading.Lock()
+        self.job_ids = itertools.count(1)
+        # The socket server classes are old-style in Python 2
+        socketserver.UnixStreamServer.__init__(self, path, JobHandler)
+
+    def server_close(self):
+        socketserver.UnixStreamServer.server_close(self)
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+
+    def run_job(self, argv):
+        """Run the explosion which the given command line arguments
+        describe, and return the response to send to the client.
+        """
+        job = next(self.job_ids)
+        self.logger.info("Job %d: git-explode %s" % (job, ' '.join(argv)))
+        sys.stdout.capture()
+        sys.stderr.capture()
+        response = {'status': 0}
+        try:
+            exploder = self.explode(argv)
+            response['stats'] = exploder.stats.to_dict()
+            response['summary'] = exploder.stats.summary()
+        except SystemExit as e:
+            # From argparse or abort(), which have already said why
+            response['status'] = e.code if isinstance(e.code, int) else 1
+        except Exception:
+            traceback.print_exc()
+            response['status'] = 1
+        response['stdout'] = sys.stdout.release()
+        response['stderr'] = sys.stderr.release()
+        self.logger.info("Job %d exited with status %d" %
+                         (job, response['status']))
+        return response
+
+    def explode(self, argv):
+        args = cli.parse_args(argv)
+        unsupported = self.unsupported(args)
+        if unsupported:
+            abort("fatal: %s is not supported by git-explode serve" %
+                  unsupported)
+        if not (args.plan or args.in_memory or args.detached):
+            abort("fatal: git-explode serve can only build topic branches "
+                  "with --in-memory or --detached")
+
+        repo = self.repos.get()
+        if args.incremental:
+            self.manifest_lock.acquire()
+        try:
+            exploder = cli.make_exploder(
+                args, repo, dependency_cache=self.dependency_cache,
+                journal=False)
+            cli.run_exploder(exploder, args, sys.stdout)
+        finally:
+            if args.incremental:
+                self.manifest_lock.release()
+            self.repos.put(repo)
+        return exploder
+
+    def unsupported(self, args):
+        for option, dest in (('--continue', 'resume'),
+                             ('--apply', 'apply'),
+                             ('--low-memory', 'low_memory'),
+                             ('--batch', 'batch'),
+                             ('--profile', 'profile'),
+                             ('--debug', 'debug')):
+            if getattr(args, dest):
+                return option
+        return None
+
+
+class JobHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        request = json.loads(self.rfile.readline().decode('utf-8'))
+        response = self.server.run_job(request['args'])
+        self.wfile.write((json.dumps(response) + '\n').encode('utf-8'))
+
+
+def serve(args):
+    """Listen for jobs until interrupted.
+
+    :param args: parsed command line of ``git-explode serve``
+    """
+    repo = GitUtils.get_repo()
+    path = args.socket
+    if path is None:
+        path = os.path.join(repo.path, 'git-explode', 'serve.sock')
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+    if os.path.exists(path):
+        if listening(path):
+            abort("fatal: git-explode serve is already listening on %s" %
+                  path)
+        # Left behind by a server which didn't shut down cleanly
+        os.unlink(path)
+
+    logger = standard_logger('git-explode', args.debug)
+    try:
+        server = ExplodeServer(path, repo.path, logger, args.max_jobs,
+                               args.cache_size)
+    except socket.error as e:
+        abort("fatal: can't listen on %s: %s" % (path, e))
+    sys.stdout = JobOutput(sys.stdout)
+    sys.stderr = JobOutput(sys.stderr)
+    if args.git_batch:
+        GitExplodeUtils.start_batch()
+    print("Listening on %s" % path, file=sys.stderr)
+    # Shut down cleanly when killed, too
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        GitExplodeUtils.stop_batch()
+        sys.stdout = sys.stdout.stream
+        sys.stderr = sys.stderr.stream
+
+
+def listening(path):
+    """Return whether anything is accepting connections on the Unix
+    socket at path.
+    """
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(path)
+        return True
+    except socket.error:
+        return False
+    finally:
+        client.close()
+
+
+def submit(path, argv, args):
+    """Run an explosion in the git-explode serve listening on path, as
+    if the given command line had been run here instead, and return
+    its exit status.
+
+    :param argv: command line arguments as list of strings
+    :param args: the same, parsed
+    """
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(path)
+    except socket.error as e:
+        abort("fatal: can't connect to git-explode serve on %s: %s" %
+              (path, e))
+    try:
+        f = client.makefile('rwb')
+        f.write((json.dumps({'args': argv}) + '\n').encode('utf-8'))
+        f.flush()
+        line = f.readline()
+    finally:
+        client.close()
+    if not line:
+        abort("fatal: git-explode serve on %s hung up" % path)
+    response = json.loads(line.decode('utf-8'))
+
+    sys.stdout.write(response['stdout'])
+    sys.stderr.write(response['stderr'])
+    if args.stats and 'summary' in response:
+        for line in response['summary']:
+            print(line, file=sys.stderr)
+    if args.stats_json and 'stats' in response:
+        with open(args.stats_json, 'w') as f:
+            json.dump(response['stats'], f, indent=2)
+            f.write('\n')
+    return response['status']
@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, absolute_import
+
+import json
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from git_explode.gitutils import GitUtils as GitExplodeUtils
+
+
+class ExplodeStats(object):
+    """Collects timings for a run of git-explode: how long each phase
+    took, how long each operation (cherry-pick, merge etc.) took in
+    total, and how long each individual commit took to detect and
+    explode.  Counts of git processes spawned and the time spent in
+    each git command are taken from GitUtils.
+
+    Operations may be recorded from several threads at once when
+    building topic branches in parallel, and several explosions may
+    share one ExplodeStats, in which case everything is totalled.
+
+    """
+    # The caches whose counters are reported, by the key used in
+    # to_dict(), with the label used in summary() and the counters
+    CACHES = (
+        ('cache', 'Dependency cache', ('hits', 'misses')),
+        ('blame_cache', 'Blame cache', ('hits', 'derived', 'misses')),
+        ('merge_cache', 'Merge cache', ('hits', 'misses')),
+    )
+
+    def __init__(self, per_commit=True):
+        """
+        :param per_commit: whether to keep timings for each commit,
+            which take memory in proportion to the size of the range
+        """
+        self.start = time.time()
+        self.phases = OrderedDict()
+        self.operations = {}
+        self.per_commit = per_commit
+        self.commits = OrderedDict()
+        self.caches = OrderedDict((kind, []) for kind, _, _ in self.CACHES)
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name):
+        """Time the enclosed block as the named phase of the run."""
+        start = time.time()
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.phases[name] = \
+                    self.phases.get(name, 0.0) + time.time() - start
+
+    @contextmanager
+    def operation(self, name, sha1=None):
+        """Time the enclosed block as an operation, optionally
+        attributing it to the given commit.
+        """
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.record(name, time.time() - start, sha1)
+
+    def count(self, kind, cache):
+        """Report the counters of the given cache, totalled with those
+        of any other caches of the same kind already being counted.
+
+        :param kind: one of the keys of CACHES
+        """
+        if not any(c is cache for c in self.caches[kind]):
+            self.caches[kind].append(cache)
+
+    def counters(self, kind):
+        """Return an OrderedDict of the total counters of the caches of
+        the given kind, or None if there aren't any.
+        """
+        caches = self.caches[kind]
+        if not caches:
+            return None
+        names = dict((k, n) for k, _, n in self.CACHES)[kind]
+        return OrderedDict((name, sum(getattr(c, name) for c in caches))
+                           for name in names)
+
+    def record(self, name, elapsed, sha1=None):
+        with self.lock:
+            calls, total = self.operations.get(name, (0, 0.0))
+            self.operations[name] = (calls + 1, total + elapsed)
+            if sha1 is not None and self.per_commit:
+                timings = self.commits.setdefault(sha1, OrderedDict())
+                timings[name] = timings.get(name, 0.0) + elapsed
+
+    def to_dict(self):
+        def calls_and_seconds(items):
+            return OrderedDict(
+                (name, OrderedDict([('calls', calls), ('seconds', total)]))
+                for name, (calls, total) in sorted(items))
+
+        spawns, timings = GitExplodeUtils.timings_snapshot()
+        stats = OrderedDict([
+            ('total', time.time() - self.start),
+            ('phases', self.phases),
+            ('operations', calls_and_seconds(self.operations.items())),
+            ('commits', self.commits),
+            ('git', OrderedDict([
+                ('spawns', spawns),
+                ('commands', calls_and_seconds(timings.items())),
+            ])),
+        ])
+        for kind, _, _ in self.CACHES:
+            counters = self.counters(kind)
+            if counters is not None:
+                stats[kind] = counters
+        return stats
+
+    def dump(self, f):
+        json.dump(self.to_dict(), f, indent=2)
+        f.write('\n')
+
+    def summary(self, slowest=5):
+        """Return a list of lines summarising the run, including the
+        given number of slowest commits.
+        """
+        stats = self.to_dict()
+        lines = ["Total time: %.3fs" % stats['total'], "Phases:"]
+        for name, elapsed in stats['phases'].items():
+            lines.append("  %-20s %9.3fs" % (name, elapsed))
+
+        lines.append("Operations:")
+        for name, op in stats['operations'].items():
+            lines.append("  %-20s %6d calls %9.3fs %8.2fms/call" %
+                         (name, op['calls'], op['seconds'],
+                          1000.0 * op['seconds'] / op['calls']))
+
+        if self.commits:
+            lines.append("Slowest commits:")
+            by_total = sorted(self.commits.items(),
+                              key=lambda item: sum(item[1].values()),
+                              reverse=True)
+            for sha1, timings in by_total[:slowest]:
+                lines.append("  %s %9.3fs (%s)" % (
+                    sha1[:8], sum(timings.values()),
+                    ', '.join("%s %.3fs" % item for item in timings.items())))
+
+        for kind, label, _ in self.CACHES:
+            counters = self.counters(kind)
+            if counters is not None:
+                lines.append("%s: %s" % (label, ', '.join(
+                    "%d %s" % (n, name) for name, n in counters.items())))
+        lines.extend(GitExplodeUtils.timing_report())
+        return lines
@@ -0,0 +1,430 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, absolute_import
+
+import json
+import os
+import sqlite3
+from array import array
+from collections import OrderedDict, deque
+
+from git_explode.graph import DependencyGraph
+from git_explode.listener import ExplodeDependencyListener
+from git_explode.pathindex import PathIndex
+
+
+class GraphStore(object):
+    """Temporary SQLite database used by --low-memory to hold everything
+    about the range being exploded whose size grows with the range:
+    the path index, the detected dependencies, the dependency tree, the
+    plan's steps and the exploded version of each commit.  SQLite only
+    keeps a bounded number of pages cached, so peak memory use stays
+    roughly constant however many commits there are, at the cost of
+    a query wherever the in-memory structures would have done a dict
+    lookup.
+
+    The database is kept until the explosion completes, so that an
+    interrupted one can still be continued.
+
+    """
+    SCHEMA = """
+        CREATE TABLE revs (
+            position INTEGER PRIMARY KEY,
+            sha1 TEXT NOT NULL UNIQUE,
+            indexed INTEGER NOT NULL
+        );
+        CREATE TABLE paths (
+            id INTEGER PRIMARY KEY,
+            path TEXT NOT NULL UNIQUE
+        );
+        CREATE TABLE touches (
+            path_id INTEGER NOT NULL,
+            position INTEGER NOT NULL,
+            PRIMARY KEY (path_id, position)
+        ) WITHOUT ROWID;
+        CREATE INDEX touches_position ON touches (position);
+        CREATE TABLE detected (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        );
+        CREATE TABLE commits (
+            id INTEGER PRIMARY KEY,
+            sha1 TEXT NOT NULL UNIQUE,
+            done INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE TABLE edges (
+            src INTEGER NOT NULL,
+            dst INTEGER NOT NULL,
+            path_id INTEGER NOT NULL,
+            line INTEGER NOT NULL
+        );
+        CREATE INDEX edges_src ON edges (src);
+        CREATE INDEX edges_dst ON edges (dst);
+        CREATE TABLE steps (
+            position INTEGER PRIMARY KEY,
+            step TEXT NOT NULL
+        );
+        CREATE TABLE exploded (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        );
+    """
+
+    def __init__(self, path, reset=True):
+        """
+        :param path: path to the SQLite database
+        :param reset: whether to start afresh, rather than reopen the
+            database left by an interrupted explosion
+        """
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        if reset:
+            self.remove_files()
+        self.db = sqlite3.connect(path)
+        # Nothing here needs to survive a crash of the whole machine,
+        # and WAL mode lets worker processes read the path index while
+        # detected dependencies are being written.
+        self.db.execute('PRAGMA journal_mode = WAL')
+        self.db.execute('PRAGMA synchronous = OFF')
+        if reset:
+            self.db.executescript(self.SCHEMA)
+        self.detected = StoredDict(self, 'detected')
+        self.exploded = StoredDict(self, 'exploded')
+        self.steps = StoredSteps(self)
+
+    @classmethod
+    def for_repo(cls, repo, reset=True):
+        return cls(os.path.join(repo.path, 'git-explode', 'graph.sqlite'),
+                   reset)
+
+    def __getstate__(self):
+        # Worker processes get their own connection to the same database
+        return {'path': self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'], reset=False)
+
+    def path_id(self, path):
+        row = self.db.execute('SELECT id FROM paths WHERE path = ?',
+                              (path,)).fetchone()
+        if row is not None:
+            return row[0]
+        return self.db.execute('INSERT INTO paths (path) VALUES (?)',
+                               (path,)).lastrowid
+
+    def commit(self):
+        self.db.commit()
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+    def remove(self):
+        """Throw away the database once the explosion has completed."""
+        self.close()
+        self.remove_files()
+
+    def remove_files(self):
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.path + suffix):
+                os.unlink(self.path + suffix)
+
+
+class StoredDict(object):
+    """Just enough of a dict, mapping strings to anything which can be
+    encoded as JSON, kept in one of the tables of a GraphStore.
+    """
+    def __init__(self, store, table):
+        self.db = store.db
+        self.table = table
+
+    def __setitem__(self, key, value):
+        self.db.execute('INSERT OR REPLACE INTO %s (key, value) '
+                        'VALUES (?, ?)' % self.table,
+                        (key, json.dumps(value)))
+
+    def get(self, key, default=None):
+        row = self.db.execute('SELECT value FROM %s WHERE key = ?' %
+                              self.table, (key,)).fetchone()
+        return default if row is None else json.loads(row[0])
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return self.db.execute('SELECT 1 FROM %s WHERE key = ?' %
+                               self.table, (key,)).fetchone() is not None
+
+    def __len__(self):
+        return self.db.execute('SELECT COUNT(*) FROM %s' %
+                               self.table).fetchone()[0]
+
+    def update(self, other):
+        for key, value in other.items():
+            self[key] = value
+
+
+class StoredSteps(object):
+    """The list of steps of an ExplodePlan, kept in a GraphStore and
+    read back one at a time when the plan is applied.
+    """
+    def __init__(self, store):
+        self.db = store.db
+        self.count = self.db.execute(
+            'SELECT COUNT(*) FROM steps').fetchone()[0]
+
+    def append(self, step):
+        self.db.execute('INSERT INTO steps (position, step) VALUES (?, ?)',
+                        (self.count, json.dumps(step)))
+        self.count += 1
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, position):
+        if not 0 <= position < self.count:
+            raise IndexError(position)
+        row = self.db.execute('SELECT step FROM steps WHERE position = ?',
+                              (position,)).fetchone()
+        return json.loads(row[0], object_pairs_hook=OrderedDict)
+
+    def __iter__(self):
+        # The cursor reads the steps lazily rather than all at once
+        cursor = self.db.execute('SELECT step FROM steps ORDER BY position')
+        for (step,) in cursor:
+            yield json.loads(step, object_pairs_hook=OrderedDict)
+
+
+class StoredPathIndex(PathIndex):
+    """PathIndex kept in a GraphStore rather than in dicts and lists."""
+
+    def __init__(self, store, base):
+        self.store = store
+        self.db = store.db
+        self.base = base
+
+    @classmethod
+    def build(cls, repo, base, revs, store):
+        """
+        :param repo: pygit2.Repository
+        :param base: SHA1 of the base of the range
+        :param revs: list of SHA1s of the commits in the range, oldest
+            first
+        :param store: GraphStore to keep the index in
+        """
+        db = store.db
+        for position, sha1 in enumerate(revs):
+            commit = repo[sha1]
+            db.execute('INSERT INTO revs (position, sha1, indexed) '
+                       'VALUES (?, ?, ?)',
+                       (position, sha1, bool(commit.parents)))
+            if not commit.parents:
+                continue
+            diff = repo.diff(commit.parents[0].tree, commit.tree)
+            commit_paths = set()
+            for delta in diff.deltas:
+                commit_paths.add(delta.old_file.path)
+                commit_paths.add(delta.new_file.path)
+            db.executemany('INSERT INTO touches (path_id, position) '
+                           'VALUES (?, ?)',
+                           [(store.path_id(path), position)
+                            for path in commit_paths])
+        store.commit()
+        return cls(store, base)
+
+    def __getstate__(self):
+        return {'store': self.store, 'base': self.base}
+
+    def __setstate__(self, state):
+        self.__init__(state['store'], state['base'])
+
+    def position(self, sha1):
+        row = self.db.execute('SELECT position FROM revs WHERE sha1 = ?',
+                              (sha1,)).fetchone()
+        return None if row is None else row[0]
+
+    def __contains__(self, sha1):
+        return self.position(sha1) is not None
+
+    def touched_before(self, path, sha1):
+        position = self.position(sha1)
+        if position is None:
+            return True
+        return self.db.execute(
+            'SELECT 1 FROM touches JOIN paths ON paths.id = path_id '
+            'WHERE path = ? AND position < ? LIMIT 1',
+            (path, position)).fetchone() is not None
+
+    def last_touched(self, path, sha1):
+        position = self.position(sha1)
+        if position is None:
+            return sha1
+        row = self.db.execute(
+            'SELECT revs.sha1 FROM touches '
+            'JOIN paths ON paths.id = touches.path_id '
+            'JOIN revs ON revs.position = touches.position '
+            'WHERE path = ? AND touches.position <= ? '
+            'ORDER BY touches.position DESC LIMIT 1',
+            (path, position)).fetchone()
+        return self.base if row is None else row[0]
+
+    def may_have_dependencies(self, sha1):
+        row = self.db.execute('SELECT position, indexed FROM revs '
+                              'WHERE sha1 = ?', (sha1,)).fetchone()
+        if row is None or not row[1]:
+            return True
+        return self.db.execute(
+            'SELECT 1 FROM touches AS mine JOIN touches AS earlier '
+            'ON earlier.path_id = mine.path_id '
+            'AND earlier.position < mine.position '
+            'WHERE mine.position = ? LIMIT 1',
+            (row[0],)).fetchone() is not None
+
+
+class StoredCommitIds(object):
+    """Read-only mapping of SHA1s to the IDs of commits in a
+    StoredDependencyListener.
+    """
+    def __init__(self, db):
+        self.db = db
+
+    def get(self, sha1, default=None):
+        row = self.db.execute('SELECT id FROM commits WHERE sha1 = ?',
+                              (sha1,)).fetchone()
+        return default if row is None else row[0]
+
+    def __getitem__(self, sha1):
+        commit_id = self.get(sha1)
+        if commit_id is None:
+            raise KeyError(sha1)
+        return commit_id
+
+    def __contains__(self, sha1):
+        return self.get(sha1) is not None
+
+
+class StoredCommitShas(object):
+    """Read-only sequence of the SHA1s of the commits in a
+    StoredDependencyListener, indexed by their IDs.
+    """
+    def __init__(self, db):
+        self.db = db
+
+    def __getitem__(self, commit_id):
+        row = self.db.execute('SELECT sha1 FROM commits WHERE id = ?',
+                              (commit_id,)).fetchone()
+        if row is None:
+            raise IndexError(commit_id)
+        return row[0]
+
+    def __len__(self):
+        return self.db.execute('SELECT COUNT(*) FROM commits').fetchone()[0]
+
+    def __iter__(self):
+        for (sha1,) in self.db.execute('SELECT sha1 FROM commits '
+                                       'ORDER BY id'):
+            yield sha1
+
+
+class StoredDependencyListener(ExplodeDependencyListener):
+    """ExplodeDependencyListener which keeps the dependency tree in a
+    GraphStore.  Commits get the same IDs, and dependencies are
+    returned in the same order, as they would in memory, so the
+    resulting plan is exactly the same.
+    """
+    def __init__(self, store, on_done=None):
+        super(StoredDependencyListener, self).__init__({}, on_done)
+        self.store = store
+        self.db = store.db
+        self.ids = StoredCommitIds(self.db)
+        self.shas = StoredCommitShas(self.db)
+        self.count = len(self.shas)
+
+    def add_commit(self, sha1):
+        commit_id = self.ids.get(sha1)
+        if commit_id is None:
+            commit_id = self.count
+            self.db.execute('INSERT INTO commits (id, sha1) VALUES (?, ?)',
+                            (commit_id, sha1))
+            self.count += 1
+        return commit_id
+
+    def add_edge(self, src_id, dst_id, path, line_num):
+        self.db.execute('INSERT INTO edges (src, dst, path_id, line) '
+                        'VALUES (?, ?, ?, ?)',
+                        (src_id, dst_id, self.store.path_id(path), line_num))
+
+    def dependency_ids(self, commit_id):
+        return [dst for (dst,) in self.db.execute(
+            'SELECT dst FROM edges WHERE src = ? ORDER BY rowid',
+            (commit_id,))]
+
+    def dependent_ids(self, commit_id):
+        return [src for (src,) in self.db.execute(
+            'SELECT src FROM edges WHERE dst = ? ORDER BY rowid',
+            (commit_id,))]
+
+    def dependencies(self, sha1):
+        return [(dependency, "%s:%d" % (path, line))
+                for dependency, path, line in self.db.execute(
+                    'SELECT dst.sha1, path, line FROM edges '
+                    'JOIN commits AS src ON src.id = edges.src '
+                    'JOIN commits AS dst ON dst.id = edges.dst '
+                    'JOIN paths ON paths.id = edges.path_id '
+                    'WHERE src.sha1 = ? ORDER BY edges.rowid', (sha1,))]
+
+    def replay(self, revs, dependencies):
+        # The same walk as ExplodeDependencyListener.replay(), but
+        # remembering which commits are done in the database.
+        for rev in revs:
+            todo = deque([rev])
+            queued = set(todo)
+            while todo:
+                sha1 = todo.popleft()
+                queued.discard(sha1)
+                if self.is_done(sha1):
+                    continue
+
+                commit_id = self.add_commit(sha1)
+                for dependency, cause in dependencies.get(sha1, []):
+                    self.add_commit(dependency)
+                    self.add_dependency(sha1, dependency, cause)
+                    if dependency not in queued and \
+                       not self.is_done(dependency):
+                        todo.append(dependency)
+                        queued.add(dependency)
+                self.db.execute('UPDATE commits SET done = 1 WHERE id = ?',
+                                (commit_id,))
+        self.store.commit()
+
+    def is_done(self, sha1):
+        row = self.db.execute('SELECT done FROM commits WHERE sha1 = ?',
+                              (sha1,)).fetchone()
+        return row is not None and bool(row[0])
+
+    def graph(self):
+        return StoredDependencyGraph(self)
+
+
+class StoredDependencyGraph(DependencyGraph):
+    """DependencyGraph which looks up the dependents of each commit in
+    the StoredDependencyListener it was built from as it goes, so only
+    has to keep the count of unexploded dependencies of each commit.
+    """
+    def __init__(self, listener):
+        self.listener = listener
+        self.shas = listener.shas
+        self.remaining = array('l', [0]) * len(self.shas)
+        for src, count in listener.db.execute(
+                'SELECT src, COUNT(*) FROM edges GROUP BY src'):
+            self.remaining[src] = count
+
+    def dependents_of(self, i):
+        return self.listener.dependent_ids(i)
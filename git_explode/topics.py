@@ -1,6 +1,8 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import logging
+
 
 class TopicManager(object):
     """Acts as a factory for topic branch names, and a registry for
@@ -10,14 +12,29 @@ class TopicManager(object):
     This ensures we always know onto which topic branch to explode
     (cherry-pick) a new commit.
 
-    """
-    i = 0
-    topics = {}
-    commits = {}
+    Commits are given as the integer IDs assigned by the
+    ExplodeDependencyListener, and each set of them is keyed by a
+    frozenset rather than by a string joining all their SHA1s.
+
+    All state belongs to the instance, so that several explosions can
+    be planned in the same process without seeing each other's topics.
 
+    """
     def __init__(self, template, logger):
         self.template = template
         self.logger = logger
+        self.reserved = set()
+        self.reset()
+
+    def reset(self):
+        """Forget every topic, and start naming them from the beginning
+        again.  Reserved names stay reserved.
+        """
+        self.i = 0
+        # Map each set of commits to the topic they're assigned to,
+        # and each topic back to its set
+        self.topics = {}
+        self.commits = {}
 
     def lookup(self, *commits):
         name = self._name_for(*commits)
@@ -32,7 +49,8 @@ class TopicManager(object):
         name = self._name_for(*commits)
         self.topics[name] = topic
         self.commits[topic] = name
-        self.logger.debug("  Assigned %s to %s" % (topic, name))
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("  Assigned %s to %s" % (topic, sorted(name)))
 
     def assign(self, topic, *commits):
         old_commits = self.commits.get(topic)
@@ -43,11 +61,21 @@ class TopicManager(object):
     def unassign(self, topic, commits):
         del self.topics[commits]
         del self.commits[topic]
-        self.logger.debug("  Unassigned %s from %s" % (topic, commits))
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("  Unassigned %s from %s" %
+                              (topic, sorted(commits)))
 
     def _name_for(self, *commits):
-        return ' '.join(sorted(commits))
+        return frozenset(commits)
+
+    def reserve(self, names):
+        """Prevent next() from generating any of the given names."""
+        self.reserved.update(names)
 
     def next(self):
         self.i += 1
-        return self.template % self.i
+        name = self.template % self.i
+        while name in self.reserved:
+            self.i += 1
+            name = self.template % self.i
+        return name
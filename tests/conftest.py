@@ -1,12 +1,102 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 """
-    Dummy conftest.py for git_explode.
+    Fixtures shared between the tests, for building small repositories
+    and plans to explode.
 
-    If you don't know what this is for, just leave it empty.
     Read more about conftest.py under:
     https://pytest.org/latest/plugins.html
 """
 from __future__ import print_function, absolute_import, division
 
-# import pytest
+import subprocess
+
+import pytest
+
+from git_explode.plan import ExplodePlan
+
+A, B, C = ('a' * 40, 'b' * 40, 'c' * 40)
+
+
+def run_git(path, *args):
+    return subprocess.check_output(('git', '-C', str(path)) + args,
+                                   universal_newlines=True).strip()
+
+
+def make_commit(path, contents, message, filename='file'):
+    with open(str(path.join(filename)), 'w') as f:
+        f.write(contents)
+    run_git(path, 'add', filename)
+    run_git(path, '-c', 'user.name=Test', '-c', 'user.email=test@example.com',
+            'commit', '-q', '-m', message)
+    return run_git(path, 'rev-parse', 'HEAD')
+
+
+@pytest.fixture
+def git():
+    """Run git in the given directory and return its output."""
+    return run_git
+
+
+@pytest.fixture
+def commit():
+    """Write the given contents to a file in the given repository and
+    commit it, returning the SHA1 of the new commit.
+    """
+    return make_commit
+
+
+@pytest.fixture
+def change(tmpdir, monkeypatch):
+    """Create a repository in tmpdir, make it the current directory, and
+    return a function which commits changes to a twenty line file
+    there.  The changes are given as a dict mapping line numbers to
+    their new contents, and the function returns the SHA1 of the new
+    commit.
+    """
+    run_git(tmpdir, 'init', '-q')
+    run_git(tmpdir, 'config', 'user.name', 'Test')
+    run_git(tmpdir, 'config', 'user.email', 'test@example.com')
+    monkeypatch.chdir(tmpdir)
+    lines = list('abcdefghijklmnopqrst')
+
+    def change(message, changes):
+        for line, contents in changes.items():
+            lines[line] = contents
+        return make_commit(tmpdir, '\n'.join(lines) + '\n', message)
+
+    return change
+
+
+@pytest.fixture
+def history(change):
+    """A base commit and six commits on top of it, where five depends on
+    two chains of two commits each, and six on nothing, so that
+    exploding them needs a merge.
+
+    :return: (base, list of the six commits, oldest first)
+    """
+    base = change('base', {})
+    revs = [change('one', {3: 'D'}),
+            change('two', {13: 'N'}),
+            change('three', {4: 'E'}),
+            change('four', {14: 'O'}),
+            change('five', {5: 'F', 15: 'P'}),
+            change('six', {9: 'J'})]
+    return base, revs
+
+
+@pytest.fixture
+def plan():
+    """A plan with two independent topics and a third depending on
+    both, picking the commits A, B and C respectively.
+    """
+    plan = ExplodePlan('0' * 40, C)
+    plan.branch('topic1')
+    plan.pick(A, 'topic1')
+    plan.branch('topic2')
+    plan.pick(B, 'topic2')
+    plan.branch('topic3', onto=A)
+    plan.merge([B])
+    plan.pick(C, 'topic3')
+    return plan
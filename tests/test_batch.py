@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import pygit2
+import pytest
+
+from git_explode.batch import BatchExploder, parse_ranges
+
+
+def test_parse_ranges():
+    lines = ['# feature branches\n', 'main one\n', '\n', 'main two t/\n']
+    assert parse_ranges(lines, 'ranges') == [('main', 'one', 'one-'),
+                                             ('main', 'two', 't/')]
+    with pytest.raises(SystemExit):
+        parse_ranges(['main one two three\n'], 'ranges')
+    with pytest.raises(SystemExit):
+        parse_ranges(['main one t/\n', 'main two t/\n'], 'ranges')
+    # Revisions which can't be used in branch names need a prefix
+    with pytest.raises(SystemExit):
+        parse_ranges(['main main~3\n'], 'ranges')
+    assert parse_ranges(['main main~3 old/\n'], 'ranges', 'p/') == \
+        [('main', 'main~3', 'old/')]
+    with pytest.raises(SystemExit):
+        parse_ranges(['main one t/\n'], 'ranges', 'p~')
+
+
+def test_shared_commits(tmpdir, monkeypatch, git, commit):
+    git(tmpdir, 'init', '-q')
+    git(tmpdir, 'config', 'user.name', 'Test')
+    git(tmpdir, 'config', 'user.email', 'test@example.com')
+    base = commit(tmpdir, 'a\nb\nc\n', 'base')
+    one = commit(tmpdir, 'A\nb\nc\n', 'one')
+    two = commit(tmpdir, 'A\nB\nc\n', 'two')
+    monkeypatch.chdir(tmpdir)
+    repo = pygit2.Repository(str(tmpdir))
+
+    batch = BatchExploder(repo, [(base, one, 'x/'), (base, two, 'y/')],
+                          False, 1, prefix='p/', in_memory=True)
+    batch.run()
+
+    # one is only detected and cherry-picked once
+    assert batch.stats.operations['detect'][0] == 2
+    assert repo.lookup_branch('p/x/topic1').target.hex == \
+        repo[repo.lookup_branch('p/y/topic1').target].parents[0].hex
@@ -0,0 +1,30 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import pygit2
+
+from git_explode.blame import BlameCache
+from git_explode.pathindex import PathIndex
+
+
+def test_derived_blame_matches_git(tmpdir, git, commit):
+    git(tmpdir, 'init', '-q')
+    base = commit(tmpdir, 'a\nb\nc\nd\ne\n', 'base')
+    revs = [commit(tmpdir, 'a\nB\nc\nd\ne\n', 'one'),
+            commit(tmpdir, 'a\nB\nc\nx\ny\nd\ne\n', 'two'),
+            commit(tmpdir, 'B\nc\nx\ny\nd\nE\n', 'three')]
+    repo = pygit2.Repository(str(tmpdir))
+    index = PathIndex.build(repo, base, revs)
+    cache = BlameCache(index)
+
+    for rev in revs:
+        porcelain = git(tmpdir, 'blame', '--porcelain',
+                        '%s..%s' % (base, rev), '--', 'file')
+        expected = [line.split(' ')[:3] for line in porcelain.split('\n')
+                    if len(line.split(' ')[0]) == 40]
+        derived = cache.blame(repo, 'file', rev, 1, len(expected))
+        assert [line.split(' ') for line in derived.split('\n')] == expected
+
+    assert (cache.hits, cache.derived, cache.misses) == (0, 3, 0)
+    cache.blame(repo, 'file', revs[-1], 2, 2)
+    assert cache.hits == 1
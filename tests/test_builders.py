@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+import subprocess
+
+import pygit2
+import pytest
+
+from git_explode import builders
+from git_explode.builders import (DetachedWorktreeBuilder, InMemoryBuilder,
+                                  merge_in_memory, reuse_tree,
+                                  write_branches)
+
+
+def test_reuse_tree(tmpdir, git, commit):
+    git(tmpdir, 'init', '-q')
+    base = commit(tmpdir, 'a\nb\nc\n', 'base')
+    one = commit(tmpdir, 'a\nB\nc\n', 'one')
+    two = commit(tmpdir, 'a\nB\nC\n', 'two')
+    repo = pygit2.Repository(str(tmpdir))
+    repo.config['user.name'] = 'Test'
+    repo.config['user.email'] = 'test@example.com'
+
+    # Onto the original parent's tree, the result is the original tree
+    new = repo[reuse_tree(repo, one, base)]
+    assert new.tree_id == repo[one].tree_id
+    assert [p.hex for p in new.parents] == [base]
+    assert new.message == repo[one].message
+    assert new.author.name == repo[one].author.name
+
+    # Anywhere else it has to be cherry-picked properly
+    assert reuse_tree(repo, two, base) is None
+
+
+def test_committer_from_environment(tmpdir, monkeypatch, git, commit):
+    git(tmpdir, 'init', '-q')
+    base = commit(tmpdir, 'a\nb\nc\n', 'base')
+    one = commit(tmpdir, 'A\nb\nc\n', 'one')
+    git(tmpdir, 'checkout', '-q', '-b', 'other', base)
+    two = commit(tmpdir, 'a\nb\nC\n', 'two')
+    repo = pygit2.Repository(str(tmpdir))
+    # No identity in any config, as is typical on CI, and none guessed
+    # from the host name either
+    git(tmpdir, 'config', 'user.useConfigOnly', 'true')
+    monkeypatch.setenv('HOME', str(tmpdir))
+    monkeypatch.setenv('GIT_CONFIG_NOSYSTEM', '1')
+    monkeypatch.setenv('GIT_COMMITTER_NAME', 'CI')
+    monkeypatch.setenv('GIT_COMMITTER_EMAIL', 'ci@example.com')
+    monkeypatch.setenv('GIT_COMMITTER_DATE', '1500000000 +0130')
+    monkeypatch.setattr(builders, '_committers', {})
+
+    merged = repo[merge_in_memory(repo, one, [two], 'topic')]
+    assert (merged.committer.name, merged.committer.email) == \
+        ('CI', 'ci@example.com')
+    assert (merged.commit_time, merged.commit_time_offset) == \
+        (1500000000, 90)
+    assert repo[reuse_tree(repo, one, base)].committer.name == 'CI'
+
+    monkeypatch.delenv('GIT_COMMITTER_NAME')
+    monkeypatch.delenv('GIT_COMMITTER_EMAIL')
+    monkeypatch.setattr(builders, '_committers', {})
+    with pytest.raises(SystemExit):
+        merge_in_memory(repo, one, [two], 'topic')
+
+
+def test_in_memory_builder(tmpdir, monkeypatch, git, commit):
+    git(tmpdir, 'init', '-q')
+    monkeypatch.chdir(tmpdir)
+    lines = list('abcdefghij')
+
+    def change(line, contents, message):
+        lines[line] = contents
+        return commit(tmpdir, '\n'.join(lines) + '\n', message)
+
+    base = change(0, 'a', 'base')
+    one = change(0, 'A', 'one')
+    two = change(9, 'J', 'two')
+    three = change(9, 'J2', 'three')
+    four = change(0, 'A2', 'four')
+    head = git(tmpdir, 'symbolic-ref', 'HEAD')
+    repo = pygit2.Repository(str(tmpdir))
+    repo.config['user.name'] = 'Test'
+    repo.config['user.email'] = 'test@example.com'
+
+    builder = InMemoryBuilder(repo, logging.getLogger('test'))
+    builder.start()
+    builder.checkout_new('topic1', base)
+    builder.cherry_pick(one)
+    builder.checkout_new('topic2', base)
+    builder.cherry_pick(two)
+    # topic3 and topic4 merge topic1 and topic2 each way round ...
+    builder.checkout_new('topic3', 'topic1')
+    builder.merge(builder.heads['topic2'])
+    merge = repo[builder.heads['topic3']]
+    builder.cherry_pick(three)
+    builder.checkout_new('topic4', 'topic2')
+    builder.merge(builder.heads['topic1'])
+    builder.cherry_pick(four)
+    # ... so merging them needs both merge bases to be clean
+    builder.checkout_new('topic5', 'topic3')
+    builder.merge(builder.heads['topic4'])
+    builder.finish()
+
+    assert [p.hex for p in merge.parents] == \
+        [builder.heads['topic1'], builder.heads['topic2']]
+    assert merge.message == "Merge commit '%s' into topic3\n" % \
+        builder.heads['topic2']
+    for branch in builder.heads:
+        assert repo.lookup_branch(branch).target.hex == \
+            builder.heads[branch]
+    assert repo[builder.heads['topic3']].tree_id == repo[three].tree_id
+    assert repo[builder.heads['topic5']].tree_id == repo[four].tree_id
+    # Neither HEAD nor the working tree were touched
+    assert git(tmpdir, 'symbolic-ref', 'HEAD') == head
+    assert git(tmpdir, 'status', '--porcelain') == ''
+
+
+def test_write_branches(tmpdir, monkeypatch, git, commit):
+    git(tmpdir, 'init', '-q')
+    monkeypatch.chdir(tmpdir)
+    base = commit(tmpdir, 'a\nb\nc\n', 'base')
+    one = commit(tmpdir, 'A\nb\nc\n', 'one')
+    two = commit(tmpdir, 'A\nb\nC\n', 'two')
+    git(tmpdir, 'checkout', '-q', '-b', 'topic1', one)
+
+    # Moving the checked out branch brings the working tree with it
+    write_branches({'topic1': two, 'topic2': base}, True)
+    assert git(tmpdir, 'rev-parse', 'topic1', 'topic2').split() == \
+        [two, base]
+    assert tmpdir.join('file').read() == 'A\nb\nC\n'
+    assert git(tmpdir, 'status', '--porcelain') == ''
+
+    # Either all the branches are created or none are
+    with pytest.raises(subprocess.CalledProcessError):
+        write_branches({'topic3': one, 'topic2': one}, False)
+    assert git(tmpdir, 'branch', '--list', 'topic3') == ''
+    assert git(tmpdir, 'rev-parse', 'topic2') == base
+
+
+def test_detached_worktree_builder(tmpdir, monkeypatch, git, commit):
+    git(tmpdir, 'init', '-q')
+    git(tmpdir, 'config', 'user.name', 'Test')
+    git(tmpdir, 'config', 'user.email', 'test@example.com')
+    monkeypatch.chdir(tmpdir)
+    lines = list('abcdefghij')
+
+    def change(line, contents, message):
+        lines[line] = contents
+        return commit(tmpdir, '\n'.join(lines) + '\n', message)
+
+    base = change(0, 'a', 'base')
+    one = change(0, 'A', 'one')
+    two = change(9, 'J', 'two')
+    head = git(tmpdir, 'rev-parse', 'HEAD')
+    repo = pygit2.Repository(str(tmpdir))
+    logger = logging.getLogger('test')
+
+    builder = DetachedWorktreeBuilder(repo, logger)
+    builder.start()
+    builder.checkout_new('topic1', base)
+    builder.cherry_pick(one)
+    builder.checkout_new('topic2', base)
+    builder.cherry_pick(two)
+    builder.checkout_new('topic3', 'topic1')
+    builder.merge(builder.heads['topic2'])
+    # No branches exist until they are all written at the end
+    assert repo.lookup_branch('topic1') is None
+    builder.finish()
+
+    assert repo[repo.lookup_branch('topic3').target].tree_id == \
+        repo[two].tree_id
+    assert git(tmpdir, 'rev-parse', 'HEAD') == head
+    assert len(git(tmpdir, 'worktree', 'list').split('\n')) == 1
+
+    # The scratch worktree is removed when building fails too
+    builder = DetachedWorktreeBuilder(repo, logger)
+    builder.start()
+    try:
+        with pytest.raises(SystemExit):
+            builder.checkout_new('topic1', base)
+    finally:
+        builder.cleanup()
+    assert len(git(tmpdir, 'worktree', 'list').split('\n')) == 1
@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from git_explode.cache import DependencyCache
+
+A, B, C = ('a' * 40, 'b' * 40, 'c' * 40)
+BASE, OTHER_BASE = ('0' * 40, '1' * 40)
+
+
+def test_lookup_and_store(tmpdir):
+    cache = DependencyCache(str(tmpdir.join('deps.db')), 1, BASE)
+    assert cache.lookup(C) is None
+    cache.store(C, [(B, 'file:2'), (A, 'file:1')])
+    cache.store(B, [])
+    assert cache.lookup(C) == [(B, 'file:2'), (A, 'file:1')]
+    assert cache.lookup(B) == []
+    assert (cache.hits, cache.misses) == (2, 1)
+    cache.close()
+
+
+def test_persistence(tmpdir):
+    path = str(tmpdir.join('git-explode', 'deps.db'))
+    cache = DependencyCache(path, 1, BASE)
+    cache.store(C, [(A, 'file:1')])
+    cache.close()
+
+    again = DependencyCache(path, 1, BASE)
+    assert again.lookup(C) == [(A, 'file:1')]
+    again.close()
+
+
+def test_key(tmpdir):
+    path = str(tmpdir.join('deps.db'))
+    cache = DependencyCache(path, 1, BASE)
+    cache.store(C, [(A, 'file:1')])
+    cache.close()
+
+    # Dependencies detected with a different number of lines of
+    # context or a different boundary may differ, so must not be used
+    for context_lines, boundary in ((3, BASE), (1, OTHER_BASE)):
+        other = DependencyCache(path, context_lines, boundary)
+        assert other.lookup(C) is None
+        other.store(C, [(B, 'file:4')])
+        other.close()
+
+    cache = DependencyCache(path, 1, BASE)
+    assert cache.lookup(C) == [(A, 'file:1')]
+    cache.close()
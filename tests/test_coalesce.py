@@ -0,0 +1,23 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from git_explode.coalesce import coalesce_topics
+
+
+def test_most_dependent_first():
+    # 1 depends on 0 twice, 2 on 1 once, and 3 on nothing
+    edges = [(1, 0), (1, 0), (2, 1)]
+    assert coalesce_topics([1, 1, 1, 1], edges, 3) == [0, 0, 1, 2]
+    assert coalesce_topics([1, 1, 1, 1], edges, 2) == [0, 0, 0, 1]
+    # Once nothing depends on anything else, the smallest are merged
+    assert coalesce_topics([3, 1, 1, 1], edges, 1) == [0, 0, 0, 0]
+
+
+def test_stays_acyclic():
+    # 2 depends on 0 most, but also indirectly via 1, so merging them
+    # would leave 1 and the merged topic depending on each other.
+    edges = [(2, 0), (2, 0), (2, 0), (2, 1), (1, 0)]
+    cluster_of = coalesce_topics([1, 1, 1], edges, 2)
+    assert cluster_of in ([0, 0, 1], [0, 1, 1])
+    for topic, dependency in edges:
+        assert cluster_of[topic] >= cluster_of[dependency]
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import pygit2
+from ostruct import OpenStruct
+
+from git_explode.detector import ExplodeDependencyDetector
+from git_explode.listener import ExplodeDependencyListener
+from git_explode.pathindex import PathIndex
+
+
+def detector_for(repo, base, revs, monkeypatch):
+    """Return an ExplodeDependencyDetector for the range base..revs[-1],
+    its listener, and a list which records the output of each blame
+    it runs.
+    """
+    # Blame runs in the current directory
+    monkeypatch.chdir(repo.workdir)
+    index = PathIndex.build(repo, base, revs)
+    detector = ExplodeDependencyDetector(
+        OpenStruct(recurse=False, exclude_commits=[base], debug=False,
+                   context_lines=1), repo, index=index)
+    listener = ExplodeDependencyListener({})
+    detector.add_listener(listener)
+
+    blames = []
+    run_blame = detector.run_blame
+
+    def record(hunk, parent, path):
+        blames.append(run_blame(hunk, parent, path))
+        return blames[-1]
+
+    monkeypatch.setattr(detector, 'run_blame', record)
+    return detector, listener, blames
+
+
+def test_skips_paths_new_to_range(tmpdir, monkeypatch, git, commit):
+    git(tmpdir, 'init', '-q')
+    commit(tmpdir, 'a\nb\nc\n', 'other', 'other')
+    base = commit(tmpdir, 'a\nb\nc\n', 'base')
+    one = commit(tmpdir, 'A\nb\nc\n', 'one')
+    # other was last touched before the range
+    two = commit(tmpdir, 'a\nb\nC\n', 'two', 'other')
+    three = commit(tmpdir, 'A\nB\nc\n', 'three')
+    repo = pygit2.Repository(str(tmpdir))
+    detector, listener, blames = detector_for(repo, base, [one, two, three],
+                                              monkeypatch)
+
+    for rev in (one, two):
+        detector.find_dependencies(rev)
+    assert blames == []
+    detector.find_dependencies(three)
+    assert len(blames) == 1
+    assert [sha1 for sha1, _ in listener.dependencies(three)] == [one]
+
+
+def test_blame_stops_at_base(tmpdir, monkeypatch, git, commit):
+    git(tmpdir, 'init', '-q')
+    commit(tmpdir, 'a\nb\nc\nd\ne\n', 'older')
+    old = commit(tmpdir, 'A\nb\nc\nd\ne\n', 'old')
+    base = commit(tmpdir, 'a\n', 'base', 'other')
+    one = commit(tmpdir, 'A\nb\nc\nd\nE\n', 'one')
+    two = commit(tmpdir, 'A\nB\nc\nd\nE\n', 'two')
+    repo = pygit2.Repository(str(tmpdir))
+    detector, listener, blames = detector_for(repo, base, [one, two],
+                                              monkeypatch)
+
+    detector.find_dependencies(two)
+    assert len(blames) == 1
+    # The lines from before the range are blamed on the base as a
+    # boundary, rather than on the commit which really changed them
+    assert old not in blames[0]
+    assert base in blames[0]
+    assert listener.dependencies(two) == []
+
+
+def test_reusable_without_recursing(tmpdir, monkeypatch, git, commit):
+    git(tmpdir, 'init', '-q')
+    base = commit(tmpdir, 'a\nb\nc\nd\ne\nf\n', 'base')
+    revs = [commit(tmpdir, 'A\nb\nc\nd\ne\nf\n', 'one'),
+            commit(tmpdir, 'A\nb\nc\nd\ne\nF\n', 'two'),
+            commit(tmpdir, 'A2\nb\nc\nd\ne\nF\n', 'three'),
+            commit(tmpdir, 'A2\nb\nc\nd\ne\nF2\n', 'four')]
+    repo = pygit2.Repository(str(tmpdir))
+    detector, listener, _ = detector_for(repo, base, revs, monkeypatch)
+
+    for rev in revs:
+        detector.find_dependencies(rev)
+        # Nothing is kept once each commit is done
+        assert detector.commits == {}
+        assert detector.dependencies == {}
+
+    # Each commit gets the same dependencies as with a new detector
+    for rev in revs:
+        fresh, fresh_listener, _ = detector_for(repo, base, revs,
+                                                monkeypatch)
+        fresh.find_dependencies(rev)
+        assert listener.dependencies(rev) == \
+            fresh_listener.dependencies(rev)
+    assert [sha1 for sha1, _ in listener.dependencies(revs[3])] == \
+        [revs[1]]
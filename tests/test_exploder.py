@@ -3,6 +3,13 @@
 
 # import pytest
 
+import json
+import logging
+
+import pygit2
+from six import StringIO
+
+from git_explode import builders
 from git_explode.exploder import GitExploder
 from git_deps.gitutils import GitUtils
 
@@ -11,3 +18,118 @@ def test_new():
     repo = GitUtils.get_repo()
     exploder = GitExploder(repo, "HEAD~5", "HEAD", False, 1)
     assert exploder is not None
+
+
+def test_stream(tmpdir, monkeypatch, git, history):
+    base, revs = history
+    repo = pygit2.Repository(str(tmpdir))
+
+    exploder = GitExploder(repo, base, revs[-1], False, 1, in_memory=True)
+    picked = []
+    cherry_pick = exploder.builder.cherry_pick
+
+    def record(sha):
+        picked.append(sha)
+        return cherry_pick(sha)
+
+    monkeypatch.setattr(exploder.builder, 'cherry_pick', record)
+    exploder.stream()
+
+    assert sorted(picked) == sorted(revs)
+    # five needs both chains merged
+    assert exploder.explode_plan.merges() != []
+    tips = sorted(exploder.tips)
+    git(tmpdir, 'checkout', '-q', '-b', 'all', tips[0])
+    for tip in tips[1:]:
+        git(tmpdir, 'merge', '-q', '--no-edit', tip)
+    assert git(tmpdir, 'rev-parse', 'HEAD^{tree}') == \
+        git(tmpdir, 'rev-parse', revs[-1] + '^{tree}')
+
+
+def test_plan_same_with_debug(tmpdir, caplog, history):
+    base, revs = history
+    repo = pygit2.Repository(str(tmpdir))
+
+    def plan():
+        exploder = GitExploder(repo, base, revs[-1], False, 1)
+        f = StringIO()
+        exploder.plan(exploder.get_dependencies()).dump(f)
+        return f.getvalue()
+
+    quiet = plan()
+    assert 'Planning' not in caplog.text
+    caplog.set_level(logging.DEBUG, logger='git-explode')
+    assert plan() == quiet
+    assert 'Planning' in caplog.text
+
+
+def test_incremental_reuses_merges(tmpdir, monkeypatch, history):
+    base, revs = history
+    repo = pygit2.Repository(str(tmpdir))
+
+    def explode(date):
+        # Merges made at another time would get new SHA1s
+        monkeypatch.setenv('GIT_COMMITTER_DATE', date)
+        monkeypatch.setattr(builders, '_committers', {})
+        exploder = GitExploder(repo, base, revs[-1], False, 1,
+                               in_memory=True, incremental=True)
+        exploder.run()
+        return exploder, dict(
+            (branch, repo.lookup_branch(branch).target.hex)
+            for branch in exploder.tips)
+
+    exploder, tips = explode('1500000000 +0000')
+    assert exploder.explode_plan.merges() != []
+
+    # Without --cache, the merges are still reused by the next run
+    exploder, again = explode('1600000000 +0000')
+    assert again == tips
+    assert exploder.merges.hits > 0
+
+
+def test_incremental_keeps_checked_out_stale_branch(tmpdir, git, history):
+    base, revs = history
+    repo = pygit2.Repository(str(tmpdir))
+    GitExploder(repo, base, revs[-1], False, 1,
+                in_memory=True, incremental=True).run()
+    manifest = str(tmpdir.join('.git', 'git-explode', 'manifest.json'))
+    with open(manifest) as f:
+        roots = json.load(f)['roots']
+    stale = [topic for topic, root in roots.items() if root == revs[-1]][0]
+
+    # Drop the last commit, whose topic is checked out
+    git(tmpdir, 'checkout', '-q', stale)
+    exploder = GitExploder(repo, base, revs[-2], False, 1,
+                           in_memory=True, incremental=True)
+    exploder.run()
+    assert repo.lookup_branch(stale) is not None
+    assert stale not in exploder.tips
+
+    # The manifest was saved, and still knows about the branch, so it
+    # gets deleted once it's no longer checked out
+    with open(manifest) as f:
+        assert stale in json.load(f)['branches']
+    git(tmpdir, 'checkout', '-q', '--detach')
+    GitExploder(repo, base, revs[-2], False, 1,
+                in_memory=True, incremental=True).run()
+    assert repo.lookup_branch(stale) is None
+
+
+def test_cache_reuses_merges(tmpdir, monkeypatch, history):
+    base, revs = history
+    repo = pygit2.Repository(str(tmpdir))
+    # Both runs explode the commits into the same new commits
+    monkeypatch.setenv('GIT_COMMITTER_DATE', '1500000000 +0000')
+    monkeypatch.setattr(builders, '_committers', {})
+    merges = []
+    for prefix in ('first-', 'second-'):
+        exploder = GitExploder(repo, base, revs[-1], False, 1,
+                               in_memory=True, cache=True, prefix=prefix)
+        exploder.run()
+        merges.append(exploder.merges)
+
+    # The second run merges the same exploded commits as the first,
+    # and finds them in the cache saved by it
+    assert merges[0].hits == 0
+    assert merges[1].hits == merges[0].misses > 0
+    assert merges[1].misses == 0
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import subprocess
+import threading
+import time
+
+import pytest
+
+from git_explode.gitutils import GitUtils
+
+
+@pytest.fixture
+def batch(tmpdir, monkeypatch, git):
+    """Start the long-lived git processes in a new repository, with
+    fresh counts of spawns and timings.
+    """
+    git(tmpdir, 'init', '-q')
+    monkeypatch.chdir(tmpdir)
+    monkeypatch.setattr(GitUtils, 'timings', {})
+    monkeypatch.setattr(GitUtils, 'spawns', 0)
+    GitUtils.start_batch()
+    yield GitUtils
+    GitUtils.stop_batch()
+
+
+def test_rev_parse(tmpdir, git, commit, batch):
+    one = commit(tmpdir, 'a\n', 'one')
+    two = commit(tmpdir, 'b\n', 'two')
+    git(tmpdir, 'branch', 'topic', one)
+    assert batch.rev_parse('topic') == one
+    # The same process sees refs moved by other processes
+    git(tmpdir, 'branch', '-f', 'topic', two)
+    assert batch.rev_parse('topic') == two
+    with pytest.raises(subprocess.CalledProcessError):
+        batch.rev_parse('missing')
+
+    assert batch.spawns == 1
+    assert batch.timings[batch.batch.name][0] == 3
+    assert batch.timing_report()[0] == "1 git processes spawned"
+
+
+def test_update_refs(tmpdir, git, commit, batch):
+    one = commit(tmpdir, 'a\n', 'one')
+    two = commit(tmpdir, 'b\n', 'two')
+    batch.update_refs([('refs/heads/topic1', one, None),
+                       ('refs/heads/topic2', two, None)])
+    batch.update_refs([('refs/heads/topic1', two, one)])
+    assert git(tmpdir, 'rev-parse', 'topic1', 'topic2').split() == \
+        [two, two]
+    assert batch.spawns == 1
+    assert batch.timings[batch.update_ref_batch.name][0] == 2
+
+
+def test_failed_transaction(tmpdir, git, commit, batch):
+    one = commit(tmpdir, 'a\n', 'one')
+    two = commit(tmpdir, 'b\n', 'two')
+    git(tmpdir, 'branch', 'topic', one)
+    # topic isn't at two, so the transaction fails and git exits
+    with pytest.raises(subprocess.CalledProcessError):
+        batch.update_refs([('refs/heads/topic', one, two)])
+    assert batch.update_ref_batch.proc is None
+    assert git(tmpdir, 'rev-parse', 'topic') == one
+
+    # The next update starts a new process
+    batch.update_refs([('refs/heads/topic', two, one)])
+    assert git(tmpdir, 'rev-parse', 'topic') == two
+    assert batch.spawns == 2
+
+
+def test_dead_process(tmpdir, commit, batch):
+    one = commit(tmpdir, 'a\n', 'one')
+    assert batch.rev_parse('HEAD') == one
+    batch.batch.proc.kill()
+    batch.batch.proc.wait()
+    with pytest.raises(subprocess.CalledProcessError):
+        batch.rev_parse('HEAD')
+    assert batch.rev_parse('HEAD') == one
+    assert batch.spawns == 2
+
+
+def test_timings_from_threads(monkeypatch):
+    monkeypatch.setattr(GitUtils, 'timings', {})
+
+    def record():
+        for i in range(1000):
+            GitUtils._record_timing('cmd', time.time())
+
+    threads = [threading.Thread(target=record) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert GitUtils.timings_snapshot()[1]['cmd'][0] == 4000
@@ -0,0 +1,25 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from git_explode.graph import DependencyGraph
+from git_explode.listener import ExplodeDependencyListener
+
+
+def test_traversal_order():
+    # A diamond r <- x, y <- z, and a chain s <- c1 <- c2 <- c3 which
+    # also depends on the top of the diamond
+    listener = ExplodeDependencyListener({})
+    for sha1 in ('r', 's', 'x', 'y', 'z', 'c1', 'c2', 'c3'):
+        listener.add_commit(sha1)
+    for dependent, dependency in (('x', 'r'), ('y', 'r'), ('z', 'x'),
+                                  ('z', 'y'), ('c1', 's'), ('c2', 'c1'),
+                                  ('c3', 'c2'), ('c3', 'z')):
+        listener.add_dependency(dependent, dependency, 'file:1')
+
+    # The order the old list-based queue produced: new leaves go to
+    # the front, so y comes before x, and the diamond is finished
+    # before the chain is started.
+    order = ['r', 'y', 'x', 'z', 's', 'c1', 'c2', 'c3']
+    assert list(DependencyGraph(listener).traverse()) == order
+    assert list(DependencyGraph(listener).traverse_ids()) == \
+        [listener.ids[sha1] for sha1 in order]
@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from git_explode.journal import ExplodeJournal
+
+A, B = ('a' * 40, 'b' * 40)
+X, Y = ('1' * 40, '2' * 40)
+
+
+def test_resume(tmpdir, plan):
+    path = str(tmpdir.join('journal'))
+    journal = ExplodeJournal(path)
+    journal.start(plan, 'in-memory', False, 'master')
+    journal.record(plan.steps[0], 'topic1', plan.base)
+    journal.record(plan.steps[1], 'topic1', X)
+    journal.record(plan.steps[2], 'topic2', plan.base)
+    journal.record(plan.steps[3], 'topic2', Y)
+    # Simulate getting killed half way through writing a line
+    journal.file.write('{"op": "bra')
+    journal.close()
+
+    resumed = ExplodeJournal(path)
+    resumed.load()
+    assert resumed.plan.steps == plan.steps
+    assert resumed.builder == 'in-memory'
+    assert resumed.exploded == {A: X, B: Y}
+    assert resumed.picks == {(A, plan.base): X, (B, plan.base): Y}
+    assert resumed.heads == {'topic1': X, 'topic2': Y}
+    assert resumed.current == 'topic2'
+    done = [resumed.done(step, step.get('branch', 'topic3'))
+            for step in plan.steps]
+    assert done == [True, True, True, True, False, False, False]
+
+    resumed.record(plan.steps[4], 'topic3', X)
+    resumed.close()
+    again = ExplodeJournal(path)
+    again.load()
+    assert again.heads == {'topic1': X, 'topic2': Y, 'topic3': X}
+
+    again.remove()
+    assert not tmpdir.join('journal').exists()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from ostruct import OpenStruct
+
+from git_explode.listener import ExplodeDependencyListener
+
+
+def test_ids():
+    listener = ExplodeDependencyListener({})
+    for sha1 in ('c', 'a', 'b'):
+        listener.add_commit(sha1)
+    listener.new_commit(OpenStruct(hex='d'))
+    assert listener.add_commit('a') == 1
+    assert listener.shas == ['c', 'a', 'b', 'd']
+    for sha1 in listener.shas:
+        assert listener.shas[listener.ids[sha1]] == sha1
+
+
+def test_dependencies():
+    listener = ExplodeDependencyListener({})
+    for sha1 in ('c', 'b', 'a'):
+        listener.add_commit(sha1)
+    listener.add_dependency('c', 'b', 'file:2')
+    listener.add_dependency('c', 'a', 'other:1')
+    listener.new_dependency(OpenStruct(hex='b'), OpenStruct(hex='a'),
+                            'file', 1)
+
+    # The same as the dicts of dicts the listener used to keep
+    assert dict((sha1, dict(listener.dependencies(sha1)))
+                for sha1 in listener.shas) == {
+        'c': {'b': 'file:2', 'a': 'other:1'},
+        'b': {'a': 'file:1'},
+        'a': {},
+    }
+    assert listener.dependencies('c') == [('b', 'file:2'), ('a', 'other:1')]
+    assert listener.dependencies('unknown') == []
+    assert list(listener.dependency_ids(listener.ids['c'])) == \
+        [listener.ids['b'], listener.ids['a']]
+
+
+def test_replay():
+    listener = ExplodeDependencyListener({})
+    # head depends on two chains of two commits each, and other
+    # depends on one of the chains too
+    listener.replay(['head', 'other'], {
+        'head': [('c2', 'file:4'), ('b2', 'file:3')],
+        'c2': [('c1', 'file:2')],
+        'b2': [('b1', 'file:1')],
+        'other': [('b1', 'other:1')],
+    })
+    # Breadth first, in the same order as git-deps recursing from each
+    # rev in turn
+    assert listener.shas == ['head', 'c2', 'b2', 'c1', 'b1', 'other']
+    assert listener.dependencies('other') == [('b1', 'other:1')]
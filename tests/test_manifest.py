@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import pygit2
+
+from git_explode.manifest import ExplodeManifest
+
+MISSING = 'f' * 40
+
+
+def test_round_trip(tmpdir, git, commit):
+    repo_path = tmpdir.mkdir('repo')
+    git(repo_path, 'init', '-q')
+    base = commit(repo_path, 'a\nb\n', 'base')
+    one = commit(repo_path, 'A\nb\n', 'one')
+    two = commit(repo_path, 'A\nB\n', 'two')
+    repo = pygit2.Repository(str(repo_path))
+    path = str(tmpdir.join('git-explode', 'manifest.json'))
+
+    manifest = ExplodeManifest(path, repo)
+    assert manifest.lookup(one, base) is None
+    manifest.record(one, base, one)
+    manifest.record(two, one, two)
+    # Exploded commits which are no longer on top of onto, or no
+    # longer exist, can't be reused
+    manifest.record(two, base, two)
+    manifest.record(base, one, MISSING)
+    manifest.record_branches({'topic1': two, 'topic2': two},
+                             {'topic1': two, 'topic2': two},
+                             {'topic1': one, 'topic2': two})
+    manifest.save()
+
+    again = ExplodeManifest(path, repo)
+    assert again.lookup(one, base) == one
+    assert again.lookup(two, one) == two
+    assert again.lookup(two, base) is None
+    assert again.lookup(base, one) is None
+    assert again.topic_started_by(one) == 'topic1'
+    assert again.topic_started_by(base) is None
+    again.record_branches({'topic1': two}, {'topic1': two}, {'topic1': one})
+    assert again.stale_branches() == {'topic2': two}
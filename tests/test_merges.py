@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import threading
+
+import pygit2
+
+from git_explode.merges import MergeCache
+
+MISSING = 'f' * 40
+
+
+def test_lookup(tmpdir, git, commit):
+    repo_path = tmpdir.mkdir('repo')
+    git(repo_path, 'init', '-q')
+    a = commit(repo_path, 'a\n', 'a')
+    b = commit(repo_path, 'b\n', 'b')
+    merged = commit(repo_path, 'ab\n', 'merged')
+    repo = pygit2.Repository(str(repo_path))
+    path = str(tmpdir.join('merges.json'))
+
+    cache = MergeCache(repo, path)
+    assert cache.lookup([a, b]) is None
+    cache.record([a, b], merged)
+    cache.record([a, merged], MISSING)
+    assert cache.lookup([b, a]) == merged
+    cache.save()
+
+    cache = MergeCache(repo, path)
+    assert cache.lookup([a, b]) == merged
+    # Merges which no longer exist are ignored
+    assert cache.lookup([a, merged]) is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_concurrent_save(tmpdir, git, commit):
+    repo_path = tmpdir.mkdir('repo')
+    git(repo_path, 'init', '-q')
+    a = commit(repo_path, 'a\n', 'a')
+    b = commit(repo_path, 'b\n', 'b')
+    repo = pygit2.Repository(str(repo_path))
+    path = str(tmpdir.join('cache', 'merges.json'))
+    # Like jobs in git-explode serve, each with its own cache
+    caches = [MergeCache(repo, path) for _ in range(4)]
+    for cache in caches:
+        cache.record([a, b], b)
+    errors = []
+
+    def save(cache):
+        try:
+            for _ in range(50):
+                cache.save()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=save, args=(cache,))
+               for cache in caches]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert MergeCache(repo, path).lookup([a, b]) == b
+    # No temporary files are left behind
+    assert [p.basename for p in tmpdir.join('cache').listdir()] == \
+        ['merges.json']
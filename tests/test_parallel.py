@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import pygit2
+from git_deps.detector import DependencyDetector
+from ostruct import OpenStruct
+
+from git_explode.exploder import GitExploder
+from git_explode.listener import ExplodeDependencyListener
+
+
+def edges(listener):
+    return [(listener.ids[sha1], listener.dependencies(sha1))
+            for sha1 in listener.shas]
+
+
+def test_parallel_detection_matches_serial(tmpdir, git, history):
+    base, revs = history
+    head = revs[-1]
+    # five depends on two chains, which replay() has to visit breadth
+    # first, in the same order as git-deps
+    repo = pygit2.Repository(str(tmpdir))
+
+    serial = GitExploder(repo, base, head, False, 1).get_dependencies()
+    parallel = GitExploder(repo, base, head, False, 1,
+                           jobs=2).get_dependencies()
+    assert parallel.shas == serial.shas
+    assert edges(parallel) == edges(serial)
+
+    # Both match what git-deps finds recursing from each commit in turn
+    recursive = ExplodeDependencyListener({})
+    detector = DependencyDetector(
+        OpenStruct(recurse=True, exclude_commits=[base], debug=False,
+                   context_lines=1), repo)
+    detector.add_listener(recursive)
+    for rev in git(tmpdir, 'rev-list', '%s..%s' % (base, head)).split():
+        detector.find_dependencies(rev)
+    assert recursive.shas == serial.shas
+    assert edges(recursive) == edges(serial)
+    assert any(dependencies for _, dependencies in edges(serial))
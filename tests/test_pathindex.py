@@ -0,0 +1,28 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from git_explode.pathindex import PathIndex
+
+A, B, C = ('a' * 40, 'b' * 40, 'c' * 40)
+
+
+def test_touched_before():
+    index = PathIndex('0' * 40, [A, B],
+                      {A: ('x',), B: ('x', 'y')}, {'x': [0, 1], 'y': [1]})
+    assert not index.may_have_dependencies(A)
+    assert index.may_have_dependencies(B)
+    assert index.touched_before('x', B)
+    assert not index.touched_before('y', B)
+    # Commits outside the range are treated conservatively
+    assert C not in index
+    assert index.may_have_dependencies(C)
+
+
+def test_last_touched():
+    index = PathIndex('0' * 40, [A, B, C],
+                      {A: ('x',), B: ('y',), C: ('x',)},
+                      {'x': [0, 2], 'y': [1]})
+    assert index.last_touched('x', B) == A
+    assert index.last_touched('x', C) == C
+    assert index.last_touched('y', A) == '0' * 40
+    assert index.last_touched('x', '0' * 40) == '0' * 40
@@ -0,0 +1,23 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from six import StringIO
+
+from git_explode.plan import ExplodePlan
+
+A, B, C = ('a' * 40, 'b' * 40, 'c' * 40)
+
+
+def test_summary(plan):
+    assert plan.topics() == {'topic1': [A], 'topic2': [B], 'topic3': [C]}
+    assert plan.merges() == [{'branch': 'topic3', 'commits': [B]}]
+
+
+def test_round_trip(plan):
+    f = StringIO()
+    plan.dump(f)
+    f.seek(0)
+    loaded = ExplodePlan.load(f)
+    assert loaded.base == plan.base
+    assert loaded.head == plan.head
+    assert loaded.steps == plan.steps
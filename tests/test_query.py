@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from git_explode import cli
+from git_explode.cache import DependencyCache
+
+A, B, C, D = ('a' * 40, 'b' * 40, 'c' * 40, 'd' * 40)
+
+
+def test_closure_and_chain(tmpdir):
+    cache = DependencyCache(str(tmpdir.join('deps.sqlite')), 1, 'base')
+    cache.store(D, [(B, 'x:1'), (C, 'y:2')])
+    cache.store(C, [(A, 'y:1')])
+    cache.store(A, [])
+    assert cache.closure(D) == [(D, True), (B, False), (C, True), (A, True)]
+    assert cache.chain(D, A) == [(C, 'y:2'), (A, 'y:1')]
+    assert cache.chain(C, B) is None
+    assert cache.boundaries(D) == ['base']
+
+
+def test_commands(tmpdir, monkeypatch, capsys, git, commit):
+    git(tmpdir, 'init', '-q')
+    base = commit(tmpdir, 'a\nb\nc\n', 'base')
+    one = commit(tmpdir, 'A\nb\nc\n', 'one')
+    commit(tmpdir, 'A\nb\nC\n', 'two')
+    three = commit(tmpdir, 'A\nB\nC\n', 'three')
+    monkeypatch.chdir(tmpdir)
+
+    # Nothing has been detected yet
+    with pytest.raises(SystemExit) as e:
+        cli.main(['deps', three])
+    assert e.value.code == 1
+    assert 'not known' in capsys.readouterr().err
+
+    cli.main(['deps', '--base', base, three])
+    assert capsys.readouterr().out.split('\n')[:1] == ['%s one' % one]
+    cli.main(['explain', three, one])
+    assert capsys.readouterr().out.split('\n')[1] == \
+        '  -> %s one (file:1)' % one[:8]
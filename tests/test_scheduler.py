@@ -0,0 +1,11 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from git_explode.scheduler import split_segments
+
+
+def test_split_segments(plan):
+    segments = split_segments(plan.steps)
+    assert [len(steps) for steps, waits_for in segments] == [2, 2, 3]
+    assert [waits_for for steps, waits_for in segments] == \
+        [set(), set(), set([0, 1])]
@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import logging
+import sys
+import threading
+
+from git_explode import cli
+from git_explode.server import ExplodeServer, JobOutput, submit
+
+
+def test_plan(tmpdir, monkeypatch, capsys, git, commit):
+    repo_path = tmpdir.mkdir('repo')
+    git(repo_path, 'init', '-q')
+    base = commit(repo_path, 'a\nb\nc\n', 'base')
+    commit(repo_path, 'A\nb\nc\n', 'one')
+    head = commit(repo_path, 'A\nb\nC\n', 'two')
+    monkeypatch.chdir(repo_path)
+    monkeypatch.setattr(sys, 'stdout', JobOutput(sys.stdout))
+    monkeypatch.setattr(sys, 'stderr', JobOutput(sys.stderr))
+    path = str(tmpdir.join('sock'))
+    server = ExplodeServer(path, str(repo_path.join('.git')),
+                           logging.getLogger('test'), max_jobs=2)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    def run(*argv):
+        argv = list(argv)
+        return submit(path, argv, cli.parse_args(argv))
+
+    try:
+        assert run('--plan', base, head) == 0
+        plan = json.loads(capsys.readouterr().out)
+        # Worktree builds would fight over the server's checkout
+        assert run(base, head) == 1
+        assert 'only build topic branches' in capsys.readouterr().err
+        # The second job reuses the dependencies the first detected
+        assert run('--plan', base, head) == 0
+        assert json.loads(capsys.readouterr().out) == plan
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert plan['head'] == head
+    assert len(server.dependency_cache.entries) == 2
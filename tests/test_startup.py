@@ -0,0 +1,23 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import subprocess
+import sys
+
+import pytest
+
+
+@pytest.mark.skipif(sys.version_info < (3, 7),
+                    reason="needs python -X importtime")
+def test_cli_imports_stay_light():
+    # --version, --help and usage errors shouldn't have to wait for
+    # any of these to be imported.
+    output = subprocess.check_output(
+        [sys.executable, '-X', 'importtime', '-c', 'import git_explode.cli'],
+        stderr=subprocess.STDOUT).decode('utf-8')
+    imported = set(line.split('|')[-1].strip()
+                   for line in output.splitlines())
+    assert 'git_explode.cli' in imported
+    for module in ('pkg_resources', 'pygit2', 'git_deps',
+                   'git_explode.exploder', 'importlib.metadata'):
+        assert module not in imported
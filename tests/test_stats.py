@@ -0,0 +1,19 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from git_explode.stats import ExplodeStats
+
+A = 'a' * 40
+
+
+def test_record():
+    stats = ExplodeStats()
+    with stats.phase('apply'):
+        stats.record('pick', 0.5, A)
+        stats.record('pick', 0.25, A)
+        stats.record('merge', 1.0)
+    d = stats.to_dict()
+    assert list(d['phases']) == ['apply']
+    assert d['operations']['pick'] == {'calls': 2, 'seconds': 0.75}
+    assert d['commits'] == {A: {'pick': 0.75}}
+    assert any(line.startswith('  aaaaaaaa') for line in stats.summary())
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import pickle
+
+import pygit2
+
+from git_explode.listener import ExplodeDependencyListener
+from git_explode.pathindex import PathIndex
+from git_explode.store import (GraphStore, StoredDependencyListener,
+                               StoredPathIndex)
+
+A, B, C, D = ('a' * 40, 'b' * 40, 'c' * 40, 'd' * 40)
+
+
+def test_path_index(tmpdir, git, commit):
+    repo_path = tmpdir.mkdir('repo')
+    git(repo_path, 'init', '-q')
+    base = commit(repo_path, 'a\nb\n', 'base')
+    revs = [commit(repo_path, 'A\nb\n', 'one'),
+            commit(repo_path, 'A\nB\n', 'two')]
+    repo = pygit2.Repository(str(repo_path))
+    store = GraphStore(str(tmpdir.join('graph.sqlite')))
+    stored = StoredPathIndex.build(repo, base, revs, store)
+    index = PathIndex.build(repo, base, revs)
+
+    for sha1 in revs + [base]:
+        assert (sha1 in stored) == (sha1 in index)
+        assert stored.may_have_dependencies(sha1) == \
+            index.may_have_dependencies(sha1)
+        assert stored.touched_before('file', sha1) == \
+            index.touched_before('file', sha1)
+        assert stored.last_touched('file', sha1) == \
+            index.last_touched('file', sha1)
+
+    # Worker processes reopen the same database
+    assert pickle.loads(pickle.dumps(stored)).last_touched('file', revs[1]) \
+        == revs[1]
+    store.remove()
+    assert not tmpdir.join('graph.sqlite').exists()
+
+
+def test_listener(tmpdir):
+    dependencies = {
+        D: [(B, 'x:1'), (C, 'y:2')],
+        C: [(A, 'y:1')],
+        B: [(A, 'x:3')],
+    }
+    listener = ExplodeDependencyListener({})
+    listener.replay([D, C, B, A], dependencies)
+    store = GraphStore(str(tmpdir.join('graph.sqlite')))
+    stored = StoredDependencyListener(store)
+    store.detected.update(dependencies)
+    stored.replay([D, C, B, A], store.detected)
+    assert list(stored.shas) == listener.shas
+    for sha1 in listener.shas:
+        commit_id = listener.ids[sha1]
+        assert stored.ids[sha1] == commit_id
+        assert stored.dependencies(sha1) == listener.dependencies(sha1)
+        assert stored.dependent_ids(commit_id) == \
+            list(listener.dependent_ids(commit_id))
+    assert list(stored.graph().traverse()) == \
+        list(listener.graph().traverse())
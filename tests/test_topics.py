@@ -0,0 +1,23 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+
+from git_explode.topics import TopicManager
+
+
+def test_instances_are_independent():
+    logger = logging.getLogger('test')
+    first = TopicManager('topic%d', logger)
+    first.register(1, 2)
+    second = TopicManager('topic%d', logger)
+    assert second.next() == 'topic1'
+    assert second.lookup(1, 2) is None
+    assert first.lookup(2, 1) == 'topic1'
+
+
+def test_next_skips_many_reserved_names():
+    manager = TopicManager('topic%d', logging.getLogger('test'))
+    manager.reserve('topic%d' % i for i in range(1, 5001))
+    assert manager.next() == 'topic5001'
+    assert manager.next() == 'topic5002'